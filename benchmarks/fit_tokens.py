@@ -0,0 +1,58 @@
+
+'''
+Time tokenizing (without parsing records) the FIT files in data/test/source.
+
+Cost should be linear in file size, so the per-kB time should be roughly constant and the fitted
+exponent (log time against log size) close to 1.
+
+Run from the root of the repository:
+
+  python benchmarks/fit_tokens.py
+'''
+
+from glob import glob
+from logging import basicConfig, ERROR
+from os.path import getsize, basename
+from sys import argv
+from time import perf_counter
+
+import numpy as np
+
+from ch2.fit.format.read import parse_data
+from ch2.fit.profile.profile import read_fit, read_profile
+
+
+def time_tokens(path, types, messages, repeat=3):
+    data = read_fit(path)
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        _state, tokens = parse_data(data, types, messages, no_validate=True)
+        for _ in tokens: pass
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(pattern='data/test/source/**/*.[fF][iI][tT]'):
+    basicConfig(level=ERROR)
+    types, messages = read_profile()
+    sizes, times = [], []
+    for path in sorted(glob(pattern, recursive=True), key=getsize):
+        try:
+            elapsed = time_tokens(path, types, messages)
+        except Exception as e:
+            print('%-50s skipped (%s)' % (basename(path), e))
+            continue
+        size = getsize(path)
+        sizes.append(size)
+        times.append(elapsed)
+        print('%-50s %9d bytes %8.3fs %8.1fus/kB' % (basename(path), size, elapsed, 1e6 * elapsed * 1024 / size))
+    large = [i for i, size in enumerate(sizes) if size > 10000]  # small files are dominated by fixed costs
+    if len(large) > 1:
+        exponent = np.polyfit(np.log([sizes[i] for i in large]), np.log([times[i] for i in large]), 1)[0]
+        print('Fitted exponent for files over 10kB: %.2f' % exponent)
+
+
+if __name__ == '__main__':
+    main(*argv[1:])
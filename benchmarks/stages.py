@@ -0,0 +1,146 @@
+
+'''
+Time the main stages of processing, from FIT files in data/test/source to the queries used by the
+notebooks, and write the results as JSON so that runs on different commits can be compared.
+
+The stages are:
+  decode                     parse all FIT files (as the readers do, but without the database)
+  ingest/activity            ActivityReader on the activity files in data/test/source/personal
+  ingest/monitor             MonitorReader on the monitor files in data/test/source/personal
+  calculate/CLASS            each statistics pipeline (in order, one at a time, in this process)
+  query/...                  statistics(), activity_statistics() and std_activity_statistics()
+
+Everything runs in a single process against a temporary database.  Queries are repeated and the best
+time kept; other stages run once.
+
+Run from the root of the repository:
+
+  python benchmarks/stages.py [OUTPUT.json [PREVIOUS.json]]
+
+With PREVIOUS.json the change in each stage is also printed (stages more than 20% and 0.1s slower are
+marked).
+'''
+
+import datetime as dt
+from glob import glob
+from json import dump, load
+from os.path import getsize
+from platform import python_version, node
+from subprocess import run, PIPE
+from sys import argv, stdout
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from warnings import filterwarnings
+
+from ch2.commands.args import bootstrap_file, m, V, mm, DEV, CH2_VERSION
+from ch2.commands.constants import constants
+from ch2.config import default
+from ch2.data import statistics, activity_statistics, std_activity_statistics
+from ch2.squeal import ActivityJournal, Pipeline
+from ch2.squeal.tables.pipeline import PipelineType
+from ch2.squeal.types import short_cls
+from ch2.stoats.names import DISTANCE, ELEVATION, HEART_RATE, SPEED, FITNESS_D_ANY, FATIGUE_D_ANY
+from ch2.stoats.pipeline import run_pipeline
+from ch2.stoats.read import read_fit_file
+
+ALL = 'data/test/source/**/*.[fF][iI][tT]'
+ACTIVITIES = 'data/test/source/personal/20*.fit'
+MONITOR = ('data/test/source/personal/andrew@acooke.org_*.fit', 'data/test/source/personal/25822184777.fit')
+SLOWER = 1.2
+NOISE = 0.1  # seconds (smaller changes are not marked)
+
+
+def timed(results, name, f, repeat=1, n=None):
+    best, value = None, None
+    for _ in range(repeat):
+        start = perf_counter()
+        value = f()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    results[name] = {'seconds': best, 'n': n}
+    print('%-40s %9.3fs' % (name, best))
+    return value
+
+
+def decode(paths):
+    n = 0
+    for path in paths:
+        try:
+            n += len(read_fit_file(path))
+        except Exception:
+            pass  # some test files are deliberately broken
+    return n
+
+
+def commit():
+    try:
+        return run(['git', 'rev-parse', 'HEAD'], stdout=PIPE, stderr=PIPE, check=True).stdout.decode().strip()
+    except Exception:
+        return None
+
+
+def benchmark(repeat=3):
+    results = {}
+    paths = sorted(glob(ALL, recursive=True))
+    activities = sorted(glob(ACTIVITIES))
+    monitor = sorted(path for pattern in MONITOR for path in glob(pattern))
+    with NamedTemporaryFile() as f:
+        bootstrap_file(f, m(V), '0')  # also configures logging (to file only)
+        bootstrap_file(f, m(V), '0', mm(DEV), configurator=default)
+        args, db = bootstrap_file(f, m(V), '0', 'constants', 'set', 'FTHR.%', '154')
+        constants(args, db)
+        timed(results, 'decode', lambda: decode(paths), n=sum(getsize(path) for path in paths))
+        timed(results, 'ingest/activity', lambda: run_pipeline(db, PipelineType.ACTIVITY, paths=activities,
+                                                               n_cpu=1, n_parallel=1), n=len(activities))
+        timed(results, 'ingest/monitor', lambda: run_pipeline(db, PipelineType.MONITOR, paths=monitor,
+                                                              n_cpu=1, n_parallel=1), n=len(monitor))
+        with db.session_context() as s:
+            pipelines = [(pipeline.id, short_cls(pipeline.cls))
+                         for pipeline in Pipeline.all(s, PipelineType.STATISTIC)]
+        for id, cls in pipelines:
+            name = f'calculate/{cls}'
+            while name in results:
+                name += '+'
+            timed(results, name, lambda: run_pipeline(db, PipelineType.STATISTIC, id=id, n_cpu=1, n_parallel=1))
+        with db.session_context() as s:
+            journals = s.query(ActivityJournal).order_by(ActivityJournal.start).all()
+            timed(results, 'query/statistics', repeat=repeat,
+                  f=lambda: statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, check=False))
+            timed(results, 'query/statistics/resample', repeat=repeat,
+                  f=lambda: statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, check=False, resample='1D'))
+            timed(results, 'query/statistics/activity', repeat=repeat,
+                  f=lambda: statistics(s, DISTANCE, HEART_RATE, SPEED, ELEVATION))
+            timed(results, 'query/activity_statistics', repeat=repeat, n=len(journals),
+                  f=lambda: [activity_statistics(s, DISTANCE, HEART_RATE, SPEED, ELEVATION, activity_journal=journal)
+                             for journal in journals])
+            timed(results, 'query/std_activity_statistics', repeat=repeat, n=len(journals),
+                  f=lambda: [std_activity_statistics(s, activity_journal=journal) for journal in journals])
+    return results
+
+
+def compare(results, previous, output=stdout):
+    print('\n%-40s %9s %9s %7s' % ('', 'previous', 'current', 'ratio'), file=output)
+    for name, result in results.items():
+        if name in previous:
+            before, after = previous[name]['seconds'], result['seconds']
+            ratio = after / before if before else float('inf')
+            slower = ratio > SLOWER and after - before > NOISE
+            print('%-40s %9.3f %9.3f %7.2f %s' % (name, before, after, ratio, '*' if slower else ''), file=output)
+        else:
+            print('%-40s %9s %9.3f' % (name, '-', result['seconds']), file=output)
+
+
+def main(output=None, previous=None):
+    filterwarnings('ignore', category=FutureWarning)
+    report = {'commit': commit(), 'version': CH2_VERSION, 'python': python_version(), 'host': node(),
+              'time': dt.datetime.now(tz=dt.timezone.utc).isoformat(), 'results': benchmark()}
+    if output:
+        with open(output, 'w') as out:
+            dump(report, out, indent=2)
+    if previous:
+        with open(previous) as input:
+            compare(report['results'], load(input)['results'])
+
+
+if __name__ == '__main__':
+    main(*argv[1:])
@@ -0,0 +1,81 @@
+
+'''
+Time statistic_quartiles() (used by ch2 dump and the summary plots) over a database containing several
+years of monthly summaries.
+
+The database is synthetic: a value per day for each statistic, ranked within each month (as the
+SummaryCalculator does), with the five quartile measures marked.
+
+Run from the root of the repository:
+
+  python benchmarks/statistic_quartiles.py [YEARS] [STATISTICS]
+'''
+
+import datetime as dt
+from random import random, seed
+from sys import argv
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+from ch2.commands.args import bootstrap_file, m, V
+from ch2.data import statistic_quartiles
+from ch2.squeal import StatisticJournalFloat, StatisticMeasure, Interval, Source
+from ch2.squeal.tables.source import SourceType
+from ch2.stoats.calculate.summary import fuzz
+
+
+def add_values(s, source, start, finish, names):
+    days = (finish - start).days
+    return [[StatisticJournalFloat.add(s, name, 'km', None, 'benchmark', None, source, random() * 100,
+                                       dt.datetime.combine(start + dt.timedelta(days=day), dt.time(),
+                                                           tzinfo=dt.timezone.utc))
+             for day in range(days)]
+            for name in names]
+
+
+def add_measures(s, start, finish, values):
+    # intervals are added after the values (adding values deletes any intervals that they overlap)
+    interval = Interval(schedule='m', owner='benchmark', start=start, finish=finish)
+    s.add(interval)
+    for journals in values:
+        n = len(journals)
+        ranked = sorted(journals, key=lambda journal: journal.value, reverse=True)
+        measures = [StatisticMeasure(statistic_journal=journal, source=interval, rank=rank,
+                                     percentile=(n - rank) / (n - 1) * 100)
+                    for rank, journal in enumerate(ranked, start=1)]
+        for q in range(5):
+            measures[fuzz(n, q)].quartile = q
+        s.add_all(measures)
+
+
+def time_quartiles(s, names, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        quartiles = statistic_quartiles(s, *names)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, quartiles.shape
+
+
+def main(years=5, statistics=5):
+    seed(42)
+    names = [f'Statistic {i}' for i in range(int(statistics))]
+    with NamedTemporaryFile() as f:
+        args, db = bootstrap_file(f, m(V), '0')
+        with db.session_context() as s:
+            source = Source(type=SourceType.SOURCE)
+            s.add(source)
+            months = [(dt.date(year, month, 1), dt.date(year + month // 12, month % 12 + 1, 1))
+                      for year in range(2000, 2000 + int(years)) for month in range(1, 13)]
+            values = [add_values(s, source, start, finish, names) for start, finish in months]
+            s.commit()
+            for (start, finish), month_values in zip(months, values):
+                add_measures(s, start, finish, month_values)
+            s.commit()
+            elapsed, shape = time_quartiles(s, names)
+            print('%d years, %d statistics: %d x %d in %.3fs' % (int(years), len(names), *shape, elapsed))
+
+
+if __name__ == '__main__':
+    main(*argv[1:])
@@ -0,0 +1,55 @@
+
+'''
+Time std_activity_statistics() (the data used by the activity notebooks) for the longer FIT files in
+data/test/source/personal.
+
+The files are loaded into a temporary database first (which takes a while); only the final call is
+timed.
+
+Run from the root of the repository:
+
+  python benchmarks/std_activity_statistics.py
+'''
+
+from glob import glob
+from os.path import getsize
+from sys import argv
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+from ch2.commands.args import bootstrap_file, m, V, mm, DEV
+from ch2.commands.constants import constants
+from ch2.config import default
+from ch2.data import std_activity_statistics
+from ch2.squeal import ActivityJournal
+from ch2.squeal.tables.pipeline import PipelineType
+from ch2.stoats.pipeline import run_pipeline
+
+
+def time_stats(s, activity_journal, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        stats = std_activity_statistics(s, activity_journal=activity_journal)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(stats)
+
+
+def main(pattern='data/test/source/personal/*.fit', min_size=40000):
+    paths = [path for path in sorted(glob(pattern)) if getsize(path) > int(min_size)]
+    with NamedTemporaryFile() as f:
+        bootstrap_file(f, m(V), '0')
+        bootstrap_file(f, m(V), '0', mm(DEV), configurator=default)
+        args, db = bootstrap_file(f, m(V), '0', 'constants', 'set', 'FTHR.%', '154')
+        constants(args, db)
+        run_pipeline(db, PipelineType.ACTIVITY, paths=paths, n_cpu=1)
+        run_pipeline(db, PipelineType.STATISTIC, n_cpu=1)
+        with db.session_context() as s:
+            for activity_journal in s.query(ActivityJournal).order_by(ActivityJournal.start).all():
+                elapsed, n = time_stats(s, activity_journal)
+                print('%-30s %6d rows %8.3fs' % (activity_journal.name, n, elapsed))
+
+
+if __name__ == '__main__':
+    main(*argv[1:])
@@ -12,7 +12,7 @@ from ..lib.date import to_date, to_time
 log = getLogger(__name__)
 
 # this can be modified during development.  it will be reset from setup.py on release.
-CH2_VERSION = '0.27.5'
+CH2_VERSION = '0.28.0'
 # new database on minor releases.  not sure this will always be a good idea.  we will see.
 DB_VERSION = '-'.join(CH2_VERSION.split('.')[:2])
 
@@ -129,6 +129,7 @@ PATH = 'path'
 P, PATTERN = 'p', 'pattern'
 PLAN = 'plan'
 PRINT = 'print'
+PROFILE = 'profile'
 PROFILE_VERSION = 'profile-version'
 PROTOCOL_VERSION = 'protocol-version'
 PWD = 'pwd'
@@ -566,6 +567,8 @@ def make_parser():
                             help='optional finish date (if start also given)')
     statistics.add_argument(m(K.upper()), mm(KARG), action='append', metavar='NAME=VALUE', dest=KARG,
                             help='keyword argument to be passed to the pipelines (can be repeated)')
+    statistics.add_argument(mm(PROFILE), action='store_true',
+                            help='time pipelines and SQL (in a single process) and print a report')
     statistics.add_argument(mm(WORKER), action='store', metavar='ID', type=int,
                             help='internal use only (identifies sub-process workers)')
 
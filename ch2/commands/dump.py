@@ -6,7 +6,7 @@ import pandas as pd
 from .args import SUB_COMMAND, START, FINISH, NAMES, \
     OWNER, CONSTRAINT, SCHEDULE, SOURCE_ID, STATISTIC_QUARTILES, PRINT, FORMAT, \
     CSV, DESCRIBE, MAX_COLUMNS, MAX_ROWS, WIDTH, MAX_COLWIDTH, TABLE, NAME, STATISTICS
-from ..data import df, statistics, statistic_quartiles
+from ..data import df, statistics_chunks, statistic_quartiles
 from ..squeal import *
 from ..squeal.support import Base
 
@@ -15,6 +15,8 @@ StatisticName
 
 log = getLogger(__name__)
 
+CHUNK = 100000
+
 
 def dump(args, db):
     '''
@@ -26,6 +28,8 @@ Simple access to the database - similar to the interface provided in Jupyter not
 but accessed from the command line.
 
 The format can be selected with `--print` (the default), `--csv` and `--describe`.
+With `--csv` tables and statistics are read and written in chunks, so large results can be exported
+without holding all the data in memory.
 
 For full options see `ch2 data -h` and `ch2 data COMMAND -h`
 
@@ -47,19 +51,23 @@ Will print HR-related statistics from the start of 2018 for the given activity g
             if name in globals():
                 table = globals()[name]
                 if issubclass(table, Base):
-                    frame = df(s.query(table))
+                    frames = _number(df(s.query(table), chunksize=CHUNK))
                 else:
                     raise Exception('%s is not a mapped table' % name)
             else:
                 raise Exception('%s does not exist' % name)
         elif args[SUB_COMMAND] == STATISTICS:
-            frame = statistics(s, *args[NAMES], start=args[START], finish=args[FINISH],
-                               owner=args[OWNER], constraint=args[CONSTRAINT],
-                               schedule=args[SCHEDULE], source_ids=args[SOURCE_ID])
+            if args[SCHEDULE]:
+                raise Exception('%s is not supported for %s' % (SCHEDULE, STATISTICS))
+            sources = None if args[SOURCE_ID] is None else \
+                [s.query(Source).filter(Source.id == id).one() for id in args[SOURCE_ID]]
+            frames = statistics_chunks(s, *args[NAMES], start=args[START], finish=args[FINISH],
+                                       owner=args[OWNER], constraint=args[CONSTRAINT], sources=sources,
+                                       rows=CHUNK)
         elif args[SUB_COMMAND] == STATISTIC_QUARTILES:
-            frame = statistic_quartiles(s, *args[NAMES], start=args[START], finish=args[FINISH],
-                                        owner=args[OWNER], constraint=args[CONSTRAINT],
-                                        schedule=args[SCHEDULE], source_ids=args[SOURCE_ID])
+            frames = [statistic_quartiles(s, *args[NAMES], start=args[START], finish=args[FINISH],
+                                          owner=args[OWNER], constraint=args[CONSTRAINT],
+                                          schedule=args[SCHEDULE], source_ids=args[SOURCE_ID])]
         else:
             raise Exception('Unexpected %s: %s' % (SUB_COMMAND, args[SUB_COMMAND]))
 
@@ -68,9 +76,22 @@ Will print HR-related statistics from the start of 2018 for the given activity g
         pd.options.display.max_rows = args[MAX_ROWS]
         pd.options.display.width = args[WIDTH]
 
-        if args[FORMAT] == PRINT:
-            print(frame)
-        elif args[FORMAT] == CSV:
-            print(frame.to_csv())
-        elif args[FORMAT] == DESCRIBE:
-            print(frame.describe(include='all'))
+        if args[FORMAT] == CSV:
+            for i, frame in enumerate(frames):
+                print(frame.to_csv(header=not i), end='')
+        else:
+            frames = list(frames)
+            frame = pd.concat(frames) if frames else pd.DataFrame()
+            if args[FORMAT] == PRINT:
+                print(frame)
+            elif args[FORMAT] == DESCRIBE:
+                print(frame.describe(include='all'))
+
+
+def _number(frames):
+    # each chunk from read_sql is numbered from zero
+    n = 0
+    for frame in frames:
+        frame.index += n
+        n += len(frame)
+        yield frame
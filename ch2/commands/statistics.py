@@ -1,14 +1,18 @@
 
 from logging import getLogger
+from re import sub
+from sys import stdout
 
-from .args import FORCE, LIKE, FINISH, START, WORKER, parse_pairs, KARG
+from .args import FORCE, LIKE, FINISH, START, WORKER, parse_pairs, KARG, PROFILE
+from ..squeal import PipelineProfile, ProfileType
 from ..squeal.tables.pipeline import PipelineType
 from ..stoats.pipeline import run_pipeline
+from ..stoats.profile import Profiler, RUN_PIPELINE
 
 log = getLogger(__name__)
 
 
-def statistics(args, db):
+def statistics(args, db, output=stdout):
     '''
 ## statistics
 
@@ -19,7 +23,45 @@ Generate any missing statistics.
     > ch2 statistics --force [DATE]
 
 Delete statistics after the date (or all, if omitted) and then generate new values.
+
+Independent pipelines run in parallel.  Use `-K n_parallel=1` to run them one at a time.
+If interrupted, running the command again continues from where it stopped.
+
+    > ch2 statistics --profile
+
+Run the pipelines in a single process, recording the time spent in each calculator (and the SQL it
+executes), then print the calculators and statements that took longest.
     '''
-    run_pipeline(db, PipelineType.STATISTIC,
-                 force=args[FORCE], like=args[LIKE], start=args[START], finish=args[FINISH],
+    kargs = dict(force=args[FORCE], like=args[LIKE], start=args[START], finish=args[FINISH],
                  worker=args[WORKER] is not None, id=args[WORKER], **parse_pairs(args[KARG]))
+    if args[PROFILE]:
+        with Profiler(db) as profiler:
+            run_pipeline(db, PipelineType.STATISTIC, profiler=profiler, **kargs)
+        with db.session_context() as s:
+            print_profile(s, profiler.run, output=output)
+    else:
+        run_pipeline(db, PipelineType.STATISTIC, **kargs)
+
+
+def print_profile(s, run, n_sql=10, output=stdout):
+    profile = s.query(PipelineProfile).filter(PipelineProfile.run == run).all()
+    calls = [entry for entry in profile if entry.type == ProfileType.CALL]
+    total = {entry.scope: entry for entry in calls if entry.name in ('run', RUN_PIPELINE)}
+    print(f'\nProfile for run at {run}\n', file=output)
+    print(f'{"":34s} {"calls":>7s} {"seconds":>9s} {"rows":>9s} {"sql":>8s}', file=output)
+    for scope in sorted(total, key=lambda scope: total[scope].seconds, reverse=True):
+        _print_call(scope or RUN_PIPELINE, total[scope], output)
+        for entry in sorted((entry for entry in calls if entry.scope == scope and entry is not total[scope]),
+                            key=lambda entry: entry.seconds, reverse=True):
+            _print_call('  ' + entry.name, entry, output)
+    sql = sorted((entry for entry in profile if entry.type == ProfileType.SQL),
+                 key=lambda entry: entry.seconds, reverse=True)[:n_sql]
+    print('\nSlowest SQL (total time)\n', file=output)
+    for entry in sql:
+        statement = sub(r'\s+', ' ', entry.name)
+        print(f'{entry.seconds:9.3f}s {entry.calls:7d} {entry.scope or "-":24s} {statement[:120]}', file=output)
+
+
+def _print_call(name, entry, output):
+    print(f'{name[:34]:34s} {entry.calls:7d} {entry.seconds:9.3f} {entry.rows or 0:9d} {entry.statements or 0:8d}',
+          file=output)
@@ -0,0 +1,81 @@
+
+from hashlib import md5
+from logging import getLogger
+from os import makedirs, replace, getpid
+from os.path import dirname, join, exists, splitext, basename
+
+import pandas as pd
+import pendulum as p
+
+from ..commands.args import CH2_VERSION
+from ..squeal import Timestamp, StatisticName
+
+log = getLogger(__name__)
+
+'''
+An on-disk cache for the DataFrames read for a single activity (eg by notebooks).
+
+Files are keyed by the activity journal and the request, and contain a version derived from the
+Timestamp rows for the activity.  Since readers and calculators update those Timestamps whenever they
+change data for an activity, any change to the activity gives a new version and the cached frame is
+discarded.  The version also includes the local timezone, since frames contain local times.
+'''
+
+CACHE = 'cache'
+
+
+def cache_dir(s):
+    '''
+    A directory next to the database (or None for an in-memory database).
+    '''
+    database = s.bind.url.database
+    if not database or database == ':memory:':
+        return None
+    return join(dirname(database), CACHE, splitext(basename(database))[0])
+
+
+def _key(value):
+    if isinstance(value, StatisticName):
+        return f'StatisticName({value.id})'
+    elif isinstance(value, (list, tuple)):
+        return '(' + ','.join(_key(x) for x in value) + ')'
+    else:
+        return str(value)
+
+
+def version(s, activity_journal):
+    timestamps = s.query(Timestamp.owner, Timestamp.constraint, Timestamp.time). \
+        filter(Timestamp.source_id == activity_journal.id).all()
+    return _key([CH2_VERSION, p.tz.get_local_timezone().name] +
+                sorted((str(owner), str(constraint), time.timestamp()) for owner, constraint, time in timestamps))
+
+
+def cached(s, activity_journal, key, calculate):
+    '''
+    Return the result of calculate() for the activity, reading from the cache if possible.
+
+    key should be a tuple that identifies the request (function name and arguments).
+    '''
+    dir = cache_dir(s)
+    if dir is None:
+        return calculate()
+    path = join(dir, f'{activity_journal.id}-{md5(_key(key).encode("utf8")).hexdigest()}.pkl')
+    current = version(s, activity_journal)
+    if exists(path):
+        try:
+            previous, df = pd.read_pickle(path)
+            if previous == current:
+                log.debug(f'Read {path} from cache')
+                return df
+        except Exception as e:
+            log.warning(f'Could not read {path} ({e})')
+    df = calculate()
+    try:
+        makedirs(dir, exist_ok=True)
+        tmp = f'{path}.{getpid()}'
+        pd.to_pickle((current, df), tmp)
+        replace(tmp, path)  # atomic, so other processes never see part of a file
+        log.debug(f'Wrote {path} to cache')
+    except Exception as e:
+        log.warning(f'Could not write {path} ({e})')
+    return df
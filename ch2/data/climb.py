@@ -6,10 +6,10 @@ from logging import getLogger
 
 import numpy as np
 
-from .frame import linear_resample, present
+from .frame import linear_resample
 from ..lib.data import nearest_index, get_index_loc
 from ..squeal import StatisticName, StatisticJournal
-from ..stoats.names import _d, ELEVATION, DISTANCE, TOTAL_CLIMB, TIME, CLIMB_ELEVATION, CLIMB_DISTANCE, CLIMB_TIME, \
+from ..stoats.names import ELEVATION, DISTANCE, TOTAL_CLIMB, TIME, CLIMB_ELEVATION, CLIMB_DISTANCE, CLIMB_TIME, \
     CLIMB_GRADIENT, CLIMB_POWER, POWER_ESTIMATE, CLIMB_CATEGORY
 
 log = getLogger(__name__)
@@ -100,17 +100,32 @@ def first_or_none(generator):
 
 
 def biggest_reversal(df):
-    max_elevation, max_indices, d = 0, (None, None), df.index[1] - df.index[0]
-    for offset in range(1, len(df)-1):
-        df[_d(ELEVATION)] = df[ELEVATION].diff(-offset)
-        if present(df, _d(ELEVATION)):
-            d_elevation = df[_d(ELEVATION)].dropna().max()
-            if d_elevation > max_elevation:
-                max_elevation = d_elevation
-                hi = df.loc[df[_d(ELEVATION)] == max_elevation].index[0]  # break ties
-                lo = df.index[get_index_loc(df, hi) + offset]
-                max_indices = (lo, hi)
-    return max_elevation, max_indices[0], max_indices[1]
+    # returns (drop, dlo, dhi) where dhi is the (earlier) high point.
+    # the biggest drop to each point is from the latest maximum before it, so this is linear in the
+    # length of the data.  ties go to the shortest reversal, then the earliest.  the reversal across
+    # the whole range is excluded.
+    elevation = df[ELEVATION].to_numpy(dtype=float)
+    n = len(elevation)
+    if n < 3:
+        return 0, None, None
+    peak = np.fmax.accumulate(elevation)
+    hi = np.maximum.accumulate(np.where(elevation == peak, np.arange(n), -1))[:-1]
+    lo = np.arange(1, n)
+    drop = peak[:-1] - elevation[1:]
+    if hi[-1] == 0:
+        # the last point cannot reverse from the first, so use the maximum between them
+        between = elevation[1:-1]
+        if np.isnan(between).all():
+            drop[-1] = np.nan
+        else:
+            hi[-1] = n - 2 - np.nanargmax(between[::-1])
+            drop[-1] = elevation[hi[-1]] - elevation[-1]
+    if np.isnan(drop).all() or not np.nanmax(drop) > 0:
+        return 0, None, None
+    max_drop = np.nanmax(drop)
+    tied = np.flatnonzero(drop == max_drop)
+    best = tied[np.lexsort((hi[tied], lo[tied] - hi[tied]))[0]]
+    return max_drop, df.index[lo[best]], df.index[hi[best]]
 
 
 def biggest_climb(df, params=Climb(), grid=10):
@@ -130,21 +145,49 @@ def biggest_climb(df, params=Climb(), grid=10):
 
 def search(df, params=Climb()):
     # returns (score, dlo, dhi)
-    # use times (indices) rather than ilocs because we're subdividing the data
-    max_score, max_indices, d = 0, (None, None), df.index[1] - df.index[0]
-    for offset in range(len(df)-1, 0, -1):
-        df[_d(ELEVATION)] = df[ELEVATION].diff(offset)
-        d_distance = d * offset
-        min_elevation = max(params.min_elevation, params.min_gradient * d_distance / 100)
-        if df[_d(ELEVATION)].max() > min_elevation:  # avoid some work
-            df[SCORE] = df[_d(ELEVATION)] / d_distance ** params.phi
-            score = df.loc[df[_d(ELEVATION)] > min_elevation, SCORE].max()
-            if not np.isnan(score) and score > max_score:
-                max_score = score
-                hi = df.loc[df[SCORE] == max_score].index[0]  # arbitrarily pick one if tied (error here w item())
-                lo = df.index[get_index_loc(df, hi) - offset]
-                max_indices = (lo, hi)
-    return max_score, max_indices[0], max_indices[1]
+    # use times (indices) rather than ilocs because we're subdividing the data.
+    # a climb only starts at a point that is no higher than everything after it (up to the end of the
+    # climb), since otherwise a later start is both lower and closer.  so the possible starts are kept on
+    # a monotonic stack and each end is compared with those alone (and only those low enough to gain
+    # min_elevation, which are a prefix of the stack).  ties go to the longest climb, then the earliest.
+    # missing (nan) elevations are skipped, so a climb can span a gap.
+    # this is O(n k) for k candidate starts, which is small for noisy data, but approaches n on a steady
+    # climb (when every earlier point is a possible start).  that is still much faster than the original
+    # O(n^2) search (one pass over the data for each offset).
+    elevation = df[ELEVATION].to_numpy(dtype=float)
+    values = elevation.tolist()
+    n = len(elevation)
+    d = df.index[1] - df.index[0]
+    # per offset (computed as scalars, as before, so that ties are the same)
+    d_distances = [d * offset for offset in range(n)]
+    scales = np.array([d_distance ** params.phi for d_distance in d_distances])
+    min_elevations = np.array([max(params.min_elevation, params.min_gradient * d_distance / 100)
+                               for d_distance in d_distances])
+    max_score, max_offset, max_hi = 0, None, None
+    stack, top = np.empty(n, dtype=np.int64), 0  # indices with non-decreasing elevation
+    lows = np.empty(n)  # the elevations at those indices
+    for hi in range(n):
+        value = values[hi]
+        if value != value:
+            continue  # nan
+        if top and value - lows[0] > params.min_elevation:  # avoid some work
+            # a little extra (for rounding) is included here and then excluded below
+            k = np.searchsorted(lows[:top], value - params.min_elevation + 1e-9 * (abs(value) + 1), side='right')
+            offsets = hi - stack[:k]
+            d_elevations = value - lows[:k]
+            scores = np.where(d_elevations > min_elevations[offsets], d_elevations / scales[offsets], 0)
+            best = np.argmax(scores)  # first, so longest
+            score, offset = scores[best], offsets[best]
+            if score > max_score or (score and score == max_score and offset > max_offset):
+                max_score, max_offset, max_hi = score, offset, hi
+        while top and not lows[top-1] <= value:
+            top -= 1
+        stack[top], lows[top] = hi, value
+        top += 1
+    if max_score:
+        return max_score, df.index[max_hi - max_offset], df.index[max_hi]
+    else:
+        return 0, None, None
 
 
 def climbs_for_activity(s, ajournal):
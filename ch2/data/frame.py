@@ -7,15 +7,16 @@ from re import compile
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import inspect, select, and_, or_, distinct, asc, desc
+from sqlalchemy import inspect, select, or_, and_, asc, desc, type_coerce, Float, union_all, cast, Integer, func
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.functions import coalesce
 
+from .cache import cached
 from .coasting import CoastingBookmark
 from ..lib.data import kargs_to_attr
-from ..lib.date import local_time_to_time, time_to_local_time, YMD, HMS
+from ..lib.date import local_time_to_time, time_to_local_time, YMD, HMS, times_to_local_times, to_time
 from ..squeal import StatisticName, StatisticJournal, StatisticJournalInteger, ActivityJournal, \
-    StatisticJournalFloat, StatisticJournalText, Interval, StatisticMeasure, Source
+    StatisticJournalFloat, StatisticJournalText, Interval, StatisticMeasure, Source, StatisticArray
 from ..squeal.database import connect, ActivityTimespan, ActivityGroup, ActivityBookmark, StatisticJournalType, \
     Composite, CompositeComponent, ActivityNearby
 from ..stoats.display.nearby import nearby_any_time
@@ -37,9 +38,10 @@ log = getLogger(__name__)
 # instances give complete control.
 
 
-def df(query):
+def df(query, chunksize=None):
     # https://stackoverflow.com/questions/29525808/sqlalchemy-orm-conversion-to-pandas-dataframe
-    return pd.read_sql(query.statement, query.session.bind)
+    # with chunksize, an iterator over frames of (at most) that many rows is returned.
+    return pd.read_sql(query.statement, query.session.bind, chunksize=chunksize)
 
 
 def session(*args):
@@ -171,7 +173,7 @@ def _add_bookmark(bookmark, df):
 
 def activity_statistics(s, *statistics, start=None, finish=None, owner=None, constraint=None,
                         local_time=None, time=None, bookmarks=None, activity_journal=None,
-                        activity_group_name=None, with_timespan=False, check=True):
+                        activity_group_name=None, with_timespan=False, check=True, cache=False):
 
     if bookmarks:
         if start or finish or local_time or time or activity_journal or activity_group_name:
@@ -180,134 +182,316 @@ def activity_statistics(s, *statistics, start=None, finish=None, owner=None, con
                                        _activity_statistics(s, *statistics, owner=owner, constraint=constraint,
                                                             start=bookmark.start, finish=bookmark.finish,
                                                             activity_journal=bookmark.activity_journal,
-                                                            with_timespan=with_timespan, check=check))
+                                                            with_timespan=with_timespan, check=check,
+                                                            cache=cache))
                          for bookmark in bookmarks)
     else:
         return _activity_statistics(s, *statistics, owner=owner, constraint=constraint, start=start, finish=finish,
                                     local_time=local_time, time=time, activity_journal=activity_journal,
-                                    activity_group_name=activity_group_name, with_timespan=with_timespan, check=check)
+                                    activity_group_name=activity_group_name, with_timespan=with_timespan, check=check,
+                                    cache=cache)
 
 
 def _activity_statistics(s, *statistics, owner=None, constraint=None, start=None, finish=None,
                          local_time=None, time=None, activity_journal=None,
-                         activity_group_name=None, with_timespan=False, check=True):
+                         activity_group_name=None, with_timespan=False, check=True, cache=False):
 
     activity_journal = _activity_journal(s, activity_journal=activity_journal, local_time=local_time,
                                          time=time, activity_group_name=activity_group_name)
+    if cache:
+        return cached(s, activity_journal,
+                      ('activity_statistics', statistics, owner, constraint, start, finish, with_timespan),
+                      lambda: _activity_statistics(s, *statistics, owner=owner, constraint=constraint,
+                                                   start=start, finish=finish, activity_journal=activity_journal,
+                                                   with_timespan=with_timespan, check=check))
     if constraint is None:
         constraint = activity_journal.activity_group
     names = statistic_names(s, *statistics, owner=owner, constraint=constraint, check=check)
+    labels = _labels(names)
+    columns = _columns(names, labels, _activity_rows(s, names, [activity_journal.id], start=start, finish=finish))
+    stats = _frame(columns, labels)
+    if with_timespan:
+        _add_timespans(stats, s.query(ActivityTimespan).
+                       filter(ActivityTimespan.activity_journal_id == activity_journal.id).all())
+    return stats
+
+
+def activities_statistics(s, *statistics, activity_journals=None, owner=None, with_timespan=False, check=True):
+    '''
+    The equivalent of activity_statistics() for many activities (eg from constrained_activities()), but
+    reading the journal with a single query.  Returns a dict from activity journal to DataFrame.
+    '''
+    activity_journals = list(activity_journals)
+    names = {}  # names and labels depend on the activity group
+    for activity_journal in activity_journals:
+        group = activity_journal.activity_group
+        if group not in names:
+            group_names = statistic_names(s, *statistics, owner=owner, constraint=group, check=check)
+            names[group] = (group_names, _labels(group_names))
+    all_names = list(dict((name.id, name) for group_names, _ in names.values() for name in group_names).values())
+    source_ids = [activity_journal.id for activity_journal in activity_journals]
+    rows = dict(iter(_activity_rows(s, all_names, source_ids).groupby(SOURCE_ID)))
+    no_rows = _no_rows()
+    timespans = defaultdict(list)
+    if with_timespan:
+        for timespan in s.query(ActivityTimespan). \
+                filter(ActivityTimespan.activity_journal_id.in_(source_ids)).all():
+            timespans[timespan.activity_journal_id].append(timespan)
+    results = {}
+    for activity_journal in activity_journals:
+        group_names, labels = names[activity_journal.activity_group]
+        columns = _columns(group_names, labels, rows.get(activity_journal.id, no_rows))
+        results[activity_journal] = _frame(columns, labels)
+        if with_timespan:
+            _add_timespans(results[activity_journal], timespans[activity_journal.id])
+    return results
+
+
+def _labels(names):
     counts = Counter(name.name for name in names)
+    return [name.name if counts[name.name] == 1 else f'{name.name} ({name.constraint})' for name in names]
+
+
+def _add_timespans(stats, timespans):
+    # the index is sorted so each timespan is a slice
+    ids = np.full(len(stats), np.nan)
+    for timespan in timespans:
+        ids[stats.index.searchsorted(timespan.start):stats.index.searchsorted(timespan.finish)] = timespan.id
+    stats[TIMESPAN_ID] = ids
+
+
+def _journal_columns(s, names, labels, start=None, finish=None, source_ids=None, with_sources=False,
+                     resample=None, agg=None):
+    return _columns(names, labels, _journal_rows(s, names, start=start, finish=finish, source_ids=source_ids,
+                                                 resample=resample, agg=agg),
+                    with_sources=with_sources, integers=not (resample and agg == 'mean'))
+
+
+def _activity_rows(s, names, source_ids, start=None, finish=None):
+
+    # the same as _journal_rows(), but reading from StatisticArray where possible (see ActivityReader).
+    # arrays are deleted when the journal changes, so any array present is complete.
+
+    arrays = s.query(StatisticArray). \
+        filter(StatisticArray.source_id.in_(source_ids),
+               StatisticArray.statistic_name_id.in_([name.id for name in names])).all()
+    if not arrays:
+        return _journal_rows(s, names, start=start, finish=finish, source_ids=source_ids)
+    stored = set((array.statistic_name_id, array.source_id) for array in arrays)
+    rows = [_array_rows(array, start, finish) for array in arrays]
+    missing = [(name, source_id) for name in names for source_id in source_ids
+               if (name.id, source_id) not in stored]
+    if missing:
+        journal = _journal_rows(s, list(dict((name.id, name) for name, _ in missing).values()),
+                                start=start, finish=finish,
+                                source_ids=list(set(source_id for _, source_id in missing)))
+        rows.append(journal.loc[[key not in stored for key in
+                                 zip(journal[STATISTIC_NAME_ID], journal[SOURCE_ID])]])
+    return pd.concat(rows, ignore_index=True)
+
+
+def _array_rows(array, start, finish):
+    times, values = StatisticArray.unpack(array.times), StatisticArray.unpack(array.values)
+    keep = np.ones(len(times), dtype=bool)
+    if start:
+        keep &= times >= to_time(start).timestamp()
+    if finish:
+        keep &= times <= to_time(finish).timestamp()
+    return pd.DataFrame({STATISTIC_NAME_ID: array.statistic_name_id, TIME: times[keep],
+                         SOURCE_ID: array.source_id, VALUE: values[keep]}, columns=ROWS)
+
+
+AGGREGATES = {'sum': func.sum, 'mean': func.avg, 'max': func.max, 'min': func.min, 'count': func.count}
+
+
+def _journal_rows(s, names, start=None, finish=None, source_ids=None, resample=None, agg=None,
+                  after=None, limit=None):
+
+    # a single scan of the journal (a union over the typed tables) that is pivoted later, rather than
+    # an outer join on a sub-select for each name (which sqlite handles badly as the number grows).
+    # times are read as floats and the series are indexed by those, so they align exactly.
+    # if resample is given, values are aggregated in buckets (labelled by their start) in the database.
+    # buckets are aligned with the epoch, so days are utc days (as when resampling the utc index in pandas).
+    # unless resampled, rows are ordered by (time, id), so that when values have the same time the most
+    # recent is last (and is the one kept by _columns()).
+    # if limit is given, rows start after the (time, id) pair in after (keyset pagination).  each name is
+    # then limited separately so that the index on name and time is used to read only the rows required,
+    # rather than sorting everything that remains.
 
     t = _tables()
     ttj = _type_to_journal(t)
-    labels = [name.name if counts[name.name] == 1 else f'{name.name} ({name.constraint})' for name in names]
-    tables = [ttj[name.statistic_journal_type] for name in names]
-    time_select = select([distinct(t.sj.c.time).label("time")]).select_from(t.sj). \
-        where(and_(t.sj.c.statistic_name_id.in_([n.id for n in names]),
-                   t.sj.c.source_id == activity_journal.id))
-    if start:
-        time_select = time_select.where(t.sj.c.time >= start)
-    if finish:
-        time_select = time_select.where(t.sj.c.time <= finish)
-    time_select = time_select.order_by("time").alias("sub_time")  # order here avoids extra index
-    sub_selects = [select([table.c.value, t.sj.c.time]).
-                       select_from(t.sj.join(table)).
-                       where(and_(t.sj.c.statistic_name_id == name.id,
-                                  t.sj.c.source_id == activity_journal.id)).
-                       order_by(t.sj.c.time).  # this doesn't affect plan but seems to speed up query
-                       alias(f'sub_{name.name}_{name.constraint}')
-                   for name, table in zip(names, tables)]
-    # don't call this TIME because even though it's moved to index it somehow blocks the later addition
-    # of a TIME column (eg when plotting health statistics)
-    selects = [time_select.c.time.label(INDEX)] + \
-              [sub.c.value.label(label) for sub, label in zip(sub_selects, labels)]
-    sources = time_select
-    for sub in sub_selects:
-        sources = sources.outerjoin(sub, time_select.c.time == sub.c.time)
-    if with_timespan:
-        selects += [t.at.c.id.label(TIMESPAN_ID)]
-        sources = sources.outerjoin(t.at,
-                                    and_(t.at.c.start <= time_select.c.time,
-                                         t.at.c.finish > time_select.c.time,
-                                         t.at.c.activity_journal_id == activity_journal.id))
-    sql = select(selects).select_from(sources)
+    ids = defaultdict(list)
+    for name in names:
+        ids[name.statistic_journal_type].append(name.id)
+    time = type_coerce(t.sj.c.time, Float)
+    if resample:
+        if agg not in AGGREGATES:
+            raise Exception(f'Unsupported aggregation {agg} (use one of {", ".join(AGGREGATES)})')
+        seconds = pd.Timedelta(resample).total_seconds()
+        time = cast(time / seconds, Integer) * seconds  # times are positive, so this rounds down
+    selects = []
+    groups = [(type, [id]) for type in ids for id in ids[type]] if limit else ids.items()
+    for type, group_ids in groups:
+        if resample:
+            q = select([t.sj.c.statistic_name_id, time.label('time'), func.max(t.sj.c.source_id),
+                        AGGREGATES[agg](ttj[type].c.value)]). \
+                group_by(t.sj.c.statistic_name_id, time)
+        else:
+            q = select([t.sj.c.statistic_name_id, time.label('time'), t.sj.c.source_id, ttj[type].c.value,
+                        t.sj.c.id])
+            if after:
+                q = q.where(and_(time >= after[0], or_(time > after[0], t.sj.c.id > after[1])))
+        q = q.select_from(t.sj.join(ttj[type])). \
+            where(t.sj.c.statistic_name_id.in_(group_ids))
+        if start:
+            q = q.where(t.sj.c.time >= start)
+        if finish:
+            q = q.where(t.sj.c.time <= finish)
+        if source_ids is not None:
+            q = q.where(t.sj.c.source_id.in_(int(id) for id in source_ids))
+        if limit:
+            q = select([q.order_by(time, t.sj.c.id).limit(limit).alias()])
+        selects.append(q)
+    if not selects:
+        return _no_rows()
+    sql = selects[0] if len(selects) == 1 else union_all(*selects)
+    if not resample:
+        sql = sql.alias()
+        sql = select([sql]).order_by(sql.c.time, sql.c.id)
+        if limit:
+            sql = sql.limit(limit)
     # log.debug(sql)
-    return pd.read_sql_query(sql=sql, con=s.connection(), index_col=INDEX)
+    # rows go through the usual result processing (tuples are faster for pandas than RowProxy)
+    rows = pd.DataFrame.from_records([tuple(row) for row in s.connection().execute(sql)],
+                                     columns=ROWS if resample else ROWS + [ID])
+    return rows if resample or limit else rows.drop(columns=[ID])
+
+
+STATISTIC_NAME_ID, SOURCE_ID, VALUE, ID, NAME, QUARTILE = \
+    'statistic_name_id', 'source_id', 'value', 'id', 'name', 'quartile'
+ROWS = [STATISTIC_NAME_ID, TIME, SOURCE_ID, VALUE]
+
+
+def _no_rows():
+    return pd.DataFrame(columns=ROWS)
+
+
+def _columns(names, labels, rows, with_sources=False, integers=True):
+    by_name = dict(iter(rows.groupby(STATISTIC_NAME_ID)))
+    columns = {}
+    for name, label in zip(names, labels):
+        if name.id in by_name:
+            name_rows = by_name[name.id]
+            index = pd.Index(name_rows[TIME].values, dtype=float)
+            keep = ~index.duplicated(keep='last')
+            if not keep.all():
+                log.warning(f'Dropped {len(keep) - keep.sum()} values for {label} with duplicate times')
+            columns[label] = pd.Series(name_rows[VALUE].tolist(), index=index, name=label)[keep]
+            if integers and name.statistic_journal_type == StatisticJournalType.INTEGER and \
+                    columns[label].notna().all():
+                columns[label] = columns[label].astype(np.int64)  # may have been mixed with floats above
+            if with_sources:
+                columns[_src(label)] = pd.Series(name_rows[SOURCE_ID].tolist(), index=index, name=_src(label))[keep]
+        else:
+            columns[label] = pd.Series([], index=pd.Index([], dtype=float), name=label, dtype=float)
+            if with_sources:
+                columns[_src(label)] = pd.Series([], index=pd.Index([], dtype=float), name=_src(label), dtype=float)
+    return columns
+
+
+def _frame(columns, labels):
+    # don't call the index TIME because even though it's moved to index it somehow blocks the later
+    # addition of a TIME column (eg when plotting health statistics)
+    if not labels:
+        return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC', name=INDEX))
+    stats = pd.concat([columns[label] for label in labels], axis=1).sort_index()
+    stats.index = pd.to_datetime(np.round(stats.index.values * 1e6).astype(np.int64), unit='us', utc=True)
+    stats.index.name = INDEX
+    return stats
 
 
 def statistic_quartiles(s, *statistics, start=None, finish=None, owner=None, constraint=None, source_ids=None,
                         schedule=None):
+    '''
+    A DataFrame indexed by interval start, with a column for each statistic name.  Each entry is a list of
+    the five quartile values (min, 25%, median, 75%, max) for the statistic in that interval.
+    '''
 
-    # todo - rewrite using new approach
+    # a single query for all quartile rows, reshaped in pandas (rather than loading each measure and its
+    # journal, name and source through the ORM).
 
     statistic_names, statistic_ids = _collect_statistics(s, statistics, owner, constraint)
-    q = s.query(StatisticMeasure). \
-        join(StatisticJournal, StatisticMeasure.statistic_journal_id == StatisticJournal.id). \
-        join(StatisticName, StatisticJournal.statistic_name_id == StatisticName.id). \
-        join(Source, StatisticJournal.source_id == Source.id). \
-        filter(StatisticName.id.in_(statistic_ids)). \
-        filter(StatisticMeasure.quartile != None)
+    t = _tables()
+    sm = inspect(StatisticMeasure).local_table
+    q = select([t.inv.c.start, t.sn.c.name, sm.c.quartile, coalesce(t.sjf.c.value, t.sji.c.value, t.sjt.c.value)]). \
+        select_from(sm.join(t.sj, sm.c.statistic_journal_id == t.sj.c.id).join(t.sn).
+                    join(t.inv, sm.c.source_id == t.inv.c.id).outerjoin(t.sjf).outerjoin(t.sji).outerjoin(t.sjt)). \
+        where(and_(t.sn.c.id.in_(statistic_ids), sm.c.quartile != None))
     if start:
-        q = q.filter(StatisticJournal.time >= start)
+        q = q.where(t.sj.c.time >= start)
     if finish:
-        q = q.filter(StatisticJournal.time <= finish)
+        q = q.where(t.sj.c.time <= finish)
     if source_ids is not None:
-        q = q.filter(StatisticJournal.source_id.in_(source_ids))
+        q = q.where(t.sj.c.source_id.in_(int(id) for id in source_ids))
     if schedule:
-        q = q.join((Interval, StatisticMeasure.source_id == Interval.id)). \
-            filter(Interval.schedule == schedule)
+        q = q.where(t.inv.c.schedule == schedule)
+    # ordered so that if there are duplicates the last (most recent journal) is kept below
+    q = q.order_by(t.sj.c.id, sm.c.id)
     log.debug(q)
 
-    raw_data = defaultdict(lambda: defaultdict(lambda: [0] * 5))
-    for measure in q.all():
-        raw_data[measure.source.start][measure.statistic_journal.statistic_name.name][measure.quartile] = \
-            measure.statistic_journal.value
-    data, times = defaultdict(list), []
-    for time in sorted(raw_data.keys()):
-        times.append(time)
-        sub_data = raw_data[time]
-        for statistic in statistic_names:
-            if statistic in sub_data:
-                data[statistic].append(sub_data[statistic])
-            else:
-                data[statistic].append(None)
-
-    return pd.DataFrame(data, index=times)
+    rows = pd.DataFrame.from_records(s.connection().execute(q).fetchall(), columns=[INDEX, NAME, QUARTILE, VALUE])
+    if rows.empty:
+        return pd.DataFrame()
+    quartiles = rows.drop_duplicates([INDEX, NAME, QUARTILE], keep='last'). \
+        pivot(index=[INDEX, NAME], columns=QUARTILE, values=VALUE).reindex(columns=range(5)).fillna(0)
+    data = pd.Series(quartiles.values.tolist(), index=quartiles.index).unstack(NAME). \
+        reindex(columns=sorted(statistic_names))
+    data = data.astype(object).where(data.notna(), None)
+    data.index.name = None
+    data.columns.name = None
+    return data
 
 
 MIN_PERIODS = 1
 
 def std_activity_statistics(s, local_time=None, time=None, activity_journal=None, activity_group_name=None,
-                            with_timespan=True):
+                            with_timespan=True, cache=False):
+
+    activity_journal = _activity_journal(s, activity_journal=activity_journal, local_time=local_time,
+                                         time=time, activity_group_name=activity_group_name)
+    if cache:
+        return cached(s, activity_journal, ('std_activity_statistics', with_timespan),
+                      lambda: _std_activity_statistics(s, activity_journal, with_timespan))
+    else:
+        return _std_activity_statistics(s, activity_journal, with_timespan)
+
+
+def _std_activity_statistics(s, activity_journal, with_timespan):
 
     stats = activity_statistics(s, LATITUDE, LONGITUDE, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y, DISTANCE,
                                 ELEVATION, SPEED, HEART_RATE, HR_ZONE, HR_IMPULSE_10, ALTITUDE, GRADE, CADENCE,
-                                POWER_ESTIMATE,
-                                local_time=local_time, time=time, activity_journal=activity_journal,
-                                activity_group_name=activity_group_name, with_timespan=with_timespan)
+                                POWER_ESTIMATE, activity_journal=activity_journal, with_timespan=with_timespan)
 
-    stats[DISTANCE_KM] = stats[DISTANCE]/1000
-    stats[SPEED_KMH] = stats[SPEED] * 3.6
-    stats[MED_SPEED_KMH] = stats[SPEED].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median() * 3.6
-    if present(stats, CADENCE):
-        stats[MED_CADENCE] = stats[CADENCE].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
     if present(stats, HEART_RATE):
         stats.rename(columns={HEART_RATE: HEART_RATE_BPM}, inplace=True)
-        stats[MED_HEART_RATE_BPM] = stats[HEART_RATE_BPM].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
-        stats[MED_HR_IMPULSE_10] = stats[HR_IMPULSE_10].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
-    if present(stats, POWER_ESTIMATE):
-        stats[MED_POWER_ESTIMATE_W] = stats[POWER_ESTIMATE].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median().clip(lower=0)
     if present(stats, ELEVATION):
-        stats.rename(columns={ELEVATION: ELEVATION_M}, inplace=True)
-        stats.rename(columns={GRADE: GRADE_PC}, inplace=True)
+        stats.rename(columns={ELEVATION: ELEVATION_M, GRADE: GRADE_PC}, inplace=True)
+    stats[DISTANCE_KM] = stats[DISTANCE] / 1000
+    stats[SPEED_KMH] = stats[SPEED] * 3.6
+
+    # all medians in a single rolling window
+    medians = [(MED_SPEED_KMH, SPEED_KMH), (MED_CADENCE, CADENCE), (MED_HEART_RATE_BPM, HEART_RATE_BPM),
+               (MED_HR_IMPULSE_10, HR_IMPULSE_10), (MED_POWER_ESTIMATE_W, POWER_ESTIMATE)]
+    medians = [(median, name) for median, name in medians if name == SPEED_KMH or present(stats, name)]
+    rolling = stats[[name for _, name in medians]].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
+    for median, name in medians:
+        stats[median] = rolling[name].clip(lower=0) if median == MED_POWER_ESTIMATE_W else rolling[name]
 
     if with_timespan:
         timespans = stats[TIMESPAN_ID].dropna().unique()
     if present(stats, HR_IMPULSE_10):
-        stats[KEEP] = pd.notna(stats[HR_IMPULSE_10])
-        stats.interpolate(method='time', inplace=True)
-        stats = stats.loc[stats[KEEP] == True].drop(columns=[KEEP])
+        keep = stats[HR_IMPULSE_10].notna().values
+        stats = stats.interpolate(method='time').loc[keep]
     else:
         stats = linear_resample_time(stats, dt=10, add_time=False)
     if with_timespan:
@@ -315,8 +499,8 @@ def std_activity_statistics(s, local_time=None, time=None, activity_journal=None
 
     if present(stats, ELEVATION_M):
         stats[CLIMB_MS] = stats[ELEVATION_M].diff() * 0.1
-    stats[TIME] = pd.to_datetime(stats.index)
-    stats[LOCAL_TIME] = stats[TIME].apply(lambda x: time_to_local_time(x.to_pydatetime(), HMS))
+    stats[TIME] = stats.index
+    stats[LOCAL_TIME] = times_to_local_times(stats.index, HMS)
 
     return stats
 
@@ -334,9 +518,9 @@ def std_health_statistics(s, *extra, start=None, finish=None):
     finish = finish or s.query(StatisticJournal.time).order_by(desc(StatisticJournal.time)).limit(1).scalar()
     stats = pd.DataFrame(index=pd.date_range(start=start, end=finish, freq='1h'))
 
-    stats_1 = statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, start=start, finish=finish, check=False)
+    stats_1 = statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, start=start, finish=finish, check=False,
+                         resample='1h', agg='mean')
     if present(stats_1, FITNESS_D_ANY, pattern=True):
-        stats_1 = stats_1.resample('1h').mean()
         stats = merge_to_hour(stats, stats_1)
     stats_2 = statistics(s, LO_REST_HR, REST_HR, HI_REST_HR, start=start, finish=finish, owner=MonitorCalculator,
                          check=False)
@@ -390,51 +574,62 @@ def _type_to_journal(t):
 
 
 def statistics(s, *statistics, start=None, finish=None, local_start=None, local_finish=None,
-               owner=None, constraint=None, sources=None, with_sources=False, check=True):
-    t = _tables()
-    ttj = _type_to_journal(t)
+               owner=None, constraint=None, sources=None, with_sources=False, check=True, resample=None, agg='mean'):
+    '''
+    If resample is given (a pandas offset like '1D' or '1h') then values are aggregated (with agg - one of
+    sum, mean, max, min or count) in the database.  Only intervals that contain data are returned.
+    Intervals are aligned with the epoch, so a day is a UTC day (not a local one).
+    '''
+    if resample and with_sources:
+        raise Exception('Cannot resample with sources')
     names = statistic_names(s, *statistics, owner=owner, constraint=constraint, check=check)
-    counts = Counter(name.name for name in names)
-    labels = [name.name if counts[name.name] == 1 else f'{name.name} ({name.constraint})' for name in names]
-    tables = [ttj[name.statistic_journal_type] for name in names]
+    labels = _labels(names)
+    start, finish = _start_finish(start, finish, local_start, local_finish)
+    columns = _journal_columns(s, names, labels, start=start, finish=finish,
+                               source_ids=None if sources is None else [source.id for source in sources],
+                               with_sources=with_sources, resample=resample, agg=agg)
+    if with_sources:
+        labels = labels + [_src(label) for label in labels]
+    return _frame(columns, labels)
+
+
+def statistics_chunks(s, *statistics, start=None, finish=None, local_start=None, local_finish=None,
+                      owner=None, constraint=None, sources=None, with_sources=False, check=True, rows=100000):
+    '''
+    Like statistics(), but yields a series of DataFrames for consecutive intervals of time, so that
+    large results (eg years of monitor data) are never held in memory at once.
+
+    Each query reads (at most) rows values, continuing from the last (time, id) read.  Values at the
+    final time read are held back for the next frame, so each time appears in exactly one frame.
+    '''
+    names = statistic_names(s, *statistics, owner=owner, constraint=constraint, check=check)
+    labels = _labels(names)
+    all_labels = labels + [_src(label) for label in labels] if with_sources else labels
+    start, finish = _start_finish(start, finish, local_start, local_finish)
+    source_ids = None if sources is None else [source.id for source in sources]
+    held, after = None, None
+    while True:
+        page = _journal_rows(s, names, start=start, finish=finish, source_ids=source_ids, after=after, limit=rows)
+        current = page if held is None else pd.concat([held, page], ignore_index=True)
+        if len(page) < rows:
+            if len(current):
+                yield _frame(_columns(names, labels, current, with_sources=with_sources), all_labels)
+            return
+        after = (page[TIME].iloc[-1], int(page[ID].iloc[-1]))
+        last = current[TIME] == after[0]
+        held = current.loc[last]
+        if not last.all():
+            yield _frame(_columns(names, labels, current.loc[~last], with_sources=with_sources), all_labels)
+
+
+def _start_finish(start, finish, local_start, local_finish):
     if local_start:
         if start: raise Exception('Provide only one of start, local_start')
         start = local_time_to_time(local_start)
     if local_finish:
         if finish: raise Exception('Provide only one of finish, local_finish')
         finish = local_time_to_time(local_finish)
-    time_select = select([distinct(t.sj.c.time).label("time")]).select_from(t.sj). \
-        where(t.sj.c.statistic_name_id.in_([n.id for n in names]))
-    if start:
-        time_select = time_select.where(t.sj.c.time >= start)
-    if finish:
-        time_select = time_select.where(t.sj.c.time <= finish)
-    time_select = time_select.order_by("time").alias("sub_time")  # order here avoids extra index
-
-    def sub_select(name, table):
-        selects = [table.c.value, t.sj.c.time]
-        if with_sources:
-            selects += [t.sj.c.source_id]
-        q = select(selects). \
-            select_from(t.sj.join(table)). \
-            where(t.sj.c.statistic_name_id == name.id)
-        if sources:
-            q = q.where(t.sj.c.source_id.in_(source.id for source in sources))
-        # order_by doesn't affect plan but seems to speed up query
-        return q.order_by(t.sj.c.time).alias(f'sub_{name.name}_{name.constraint}')
-
-    sub_selects = [sub_select(name, table) for name, table in zip(names, tables)]
-    # don't call this TIME because even though it's moved to index it somehow blocks the later addition
-    # of a TIME column (eg when plotting health statistics)
-    selects = [time_select.c.time.label(INDEX)] + \
-              [sub.c.value.label(label) for sub, label in zip(sub_selects, labels)]
-    if with_sources:
-        selects += [sub.c.source_id.label(_src(label)) for sub, label in zip(sub_selects, labels)]
-    sources = time_select
-    for sub in sub_selects:
-        sources = sources.outerjoin(sub, time_select.c.time == sub.c.time)
-    sql = select(selects).select_from(sources)
-    return pd.read_sql_query(sql=sql, con=s.connection(), index_col=INDEX)
+    return start, finish
 
 
 def present(df, *names, pattern=False):
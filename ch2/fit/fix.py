@@ -170,10 +170,12 @@ def process_header(data, header_size=None, protocol_version=None, profile_versio
 def process_checksum(data, state):
     offset = 0
     try:
-        # don't use memoryview here as it gets spread into state and token
-        offset = len(FileHeader(data))
-        while len(data) - offset > 2:
-            token = token_factory(data[offset:], state)
+        # don't use a memoryview of data here as it gets spread into state and token (and data is resized below).
+        # instead, view an immutable copy.
+        view = memoryview(bytes(data))
+        offset = len(FileHeader(view))
+        while len(view) - offset > 2:
+            token = token_factory(view[offset:], state)
             offset += len(token)
         if len(data) - offset < 2:
             n = offset + 2 - len(data)
@@ -248,11 +250,12 @@ def validate_data(data, state, warn=False, force=True):
 
     first_t = True
     try:
-        file_header = FileHeader(data)
-        file_header.validate(data, log)
+        view = memoryview(bytes(data))
+        file_header = FileHeader(view)
+        file_header.validate(view, log)
         offset = len(file_header)
-        while len(data) - offset > 2:
-            token = token_factory(data[offset:], state)
+        while len(view) - offset > 2:
+            token = token_factory(view[offset:], state)
             if first_t and state.timestamp:
                 log.info('First timestamp: %s' % state.timestamp)
                 first_t = False
@@ -263,8 +266,8 @@ def validate_data(data, state, warn=False, force=True):
         log.info('Last timestamp:  %s' % state.timestamp)
         if state.timestamp > dt.datetime.now(tz=dt.timezone.utc):
             log.warning('Timestamp in future')
-        checksum = Checksum(data[offset:])
-        checksum.validate(data, log)
+        checksum = Checksum(view[offset:])
+        checksum.validate(view, log)
         log.info('OK')
     except Exception as e:
         log.error(e)
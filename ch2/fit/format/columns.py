@@ -0,0 +1,296 @@
+
+import datetime as dt
+from logging import getLogger
+
+import numpy as np
+
+from ..profile.fields import DynamicField, CompositeField, TypedField
+from ..profile.types import StructSupport, Mapping, Date, Date16
+
+log = getLogger(__name__)
+
+'''
+Decode FIT data messages directly into numpy arrays.
+
+Definitions whose fields all have simple binary types (typically record and monitoring messages) are
+decoded in bulk, a column at a time, with bad values, scale and offset handled by vector operations.
+Anything else (dynamic, accumulated and array fields, strings, etc) is parsed as a record in the usual
+way and the values copied into the columns.
+'''
+
+FIT_EPOCH = 631065600  # 1989-12-31 in unix seconds
+FLOAT, TIME, OBJECT = 'f8', 'M8[s]', 'O'
+MISSING = {FLOAT: np.nan, TIME: np.datetime64('NaT'), OBJECT: None}
+
+
+def _view(buffer, n, defn, start, dtype):
+    # a column of values (one from each message) within the concatenated data
+    return np.ndarray((n,), dtype=dtype, buffer=buffer, offset=start, strides=(defn.size,))
+
+
+def _unsigned(defn, field):
+    return '<>'[defn.endian] + 'u%d' % field.size
+
+
+class Extractor:
+    '''
+    Extract a single named column from the bytes of one Field.
+    '''
+
+    def __init__(self, name, units, field, kind):
+        self.name = name
+        self.units = units
+        self.field = field
+        self.kind = kind
+
+    def _bad(self, buffer, n, defn, type):
+        bad = int.from_bytes(type.bad_bytes(defn.endian), byteorder=['little', 'big'][defn.endian])
+        return _view(buffer, n, defn, self.field.start, _unsigned(defn, self.field)) == bad
+
+
+class Scalar(Extractor):
+    '''
+    A typed field with a single value (possibly a mapping or date).
+    '''
+
+    def __init__(self, field, type, base_type):
+        kind = OBJECT if isinstance(type, Mapping) else (TIME if isinstance(type, Date) else FLOAT)
+        super().__init__(field.name, field.field._units, field, kind)
+        self.__type = type
+        self.__base_type = base_type
+
+    def __call__(self, buffer, n, defn):
+        field, base_type = self.field.field, self.__base_type
+        values = _view(buffer, n, defn, self.field.start, '<>'[defn.endian] + base_type.struct_code)
+        bad = self._bad(buffer, n, defn, base_type)
+        if self.kind == TIME:
+            values = (values.astype(np.int64) + FIT_EPOCH).astype(TIME)
+        else:
+            values = values.astype(np.float64)
+            if not ((field._scale == 1 and field._offset == 0) or base_type.name == 'enum'):
+                values = values / field._scale - field._offset
+            if self.kind == OBJECT:
+                lookup = dict((value, self.__type.safe_internal_to_profile(int(value))) for value in np.unique(values))
+                values = np.array([lookup[value] for value in values], dtype=object)
+        values[bad] = MISSING[self.kind]
+        return values
+
+
+class Component(Extractor):
+    '''
+    One of the components of a composite field (bits extracted and then scaled).
+    '''
+
+    def __init__(self, field, component, delegate, shift, n_bits):
+        super().__init__(component.name, component._units, field, FLOAT)
+        self.__component = component
+        self.__delegate = delegate
+        self.__shift = shift
+        self.__n_bits = n_bits
+
+    def __call__(self, buffer, n, defn):
+        bits = _view(buffer, n, defn, self.field.start, _unsigned(defn, self.field)).astype(np.uint64)
+        values = ((bits >> np.uint64(self.__shift)) & np.uint64((1 << self.__n_bits) - 1)).astype(np.float64)
+        scale, offset = self.__component._scale, self.__component._offset
+        if not ((scale == 1 and offset == 0) or self.__delegate.type.name == 'enum'):
+            values = values / scale - offset
+        values[self._bad(buffer, n, defn, self.field.field.type)] = np.nan
+        return values
+
+
+def _is_simple(type):
+    return isinstance(type, StructSupport) and type.struct_code is not None
+
+
+def _scalar(defn, field, accumulators):
+    type = field.field.type
+    base_type = type.base_type if isinstance(type, Mapping) else type
+    if field.name in accumulators or not _is_simple(base_type) or base_type.struct_code != field.base_type.struct_code:
+        return None
+    if isinstance(type, Date16):
+        return None  # depends on the current timestamp
+    return [Scalar(field, type, base_type)]
+
+
+def _components(defn, field, accumulators):
+    extractors, shift = [], 0
+    if not _is_simple(field.field.type) or field.field.type.struct_code != field.base_type.struct_code or \
+            field.size not in (1, 2, 4, 8):
+        return None
+    for n_bits, component in field.field._components:
+        try:
+            delegate = defn.message.profile_to_field(component.name)
+        except KeyError:
+            return None
+        if component.name in accumulators or isinstance(delegate, (DynamicField, CompositeField)) or \
+                not isinstance(delegate, TypedField) or not _is_simple(delegate.type) or \
+                isinstance(delegate.type, Date) or not delegate.type.struct_code.isupper() or \
+                (n_bits + 7) // 8 > delegate.type.n_bytes:
+            return None
+        extractors.append(Component(field, component, delegate, shift, n_bits))
+        shift += n_bits
+    return extractors
+
+
+def extractors(defn, accumulators):
+    '''
+    The extractors for a definition, or None if it cannot be decoded in bulk.
+    '''
+    result = []
+    for field in defn.fields:
+        if not field.field or field is defn.timestamp_field:
+            continue  # unknown fields are dropped; timestamps come from the token
+        if field.count != 1 or not field.values:
+            return None
+        if isinstance(field.field, DynamicField):
+            return None
+        elif isinstance(field.field, CompositeField):
+            extracted = _components(defn, field, accumulators)
+        elif isinstance(field.field, TypedField):
+            extracted = _scalar(defn, field, accumulators)
+        else:
+            extracted = None
+        if extracted is None:
+            return None
+        result.extend(extracted)
+    names = [extractor.name for extractor in result]
+    if len(names) != len(set(names)):
+        return None  # would need merging
+    return result
+
+
+def _kind(value):
+    if isinstance(value, dt.datetime):
+        return TIME
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        return FLOAT
+    else:
+        return OBJECT
+
+
+def _convert(value, kind):
+    if kind == TIME:
+        if value.tzinfo:
+            value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        return np.datetime64(value, 's')
+    return value
+
+
+def _timestamp(timestamp):
+    return np.datetime64('NaT') if timestamp is None else \
+        np.datetime64(timestamp.astimezone(dt.timezone.utc).replace(tzinfo=None), 's')
+
+
+class Bulk:
+    '''
+    The data for a single definition, decoded together.
+    '''
+
+    def __init__(self, defn, extractors):
+        self.__defn = defn
+        self.__extractors = extractors
+        self.__data = []
+        self.rows = []
+
+    def add(self, row, token):
+        self.rows.append(row)
+        self.__data.append(token.data)
+
+    def columns(self):
+        buffer, n = b''.join(self.__data), len(self.__data)
+        for extractor in self.__extractors:
+            yield extractor.name, extractor.units, extractor.kind, extractor(buffer, n, self.__defn)
+
+
+class MessageColumns:
+    '''
+    Accumulate the data for a single message (by name) and then assemble a structured array.
+    '''
+
+    def __init__(self, state, field_names=None, warn=False):
+        self.__state = state
+        self.__field_names = field_names
+        self.__warn = warn
+        self.__bulk = {}
+        self.__records = []
+        self.__timestamps = []
+
+    def add(self, token):
+        row = len(self.__timestamps)
+        self.__timestamps.append(token.timestamp)
+        defn = token.definition
+        if defn not in self.__bulk:
+            extracted = extractors(defn, self.__state.accumulators)
+            if extracted is None:
+                log.debug(f'Cannot decode {defn.identity} in bulk')
+            self.__bulk[defn] = None if extracted is None else Bulk(defn, extracted)
+        bulk = self.__bulk[defn]
+        if bulk:
+            bulk.add(row, token)
+        else:
+            # parse now so that any accumulators are updated in order
+            record = token.parse_token(warn=self.__warn).force()
+            skip = ('timestamp', defn.timestamp_field.name if defn.timestamp_field else None)
+            self.__records.append((row, [(name, values if len(values) > 1 else values[0], units)
+                                         for name, (values, units) in record.data.items()
+                                         if values is not None and name not in skip and not name.startswith('@')]))
+
+    def __wanted(self, name):
+        return not self.__field_names or name in self.__field_names
+
+    def array(self):
+        columns, kinds, units = [], {}, {}
+
+        def note(name, unit, kind):
+            if name not in kinds:
+                kinds[name], units[name] = kind, unit
+            elif kinds[name] != kind:
+                kinds[name] = OBJECT
+
+        for bulk in self.__bulk.values():
+            if bulk:
+                for name, unit, kind, values in bulk.columns():
+                    if self.__wanted(name):
+                        note(name, unit, kind)
+                        columns.append((bulk.rows, name, values))
+        for row, values in self.__records:
+            for name, value, unit in values:
+                if self.__wanted(name):
+                    note(name, unit, _kind(value))
+
+        array = np.empty(len(self.__timestamps), dtype=[('timestamp', TIME)] + list(kinds.items()))
+        array['timestamp'] = [_timestamp(timestamp) for timestamp in self.__timestamps]
+        for name, kind in kinds.items():
+            array[name] = MISSING[kind]
+        for rows, name, values in columns:
+            if kinds[name] == OBJECT and values.dtype != object:
+                values = np.array([None if value != value else value for value in values.tolist()], dtype=object)
+            array[name][rows] = values
+        for row, values in self.__records:
+            for name, value, unit in values:
+                if self.__wanted(name):
+                    array[name][row] = _convert(value, kinds[name])
+        return array, units
+
+
+class Columns:
+    '''
+    Accumulate tokens for the given message names.
+    '''
+
+    def __init__(self, state, record_names, field_names=None, warn=False):
+        self.__state = state
+        self.__warn = warn
+        self.__messages = dict((name, MessageColumns(state, field_names=field_names, warn=warn))
+                               for name in record_names)
+
+    def add(self, token):
+        if token.is_user:
+            name = token.definition.message.name
+            if name in self.__messages:
+                self.__messages[name].add(token)
+            elif self.__state.accumulators:
+                token.parse_token(warn=self.__warn).force()
+
+    def arrays(self):
+        return dict((name, message.array()) for name, message in self.__messages.items())
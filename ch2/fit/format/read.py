@@ -1,5 +1,6 @@
 from logging import getLogger
 
+from .columns import Columns
 from .records import restrict_names
 from .tokens import State, FileHeader, token_factory, Checksum
 from ..profile.profile import read_profile
@@ -11,21 +12,23 @@ log = getLogger(__name__)
 def parse_data(data, types, messages, no_validate=False, max_delta_t=None):
 
     state = State(types, messages, max_delta_t=max_delta_t)
+    # tokens slice a shared view, so each token costs its own length rather than the rest of the file
+    view = memoryview(data)
 
     def generator():
         offset = 0
         try:
-            file_header = FileHeader(data[offset:])
+            file_header = FileHeader(view[offset:])
             yield offset, file_header
             offset = len(file_header)
-            file_header.validate(data, log, quiet=no_validate)
-            while len(data) - offset > 2:
-                token = token_factory(data[offset:], state)
+            file_header.validate(view, log, quiet=no_validate)
+            while len(view) - offset > 2:
+                token = token_factory(view[offset:], state)
                 yield offset, token
                 offset += len(token)
-            checksum = Checksum(data[offset:])
+            checksum = Checksum(view[offset:])
             yield offset, checksum
-            checksum.validate(data, log, quiet=no_validate)
+            checksum.validate(view, log, quiet=no_validate)
         except Exception as e:
             log.warning('"%s" at offset %d' % (e, offset))
             dump(data, offset)
@@ -95,3 +98,22 @@ def filtered_records(data,
                 yield i, offset, record
 
     return types, messages, generator()
+
+
+def filtered_columns(data, record_names, field_names=None,
+                     warn=False, no_validate=False, max_delta_t=None, profile_path=None):
+    '''
+    Decode all messages with the given names into numpy structured arrays (in file order), with one column
+    per field plus the message timestamp.  Numeric values are floats (scaled and offset), with NaN for bad
+    values.  Mappings are objects (usually strings) and dates are datetime64 (UTC).
+
+    Returns types, messages, and a map from message name to (array, units), where units is a map from
+    field name to units.
+    '''
+
+    types, messages = read_profile(warn=warn, profile_path=profile_path)
+    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t)
+    columns = Columns(state, record_names, field_names=field_names, warn=warn)
+    for offset, token in tokens:
+        columns.add(token)
+    return types, messages, columns.arrays()
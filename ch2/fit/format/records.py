@@ -187,6 +187,10 @@ class DictRecord(Record):
         self.value = Values(self.attr)
         return self
 
+    def __reduce__(self):
+        # attr is rebuilt on unpickling (the namedtuple classes are created dynamically)
+        return DictRecord, tuple(self)
+
     def data_with(self, **kargs):
         return it.chain(self.data.items(), kargs.items())
 
@@ -1,9 +1,12 @@
 
 from abc import abstractmethod
 from collections import defaultdict, Counter
+from functools import lru_cache
 from logging import getLogger
 from re import sub
-from struct import unpack, pack
+from struct import unpack, pack, Struct
+
+import numpy as np
 
 from .records import LazyRecord, merge_duplicates
 from ..profile.fields import TypedField, TIMESTAMP_GLOBAL_TYPE, DynamicField, CompositeField
@@ -41,7 +44,8 @@ class Token:
 
     tag - a simple string describing the type of token (HDR etc)
     is_user - does this contain user data? (alternatively, it;s internal data for parsing)
-    data - the bytes from the input file.
+    data - the bytes from the input file.  usually a memoryview into the data for the whole file, so
+           tokens are created without copying (and, when fixing, can be modified in place).
     '''
 
     __slots__ = ('tag', 'is_user', 'data')
@@ -344,6 +348,7 @@ class Field:
         # set by definition later
         self.start = 0
         self.finish = 0
+        self.values = None  # slice of the values decoded by Definition.struct (if they can be used)
 
 
 class Definition(Token):
@@ -367,6 +372,7 @@ class Definition(Token):
         self.identity = Identity(self.message.name, state.definition_counter)
         self.fields = self.__process_fields(self._make_fields(data, state), state)
         self.accumulators = state.accumulators
+        self.struct = self.__compile()
         super().__init__(tag, False, data[0:overhead+3*len(self.fields)])
         state.definitions[self.local_message_type] = self
 
@@ -400,8 +406,26 @@ class Definition(Token):
                 if isinstance(field.field, DynamicField):
                     self.references.update(field.field.references)
         self.size = offset
+        self.__unsorted = fields
         return tuple(self.__sorted(fields))
 
+    def __compile(self):
+        '''
+        A single struct that decodes all fields in the message (in the order they appear in the data).
+        Data tokens can then be decoded with one call; fields without a simple binary type are left as bytes.
+        '''
+        formats, index = ['<>'[self.endian], 'x'], 0  # skip header
+        for field in self.__unsorted:
+            code = field.base_type.struct_code
+            if code and field.count and field.count * field.base_type.n_bytes == field.size:
+                formats.append('%d%s' % (field.count, code))
+                field.values = slice(index, index + field.count)
+                index += field.count
+            else:
+                formats.append('%ds' % field.size)
+                index += 1
+        return Struct(''.join(formats))
+
     def __provided_by(self, field):
         yield field.name
         if isinstance(field.field, CompositeField):
@@ -458,8 +482,8 @@ class Definition(Token):
     def parse_token(self, raw_data=False, **options):
         data = {'local_message_type': ((self.data[0:1],
                                         str(self.local_message_type)), '') if raw_data else self.local_message_type,
-                'reserved': self.data[1:2],
-                'architecture': self.data[2:3],
+                'reserved': bytes(self.data[1:2]),
+                'architecture': bytes(self.data[2:3]),
                 'message_number': ((self.data[3:5], self.message.name), '') if raw_data else self.global_message_no,
                 'no_of_fields': self.data[5:6] if raw_data else self.data[5]}
         if not raw_data:
@@ -502,23 +526,66 @@ class DeveloperDefinition(Definition):
             yield '  %s - dev fld %d/%d' % (tohex(field_data), fdn, ddi)
 
 
+def _crc_table():
+    # the standard FIT (CRC-16/ARC) table, generated from the reflected polynomial
+    table = []
+    for byte in range(256):
+        checksum = byte
+        for _ in range(8):
+            checksum = (checksum >> 1) ^ (0xA001 if checksum & 1 else 0)
+        table.append(checksum)
+    return table
+
+
+CRC_TABLE = _crc_table()
+CRC_CHUNK = 256
+CRC_CHUNKED = 32 * 1024  # below this size the byte-at-a-time loop is faster
+
+
+def _crc_lanes(checksums, data):
+    # advance many independent checksums in parallel, one byte from each row of data at a time
+    table = np.array(CRC_TABLE, dtype=np.uint16)
+    for column in data.T:
+        checksums = (checksums >> 8) ^ table[(checksums ^ column) & 0xff]
+    return checksums
+
+
+@lru_cache(maxsize=1)
+def _crc_zeros():
+    # the effect of a chunk of zeros on each possible low and high byte of a checksum
+    byte, zeros = np.arange(256, dtype=np.uint16), np.zeros((256, CRC_CHUNK), dtype=np.uint16)
+    return _crc_lanes(byte, zeros).tolist(), _crc_lanes(byte << 8, zeros).tolist()
+
+
+def _crc_chunked(data):
+    # the CRC is linear (with zero initial value and no final xor), so the data can be split into chunks that
+    # are processed in parallel and then combined: crc(a + b) = zeros(crc(a), len(b)) ^ crc(b), where
+    # zeros(c, n) is the effect of n zero bytes on checksum c (itself linear, so tabulated for each byte of c).
+    data = np.frombuffer(data, dtype=np.uint8)
+    n_lanes = len(data) // CRC_CHUNK
+    lanes = _crc_lanes(np.zeros(n_lanes, dtype=np.uint16),
+                       data[:n_lanes * CRC_CHUNK].reshape(n_lanes, CRC_CHUNK).astype(np.uint16))
+    low, high = _crc_zeros()
+    checksum = 0
+    for lane in lanes.tolist():
+        checksum = low[checksum & 0xff] ^ high[checksum >> 8] ^ lane
+    return _crc_bytes(data[n_lanes * CRC_CHUNK:].tolist(), checksum)
+
+
+def _crc_bytes(data, checksum=0):
+    for byte in data:
+        checksum = (checksum >> 8) ^ CRC_TABLE[(checksum ^ byte) & 0xff]
+    return checksum
+
+
 class Checksum(ValidateToken):
 
     @staticmethod
     def crc(data):
-
-        CRC = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
-               0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
-
-        checksum = 0
-        for byte in data:
-            tmp = CRC[checksum & 0xf]
-            checksum = (checksum >> 4) & 0xfff
-            checksum = checksum ^ tmp ^ CRC[byte & 0xf]
-            tmp = CRC[checksum & 0xf]
-            checksum = (checksum >> 4) & 0xfff
-            checksum = checksum ^ tmp ^ CRC[(byte >> 4) & 0xf]
-        return checksum
+        if len(data) < CRC_CHUNKED or isinstance(data, list):
+            return _crc_bytes(data)
+        else:
+            return _crc_chunked(data)
 
     def __init__(self, data):
         super().__init__('CRC', False, data)
@@ -541,6 +608,7 @@ class Checksum(ValidateToken):
 
 
 def token_factory(data, state):
+    # data should be a memoryview (or similar) starting at the token - slicing bytes would copy the rest of the file
     header = data[0]
     if header & 0x80:
         return CompressedTimestamp(data, state)
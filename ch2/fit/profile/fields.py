@@ -111,7 +111,8 @@ class CompositeField(Zip, TypedField):
             field.register_accumulator(accumulators)
 
     def parse_field(self, data, count, endian, timestamp, references, message,
-                    rtn_composite=False, check_bad=True, n_bits=None, **options):
+                    rtn_composite=False, check_bad=True, n_bits=None, raw=None, **options):
+        # raw (pre-decoded) values are for the composite as a whole, so are dropped here
         if check_bad and self.type.is_bad(data, count, endian):
             yield self.name, (None, self._units)
         else:
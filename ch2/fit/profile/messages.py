@@ -1,7 +1,6 @@
 
 from .fields import Row, MessageField, TypedField
-from .support import Named
-from .support import Rows
+from .support import Named, Rows, LazyDict, AliasDict
 from ..format.records import LazyRecord
 from ...lib.data import WarnDict
 
@@ -50,17 +49,21 @@ class Message(Named):
             if name in defn.references and value[0] is not None:
                 references[name] = value
             yield name, value
+        # a single call decodes all fields; each field then takes its slice of the values
+        values = defn.struct.unpack_from(data)
         for field in defn.fields:
             bytes = data[field.start:field.finish]
+            raw = (field.base_type.struct_code, values[field.values]) if field.values else None
             if field.field:
                 for name, value in self._parse_field(
-                        field.field, bytes, field.count, defn.endian, timestamp, references, self, **options):
+                        field.field, bytes, field.count, defn.endian, timestamp, references, self,
+                        raw=raw, **options):
                     if name in defn.references and value[0] is not None:
                         references[name] = value
                     yield name, value
             else:
                 name = '@%d:%d' % (field.start, field.finish)
-                value = (field.base_type.parse_type(bytes, field.count, defn.endian, timestamp), None)
+                value = (field.base_type.parse_type(bytes, field.count, defn.endian, timestamp, raw=raw), None)
                 yield name, value
 
     def _parse_field(self, field, bytes, count, endian, timestamp, references, message, **options):
@@ -107,6 +110,15 @@ class Messages:
         except AttributeError:
             pass
 
+    def compact(self, log, types, shared):
+        '''
+        Pickle messages individually so that they are only unpickled when used.
+        '''
+        aliases = dict((message.number, name) for name, message in self.__profile_to_message.items()
+                       if hasattr(message, 'number'))
+        self.__profile_to_message = LazyDict(log, types, self.__profile_to_message, shared)
+        self.__number_to_message = AliasDict(self.__profile_to_message, aliases)
+
     def profile_to_message(self, name):
         return self.__profile_to_message[name]
 
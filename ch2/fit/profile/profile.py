@@ -63,6 +63,9 @@ def pickle_profile(in_path, warn=False):
     nlog, types, messages = read_external_profile(in_path, warn=warn)
     out_path = join(dirname(__file__), PROFILE_NAME)
     nlog.set_log(None)
+    shared = types.shared(nlog)
+    messages.compact(nlog, types, shared)
+    types.compact(nlog, shared)
     log.info('Writing to %s' % out_path)
     with open(out_path, 'wb') as output:
         dump((nlog, types, messages), output)
@@ -1,4 +1,7 @@
 
+from io import BytesIO
+from pickle import Pickler, Unpickler
+
 
 class NullableLog:
 
@@ -81,4 +84,86 @@ class Rows:
             return
 
 
+class LazyDict:
+    '''
+    A (partial) dict whose values are pickled individually and only unpickled (then cached) on first access.
+
+    This is used for the internal profile so that reading a FIT file only pays for the types and messages
+    that it uses.  Shared objects (the log and the types, which are pickled with the profile as a whole)
+    are pickled as persistent ids and resolved via the Types instance when the value is unpickled.
+
+    shared - map from id(object) to persistent id for shared objects (see Types.shared)
+    eager - predicate for values that are not worth pickling separately
+    '''
+
+    def __init__(self, log, types, values, shared, eager=None):
+        self.__log = log
+        self.__types = types
+        self.__values = {}
+        self.__pickled = {}
+        for key, value in values.items():
+            if eager and eager(value):
+                self.__values[key] = value
+            else:
+                self.__pickled[key] = self.__dumps(value, shared)
+
+    def __dumps(self, value, shared):
+        output = BytesIO()
+        pickler = Pickler(output)
+        pickler.persistent_id = lambda obj: None if obj is value else shared.get(id(obj), None)
+        pickler.dump(value)
+        return output.getvalue()
+
+    def __loads(self, data):
+        unpickler = Unpickler(BytesIO(data))
+        unpickler.persistent_load = self.__resolve
+        return unpickler.load()
+
+    def __resolve(self, pid):
+        kind, name = pid
+        if kind == 'log':
+            return self.__log
+        elif kind == 'type':
+            return self.__types.profile_to_type(name)
+        else:
+            raise Exception('Unexpected persistent id %s' % (pid,))
+
+    def __getitem__(self, key):
+        try:
+            return self.__values[key]
+        except KeyError:
+            self.__values[key] = self.__loads(self.__pickled.pop(key))
+            return self.__values[key]
+
+    def __setitem__(self, key, value):
+        self.__pickled.pop(key, None)
+        self.__values[key] = value
+
+    def __contains__(self, key):
+        return key in self.__values or key in self.__pickled
+
+
+class AliasDict:
+    '''
+    A view of another dict through different keys (eg message numbers for messages keyed by name).
+
+    Values that are set directly are stored separately, so they never appear under (or mask) the keys
+    of the underlying dict.
+    '''
+
+    def __init__(self, values, aliases):
+        self.__values = values
+        self.__aliases = aliases
+        self.__extra = {}
+
+    def __getitem__(self, key):
+        if key in self.__aliases:
+            return self.__values[self.__aliases[key]]
+        else:
+            return self.__extra[key]
+
+    def __setitem__(self, key, value):
+        self.__extra[key] = value
 
+    def __contains__(self, key):
+        return key in self.__aliases or key in self.__extra
@@ -5,7 +5,7 @@ from collections import namedtuple
 from re import compile
 from struct import unpack, pack
 
-from .support import Named, Rows
+from .support import Named, Rows, LazyDict
 from ...lib.data import WarnDict, WarnList
 
 LITTLE, BIG = 0, 1
@@ -16,6 +16,9 @@ class AbstractType(Named):
     Root class for any kind of type in the system.
     '''
 
+    # single character struct code when values can be decoded in bulk (see Definition in tokens.py)
+    struct_code = None
+
     def __init__(self, log, name, n_bytes, base_type=None):
         super().__init__(log, name)
         self.base_type = base_type
@@ -62,6 +65,8 @@ class StructSupport(SimpleType):
         return bad
 
     def _all_bad(self, data, bad, count):
+        if count == 1:  # common case
+            return bad == data[:self.n_bytes]
         return all(bad == data[self.n_bytes*i:self.n_bytes*(i+1)] for i in range(count))
 
     # currently this ignores scale and offset!!!
@@ -69,8 +74,10 @@ class StructSupport(SimpleType):
         return pack(formats[endian] % count, *values)
 
     # scale and offset have to be at this level because of how bad values when count > 1 are handled
+    # raw is (struct_code, values) when the whole message was decoded in one call.  the values are only used
+    # if the code matches this type (the profile can disagree with the base type given in the file).
     def _unpack(self, data, formats, bad, count, endian, scale=1, offset=0, check_bad=True,
-                name=None, accumulators=None, n_bits=None, **options):
+                name=None, accumulators=None, n_bits=None, raw=None, **options):
         if check_bad and self._all_bad(data, bad[endian], count):
             return None
         elif accumulators and name in accumulators:
@@ -79,10 +86,16 @@ class StructSupport(SimpleType):
             return self.__unpack_acc(bytearray(data[:self.n_bytes]), formats[endian] % 1, scale, offset,
                                      name, accumulators, n_bits, endian)
         else:
+            if raw is not None and (raw[0] != self.struct_code or len(raw[1]) != count):
+                raw = None
             if (scale == 1 and offset == 0) or self.name == 'enum':   # enums are not scaled
                 # fast and preserves integers
+                if raw is not None:
+                    return raw[1]
                 return unpack(formats[endian] % count, data[:self.n_bytes * count])
             elif count == 1:  # if no check, scale single bad values
+                if raw is not None:
+                    return (raw[1][0] / scale - offset,)
                 return (unpack(formats[endian] % 1, data[:self.n_bytes])[0] / scale - offset,)
             else:  # match weird CSV behaviour
                 return tuple(self.__unpack_scaled(data[self.n_bytes*i:self.n_bytes*(i+1)], formats[endian],
@@ -209,6 +222,13 @@ class AutoInteger(StructSupport):
         self.__formats = ['<%d' + format, '>%d' + format]
         self.__bad = self._pack_bad(0 if match.group(3) == 'z' else 2 ** (n_bits - (1 if self.signed else 0)) - 1)
 
+    @property
+    def struct_code(self):
+        return self.__formats[LITTLE][-1]
+
+    def bad_bytes(self, endian):
+        return bytes(self.__bad[endian])
+
     @staticmethod
     def int(cell):
         if isinstance(cell, int):
@@ -333,6 +353,13 @@ class AutoFloat(StructSupport):
         self.__formats = ['<%d' + format, '>%d' + format]
         self.__bad = self._pack_bad(2 ** n_bits - 1)
 
+    @property
+    def struct_code(self):
+        return self.__formats[LITTLE][-1]
+
+    def bad_bytes(self, endian):
+        return bytes(self.__bad[endian])
+
     def is_bad(self, bytes, count, endian):
         return self._all_bad(bytes, self.__bad[endian], count)
 
@@ -436,6 +463,21 @@ class Types:
         else:
             self.__profile_to_type[type.name] = type
 
+    def shared(self, log):
+        '''
+        Persistent ids for the objects shared between pickled values (see LazyDict).
+        '''
+        shared = dict((id(type), ('type', name)) for name, type in self.__profile_to_type.items())
+        shared[id(log)] = ('log', None)
+        return shared
+
+    def compact(self, log, shared):
+        '''
+        Pickle mappings individually so that they are only unpickled when used.
+        '''
+        self.__profile_to_type = LazyDict(log, self, self.__profile_to_type, shared,
+                                          eager=lambda type: not isinstance(type, Mapping))
+
     def is_type(self, name):
         return name in self.__profile_to_type
 
@@ -127,6 +127,11 @@ def time_to_local_time(time, fmt=YMD_HMS):
     return time.astimezone(tz=None).strftime(fmt)
 
 
+def times_to_local_times(times, fmt=YMD_HMS):
+    # vectorized equivalent of the above for a (timezone aware) pandas DatetimeIndex
+    return times.tz_convert(p.tz.get_local_timezone().name).strftime(fmt)
+
+
 def local_time_to_time(time):
     for format in ALL_DATE_FORMATS:
         try:
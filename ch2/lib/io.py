@@ -1,12 +1,12 @@
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import md5
 from logging import getLogger
 from os import stat
 from shutil import get_terminal_size
 from time import time
 
-from sqlalchemy import desc
-
 from .date import to_time
 from ..squeal.tables.fit import FileScan
 from ..squeal.utils import add
@@ -35,37 +35,64 @@ def md5_hash(file_path):
     return hash.hexdigest()
 
 
+def _metadata(stat):
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+def _hashes(paths, stats, scans, max_workers=4):
+    # only hash files whose metadata have changed since the last scan (hashing is io bound so use threads)
+    hashes, changed = {}, []
+    for path in paths:
+        scan = scans.get(path)
+        if scan and scan.md5_hash and (scan.mtime, scan.size, scan.inode) == _metadata(stats[path]):
+            hashes[path] = scan.md5_hash
+        else:
+            changed.append(path)
+    if changed:
+        log.debug(f'Hashing {len(changed)} new or modified files')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            hashes.update(zip(changed, executor.map(md5_hash, changed)))
+    return hashes
+
+
 def filter_modified_files(s, paths, owner, force=False):
 
     modified = []
+    stats = dict((file_path, stat(file_path)) for file_path in paths)
+    scans = dict((scan.path, scan) for scan in s.query(FileScan).filter(FileScan.owner == owner).all())
+    hashes = _hashes(paths, stats, scans)
+    by_hash = defaultdict(list)
+    for scan in scans.values():
+        by_hash[scan.md5_hash].append(scan)
 
     for file_path in paths:
 
-        last_modified = to_time(stat(file_path).st_mtime)
-        hash = md5_hash(file_path)
-        path_scan = s.query(FileScan). \
-            filter(FileScan.path == file_path,
-                   FileScan.owner == owner).one_or_none()
+        last_modified = to_time(stats[file_path].st_mtime)
+        hash = hashes[file_path]
+        path_scan = scans.get(file_path)
 
         # get last scan and make sure it's up-to-date
         if path_scan:
             if hash != path_scan.md5_hash:
-                log.warning('File at %s appears to have changed since last read on %s')
+                log.warning('File at %s appears to have changed since last read on %s' %
+                            (file_path, path_scan.last_scan))
+                by_hash[path_scan.md5_hash].remove(path_scan)
+                by_hash[hash].append(path_scan)
                 path_scan.md5_hash = hash
-                path_scan.last_scan = 0.0
+                path_scan.last_scan = to_time(0.0)
         else:
             # need to_time here because it's not roundtripped via the database to convert for use below
             path_scan = add(s, FileScan(path=file_path, owner=owner,
                                         md5_hash=hash, last_scan=to_time(0.0)))
-            s.flush()  # want this to appear in queries below
+            scans[file_path] = path_scan
+            by_hash[hash].append(path_scan)
+        path_scan.mtime, path_scan.size, path_scan.inode = _metadata(stats[file_path])
 
         # only look at hash if we are going to process anyway
-        if force or last_modified > path_scan.last_scan:
+        if force or last_modified > to_time(path_scan.last_scan):
 
-            hash_scan = s.query(FileScan). \
-                filter(FileScan.md5_hash == hash,
-                       FileScan.owner == owner).\
-                order_by(desc(FileScan.last_scan)).limit(1).one()  # must exist as path_scan is a candidate
+            # must exist as path_scan is a candidate
+            hash_scan = max(by_hash[hash], key=lambda scan: to_time(scan.last_scan))
             if hash_scan.path != path_scan.path:
                 log.warning('Ignoring duplicate file (details in debug log)')
                 log.debug('%s' % file_path)
@@ -73,7 +100,7 @@ def filter_modified_files(s, paths, owner, force=False):
                 # update the path to avoid triggering in future
                 path_scan.last_scan = hash_scan.last_scan
 
-            if force or last_modified > hash_scan.last_scan:
+            if force or last_modified > to_time(hash_scan.last_scan):
                 modified.append(file_path)
 
     s.commit()
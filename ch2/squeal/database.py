@@ -10,6 +10,7 @@ from sqlalchemy.sql.functions import count
 
 from . import *
 from .support import Base
+from .tables.statistic import clear_name_cache
 from ..commands.args import DATABASE, NamespaceWithVariables, NO_OP, make_parser
 from ..lib.log import make_log
 
@@ -19,7 +20,7 @@ ActivityGroup, ActivityJournal, ActivityTimespan, ActivityBookmark
 Topic, TopicJournal, TopicField,
 StatisticName, StatisticJournal, StatisticJournalInteger, StatisticJournalFloat, StatisticJournalText, StatisticMeasure
 Segment, SegmentJournal
-Pipeline
+Pipeline, PipelineCost, PipelineProfile
 MonitorJournal
 Constant, SystemConstant, SystemProcess
 ActivitySimilarity, ActivityNearby
@@ -66,14 +67,26 @@ class Database:
     def __init__(self, args):
         self.path = args.file(DATABASE)
         log.info('Using database at %s' % self.path)
+        self.__connect()
+        self.__create_tables()
+
+    def __connect(self):
         self.engine = create_engine('sqlite:///%s' % self.path, echo=False)
         self.session = sessionmaker(bind=self.engine)
-        self.__create_tables()
+
+    def __getstate__(self):
+        # only the path is pickled, so that other processes (eg pipelines) make their own connections
+        return self.path
+
+    def __setstate__(self, path):
+        self.path = path
+        self.__connect()
 
     def __create_tables(self):
         if self.is_empty(tables=True):
             log.info('Creating tables')
             Base.metadata.create_all(self.engine)
+            clear_name_cache()  # in case a previous database had the same path
 
     @contextmanager
     def session_context(self):
@@ -5,10 +5,10 @@ from .kit import KitGroup, KitItem, KitComponent, KitModel
 from .system import SystemConstant, SystemProcess
 from .monitor import MonitorJournal
 from .nearby import ActivitySimilarity, ActivityNearby
-from .pipeline import Pipeline, PipelineType
+from .pipeline import Pipeline, PipelineType, PipelineCost, PipelineProfile, ProfileType
 from .segment import Segment, SegmentJournal
 from .source import Source, Interval, NoStatistics, Dummy, Composite, CompositeComponent
 from .statistic import StatisticName, StatisticJournalFloat, StatisticJournalText, StatisticJournalInteger, \
-    StatisticJournalTimestamp, StatisticJournal, StatisticMeasure, StatisticJournalType
+    StatisticJournalTimestamp, StatisticJournal, StatisticMeasure, StatisticJournalType, StatisticArray
 from .topic import TopicJournal, Topic, TopicField
 from .timestamp import Timestamp
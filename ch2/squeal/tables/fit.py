@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Text, Float, Integer
 
 from ..support import Base
 from ..types import Time, ShortCls
@@ -13,3 +13,7 @@ class FileScan(Base):
     owner = Column(ShortCls, nullable=False, primary_key=True)
     md5_hash = Column(Text, nullable=False, index=True)
     last_scan = Column(Time, nullable=False)
+    # file metadata when hashed - if these are unchanged we assume the hash is too
+    mtime = Column(Float)
+    size = Column(Integer)
+    inode = Column(Integer)
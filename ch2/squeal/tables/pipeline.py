@@ -2,10 +2,11 @@
 from enum import IntEnum
 from json import dumps
 
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, Float, ForeignKey, Text, func
 
 from ..support import Base
-from ..types import Cls, Json, Sort
+from ..types import Cls, Json, Sort, Time
+from ..utils import add
 
 
 class PipelineType(IntEnum):
@@ -43,3 +44,81 @@ class Pipeline(Base):
                 msg += f' with ID={id}'
             raise Exception(msg)
         yield from pipelines
+
+
+class PipelineCost(Base):
+    '''
+    Measured costs (in seconds) for a pipeline, exponentially smoothed over runs.
+
+    calc and write are per missing item (the write time is the time spent in loaders); startup is the
+    time before work starts (which is also the cost of starting a worker).
+    '''
+
+    __tablename__ = 'pipeline_cost'
+
+    pipeline_id = Column(Integer, ForeignKey('pipeline.id', ondelete='cascade'), primary_key=True)
+    startup = Column(Float, nullable=False)
+    calc = Column(Float)
+    write = Column(Float)
+    n = Column(Integer, nullable=False, server_default='0')  # number of runs that measured calc and write
+
+    SMOOTHING = 0.3  # weight given to the latest measurement
+
+    @classmethod
+    def get(cls, s, pipeline_id):
+        return s.query(PipelineCost).filter(PipelineCost.pipeline_id == pipeline_id).one_or_none()
+
+    @classmethod
+    def update(cls, s, pipeline_id, startup, calc=None, write=None):
+        '''
+        Include a new measurement (calc and write are None if there was nothing to process).
+        '''
+        cost = cls.get(s, pipeline_id)
+        if cost is None:
+            cost = add(s, PipelineCost(pipeline_id=pipeline_id, startup=startup, n=0))
+        else:
+            cost.startup = cls.__smooth(cost.startup, startup)
+        if calc is not None:
+            cost.calc = cls.__smooth(cost.calc, calc)
+            cost.write = cls.__smooth(cost.write, write)
+            cost.n = (cost.n or 0) + 1
+        s.commit()
+        return cost
+
+    @classmethod
+    def __smooth(cls, previous, latest):
+        if previous is None:
+            return latest
+        else:
+            return cls.SMOOTHING * latest + (1 - cls.SMOOTHING) * previous
+
+
+class ProfileType(IntEnum):
+
+    CALL = 0
+    SQL = 1
+
+
+class PipelineProfile(Base):
+    '''
+    Totals from a profiled run (see ch2 statistics --profile and stoats.profile.Profiler).
+
+    For calls, name is the method (times and statements include nested calls) and rows is the size of the
+    data returned (or loaded).  For SQL, name is the statement.
+    '''
+
+    __tablename__ = 'pipeline_profile'
+
+    id = Column(Integer, primary_key=True)
+    run = Column(Time, nullable=False, index=True)  # the start of the run
+    type = Column(Integer, nullable=False)
+    scope = Column(Text, nullable=False)  # short class name of the pipeline ('' for the whole run)
+    name = Column(Text, nullable=False)
+    calls = Column(Integer, nullable=False)
+    seconds = Column(Float, nullable=False)
+    rows = Column(Integer)
+    statements = Column(Integer)
+
+    @classmethod
+    def latest(cls, s):
+        return s.query(func.max(PipelineProfile.run)).scalar()
@@ -1,15 +1,19 @@
 
 import datetime as dt
 from enum import IntEnum
+from io import BytesIO
 from logging import getLogger
+from zlib import compress, decompress
 
-from sqlalchemy import Column, Integer, ForeignKey, Text, UniqueConstraint, Float, desc, asc, Index
+import numpy as np
+from sqlalchemy import Column, Integer, ForeignKey, Text, UniqueConstraint, Float, desc, asc, Index, event, \
+    LargeBinary
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import relationship, backref, reconstructor
+from sqlalchemy.orm import relationship, backref, reconstructor, Session
 
 from .source import Interval
 from ..support import Base
-from ..types import Time, ShortCls, NullStr
+from ..types import Time, ShortCls, NullStr, short_cls
 from ..utils import add
 from ...lib.date import format_seconds, local_date_to_time
 from ...lib.utils import sigfig
@@ -17,6 +21,40 @@ from ...stoats.names import KMH, PC, BPM, STEPS_UNITS, S, M, KG, W, KCAL, KJ, FF
 
 log = getLogger(__name__)
 
+# process-wide cache of statistic names for each database.
+# maps (name, owner, constraint) to (id, statistic_journal_type, units, summary).
+# entries are added only after a commit and the cache for a database is dropped if names are deleted or
+# modified via the ORM (see events below).  names created by other processes are found on a cache miss.
+# names deleted (or replaced) by other processes are not seen by the events, so ids from the cache are
+# checked against the database before they are used and the cache is reloaded if they are stale.
+# pipeline workers (which are forked, and so inherit the cache) also clear it when they start (see
+# stoats.pipeline).
+NAME_CACHE = {}
+
+
+def _name_key(name, owner, constraint):
+    # same conversions as the column types
+    return name, short_cls(owner), str(constraint)
+
+
+def _name_cache(s):
+    url = str(s.bind.url)
+    if url not in NAME_CACHE:
+        NAME_CACHE[url] = dict((_name_key(row.name, row.owner, row.constraint),
+                                (row.id, row.statistic_journal_type, row.units, row.summary))
+                               for row in s.query(StatisticName.id, StatisticName.name, StatisticName.owner,
+                                                  StatisticName.constraint, StatisticName.statistic_journal_type,
+                                                  StatisticName.units, StatisticName.summary).all())
+        log.debug(f'Cached {len(NAME_CACHE[url])} statistic names')
+    return NAME_CACHE[url]
+
+
+def clear_name_cache(s=None):
+    if s is None:
+        NAME_CACHE.clear()
+    else:
+        NAME_CACHE.pop(str(s.bind.url), None)
+
 
 class StatisticName(Base):
 
@@ -41,39 +79,97 @@ class StatisticName(Base):
 
     @classmethod
     def add_if_missing(cls, s, name, type, units, summary, owner, constraint):
+        id = cls.add_all_if_missing(s, [(name, type, units, summary, owner, constraint)])[0]
+        return s.query(StatisticName).get(id)
+
+    @classmethod
+    def add_all_if_missing(cls, s, definitions):
+        '''
+        Given (name, type, units, summary, owner, constraint) definitions, return the corresponding ids.
+
+        Names are found in the process-wide cache where possible.  Any that are missing are created (and any
+        changes to units or summary are saved) in a single transaction.
+        '''
+        keys = [_name_key(name, owner, constraint) for name, type, units, summary, owner, constraint in definitions]
+        ids = cls.__ids(s, keys, definitions)
+        if not cls.__check(s, keys, ids):
+            log.debug('Cached statistic names are stale')
+            clear_name_cache(s)
+            ids = cls.__ids(s, keys, definitions)
+        return ids
+
+    @classmethod
+    def __ids(cls, s, keys, definitions):
+        cache = _name_cache(s)
+        pending = [(key, definition) for key, definition in zip(keys, definitions)
+                   if key not in cache or cache[key][1:] != definition[1:4]]
+        if pending:
+            cls.__add_or_update(s, dict(pending).items())
+            cache = _name_cache(s)
+        return [cache[key][0] for key in keys]
+
+    @classmethod
+    def __check(cls, s, keys, ids):
+        # a single query to check that cached ids still exist (other processes may have changed names)
+        found = dict((row.id, _name_key(row.name, row.owner, row.constraint))
+                     for row in s.query(StatisticName.id, StatisticName.name, StatisticName.owner,
+                                        StatisticName.constraint).
+                     filter(StatisticName.id.in_(set(ids))).all())
+        return all(found.get(id) == key for id, key in zip(ids, keys))
+
+    @classmethod
+    def __add_or_update(cls, s, pending):
         s.commit()  # start new transaction here in case rollback
-        q = s.query(StatisticName). \
-            filter(StatisticName.name == name,
-                   StatisticName.owner == owner,
-                   StatisticName.constraint == constraint)
-        statistic_name = q.one_or_none()
-        if not statistic_name:
-            statistic_name = add(s, StatisticName(name=name, units=units, summary=summary, owner=owner,
-                                                  constraint=constraint, statistic_journal_type=type))
-            try:
-                s.flush()
-            except IntegrityError as e:  # worker may have created in parallel, so read
-                log.debug(f'Rollback for {e}')
-                s.rollback()
-                log.debug('Now trying retrieval...')
-                statistic_name = q.one()
-                log.debug('Retrieved')
-        else:
-            if statistic_name.statistic_journal_type != type:
-                raise Exception('Changing type on %s (%s -> %s)' %
-                                (statistic_name.name, statistic_name.statistic_journal_type, type))
-            if statistic_name.units != units:
-                log.warning('Changing units on %s (%s -> %s)' % (statistic_name.name, statistic_name.units, units))
-                statistic_name.units = units
-                s.flush()
-            if statistic_name.summary != summary:
-                log.warning('Changing summary on %s (%s -> %s)' % (statistic_name.name, statistic_name.summary, summary))
-                statistic_name.summary = summary
-                s.flush()
-        return statistic_name
+        try:
+            added = cls.__add_or_update_tx(s, pending)
+            s.commit()
+        except IntegrityError as e:  # worker may have created in parallel, so read
+            log.debug(f'Rollback for {e}')
+            s.rollback()
+            log.debug('Now trying retrieval...')
+            added = cls.__add_or_update_tx(s, pending)
+            s.commit()
+            log.debug('Retrieved')
+        _name_cache(s).update(added)
+
+    @classmethod
+    def __add_or_update_tx(cls, s, pending):
+        added = {}
+        for key, (name, type, units, summary, owner, constraint) in pending:
+            statistic_name = s.query(StatisticName). \
+                filter(StatisticName.name == name,
+                       StatisticName.owner == owner,
+                       StatisticName.constraint == constraint).one_or_none()
+            if not statistic_name:
+                statistic_name = add(s, StatisticName(name=name, units=units, summary=summary, owner=owner,
+                                                      constraint=constraint, statistic_journal_type=type))
+            else:
+                if statistic_name.statistic_journal_type != type:
+                    raise Exception('Changing type on %s (%s -> %s)' %
+                                    (statistic_name.name, statistic_name.statistic_journal_type, type))
+                if statistic_name.units != units:
+                    log.warning('Changing units on %s (%s -> %s)' %
+                                (statistic_name.name, statistic_name.units, units))
+                    statistic_name.units = units
+                if statistic_name.summary != summary:
+                    log.warning('Changing summary on %s (%s -> %s)' %
+                                (statistic_name.name, statistic_name.summary, summary))
+                    statistic_name.summary = summary
+            s.flush()
+            added[key] = (statistic_name.id, type, units, summary)
+        return added
 
     @classmethod
     def from_name(cls, s, name, owner, constaint=None):
+        key = _name_key(name, owner, constaint)
+        cached = _name_cache(s).get(key)
+        if cached:
+            statistic_name = s.query(StatisticName).get(cached[0])
+            if statistic_name and _name_key(statistic_name.name, statistic_name.owner,
+                                            statistic_name.constraint) == key:
+                return statistic_name
+            log.debug(f'Cached statistic name for {name} is stale')
+            clear_name_cache(s)
         return s.query(StatisticName). \
             filter(StatisticName.name == name,
                    StatisticName.owner == owner,
@@ -101,6 +197,19 @@ class StatisticName(Base):
         return owner, name, constraint
 
 
+@event.listens_for(StatisticName, 'after_update')
+@event.listens_for(StatisticName, 'after_delete')
+def _clear_name_cache_on_change(mapper, connection, target):
+    NAME_CACHE.pop(str(connection.engine.url), None)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _clear_name_cache_on_bulk_change(context):
+    if context.mapper.class_ is StatisticName:
+        clear_name_cache(context.session)
+
+
 class StatisticJournalType(IntEnum):
 
     STATISTIC = 0
@@ -402,6 +511,50 @@ class StatisticMeasure(Base):
     quartile = Column(Integer)  # 0..4 at the min, 25%, median, 75% and max points
 
 
+class StatisticArray(Base):
+    '''
+    An optional, compact copy of the time series for a single statistic from a single source (typically
+    the values read from a FIT file for an activity).
+
+    Times (unix epoch seconds) and values are stored as compressed numpy arrays, so an activity needs a few
+    rows here rather than thousands of StatisticJournal rows.  The StatisticJournal rows are still written
+    (most calculations use them), but activity_statistics() reads from here when possible.  Writing (or
+    deleting) journal values for the statistic and source deletes the array, so the copy is never stale.
+    '''
+
+    __tablename__ = 'statistic_array'
+
+    id = Column(Integer, primary_key=True)
+    statistic_name_id = Column(Integer, ForeignKey('statistic_name.id', ondelete='cascade'), nullable=False)
+    statistic_name = relationship('StatisticName')
+    source_id = Column(Integer, ForeignKey('source.id', ondelete='cascade'), nullable=False)
+    source = relationship('Source')
+    n = Column(Integer, nullable=False)
+    times = Column(LargeBinary, nullable=False)
+    values = Column(LargeBinary, nullable=False)
+    UniqueConstraint(source_id, statistic_name_id)
+
+    @staticmethod
+    def pack(array):
+        buffer = BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return compress(buffer.getvalue())
+
+    @staticmethod
+    def unpack(data):
+        return np.load(BytesIO(decompress(data)), allow_pickle=False)
+
+    @classmethod
+    def clear(cls, s, statistic_name_ids, source_ids=None):
+        '''
+        Delete arrays that may no longer match the journal (the arguments can be lists or queries).
+        '''
+        q = s.query(StatisticArray).filter(StatisticArray.statistic_name_id.in_(statistic_name_ids))
+        if source_ids is not None:
+            q = q.filter(StatisticArray.source_id.in_(source_ids))
+        q.delete(synchronize_session=False)
+
+
 STATISTIC_JOURNAL_CLASSES = {
     StatisticJournalType.INTEGER: StatisticJournalInteger,
     StatisticJournalType.FLOAT: StatisticJournalFloat,
@@ -6,12 +6,12 @@ from sqlalchemy import not_
 from sqlalchemy.sql.functions import count
 
 from ..pipeline import MultiProcPipeline, UniProcPipeline, LoaderMixin
-from ...commands.args import STATISTICS, WORKER, mm, VERBOSITY, LOG
 from ...lib.date import local_time_to_time, time_to_local_time, format_date, to_date
 from ...lib.log import log_current_exception
 from ...lib.schedule import Schedule
-from ...squeal import ActivityJournal, Interval, Timestamp, StatisticJournal, StatisticName, SegmentJournal
-from ...squeal.types import long_cls
+from ...squeal import ActivityJournal, Interval, Timestamp, StatisticJournal, StatisticName, SegmentJournal, \
+    StatisticArray
+from ...squeal.types import long_cls, short_cls
 from ...squeal.utils import add
 
 log = getLogger(__name__)
@@ -19,6 +19,8 @@ log = getLogger(__name__)
 
 class CalculatorMixin:
 
+    _inputs = ()  # owners read, in addition to owner_in (None if unknown)
+
     def __init__(self, *args, owner_in=None, start=None, finish=None, **kargs):
         self.owner_in = self._assert('owner_in', owner_in)  # todo - not needed by some...
         self.start = start  # optional start local time (always present for workers)
@@ -32,8 +34,11 @@ class CalculatorMixin:
             if finish: finish = type(finish)
         return start, finish
 
-    def _base_command(self):
-        return f'{{ch2}} --{VERBOSITY} 0 --{LOG} {{log}} -f {self._db.path} {STATISTICS} {mm(WORKER)} {self.id}'
+    @classmethod
+    def inputs(cls, *args, owner_in=None, **kargs):
+        if cls._inputs is None:
+            return None
+        return {short_cls(owner) for owner in (owner_in,) + tuple(cls._inputs)}
 
 
 class MultiProcCalculator(CalculatorMixin, MultiProcPipeline):
@@ -43,10 +48,7 @@ class MultiProcCalculator(CalculatorMixin, MultiProcPipeline):
 
 class UniProcCalculator(CalculatorMixin, UniProcPipeline):
 
-    def _base_command(self):
-        raise Exception('UniProc does not support workers')
-
-    def _args(self, missing, start, finish):
+    def _worker_kargs(self, missing, start, finish):
         raise Exception('UniProc does not support workers')
 
 
@@ -75,10 +77,10 @@ class JournalCalculatorMixin:
             order_by(self._journal_type.start)
         return [row[0] for row in self._delimit_query(q)]
 
-    def _args(self, missing, start, finish):
+    def _worker_kargs(self, missing, start, finish):
         s, f = time_to_local_time(missing[start]), time_to_local_time(missing[finish])
         log.info(f'Starting worker for {s} - {f}')
-        return f'"{s}" "{f}"'
+        return dict(start=s, finish=f)
 
     def _delete(self, s):
         start, finish = self._start_finish(type=local_time_to_time)
@@ -92,6 +94,7 @@ class JournalCalculatorMixin:
             if repeat:
                 s.query(StatisticJournal).filter(StatisticJournal.id.in_(statistic_journals.cte())). \
                     delete(synchronize_session=False)
+                StatisticArray.clear(s, statistic_names.cte(), activity_journals.cte())
                 Timestamp.clear_keys(s, activity_journals.cte(), self.owner_out, constraint=None)
             else:
                 n = s.query(count(StatisticJournal.id)). \
@@ -189,10 +192,10 @@ class IntervalCalculatorMixin(LoaderMixin):
         start, finish = self._start_finish(type=to_date)
         return list(Interval.missing_dates(s, self.schedule, self.owner_out, start=start, finish=finish))
 
-    def _args(self, missing, start, finish):
+    def _worker_kargs(self, missing, start, finish):
         s, f = format_date(missing[start][0]), format_date(missing[finish][1])
         log.info(f'Starting worker for {s} - {f}')
-        return f'"{s}" "{f}"'
+        return dict(start=s, finish=f)
 
     def _delete(self, s):
         start, finish = self._start_finish()
@@ -4,6 +4,8 @@ from json import loads
 from logging import getLogger
 
 from . import ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator
+from .elevation import ElevationCalculator
+from .impulse import ImpulseCalculator
 from ..names import ELEVATION, DISTANCE, M, POWER_ESTIMATE, HEART_RATE, ACTIVE_DISTANCE, MSR, SUM, CNT, MAX, \
     summaries, ACTIVE_SPEED, ACTIVE_TIME, AVG, S, KMH, MIN_KM_TIME_ANY, MIN, MED_KM_TIME_ANY, PERCENT_IN_Z_ANY, PC, \
     TIME_IN_Z_ANY, MAX_MED_HR_M_ANY, W, BPM, MAX_MEAN_PE_M_ANY, CLIMB_ELEVATION, CLIMB_DISTANCE, CLIMB_TIME, \
@@ -18,12 +20,15 @@ from ...data.response import response_stats
 from ...lib.log import log_current_exception
 from ...squeal import StatisticJournalFloat, Constant, StatisticJournalText
 from ...stoats.calculate.power import PowerCalculator
+from ...stoats.read.segment import SegmentReader
 
 log = getLogger(__name__)
 
 
 class ActivityCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator):
 
+    _inputs = (SegmentReader, ElevationCalculator, ImpulseCalculator, PowerCalculator)
+
     def __init__(self, *args, climb=None, **kargs):
         self.climb_ref = climb
         super().__init__(*args, **kargs)
@@ -5,6 +5,7 @@ from . import ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiPro
 from ..names import RAW_ELEVATION, ELEVATION, DISTANCE, M, GRADE, PC
 from ...data.elevation import fix_elevation
 from ...data.frame import activity_statistics, present
+from ..read.segment import SegmentReader
 from ...squeal import StatisticJournalFloat
 
 log = getLogger(__name__)
@@ -12,6 +13,8 @@ log = getLogger(__name__)
 
 class ElevationCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator):
 
+    _inputs = (SegmentReader,)
+
     def __init__(self, *args, smooth=3, **kargs):
         self.smooth = smooth
         super().__init__(*args, **kargs)
@@ -29,8 +32,5 @@ class ElevationCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMix
         return fix_elevation(df, smooth=self.smooth)
 
     def _copy_results(self, s, ajournal, loader, df):
-        for time, row in df.iterrows():
-            loader.add(ELEVATION, M, None, ajournal.activity_group, ajournal, row[ELEVATION], time,
-                       StatisticJournalFloat)
-            loader.add(GRADE, PC, None, ajournal.activity_group, ajournal, row[GRADE], time,
-                       StatisticJournalFloat)
+        loader.add_frame(df, ajournal, [(ELEVATION, M, None, ajournal.activity_group, StatisticJournalFloat),
+                                        (GRADE, PC, None, ajournal.activity_group, StatisticJournalFloat)])
@@ -1,11 +1,11 @@
 
-import numpy as np
 from collections import namedtuple
 from json import loads
 from logging import getLogger
 
 from . import MultiProcCalculator, ActivityJournalCalculatorMixin, DataFrameCalculatorMixin
 from ..names import FTHR, HEART_RATE, HR_ZONE, ALL, HR_IMPULSE_10, SUM
+from ..read.segment import SegmentReader
 from ...data.frame import activity_statistics, statistics
 from ...data.impulse import hr_zone, impulse_10
 from ...squeal import Constant, StatisticJournalFloat, ActivityGroup
@@ -18,6 +18,8 @@ HRImpulse = namedtuple('HRImpulse', 'gamma, zero, one, max_secs')
 
 class ImpulseCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator):
 
+    _inputs = (SegmentReader,)
+
     def __init__(self, *args, impulse_ref=None, **kargs):
         self.impulse_ref = self._assert('impulse_ref', impulse_ref)
         super().__init__(*args, **kargs)
@@ -47,18 +49,12 @@ class ImpulseCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMixin
         return stats
 
     def _copy_results(self, s, ajournal, loader, stats):
-        for time, row in stats.iterrows():
-            if not np.isnan(row[HR_ZONE]):
-                loader.add(HR_ZONE, None, None, ajournal.activity_group, ajournal, row[HR_ZONE], time,
-                           StatisticJournalFloat)
-            if not np.isnan(row[HR_IMPULSE_10]):
-                # load a copy to the activity group as well as to all so that we can extract / display
-                # easily in, for example, std_activity_statistics
-                loader.add(HR_IMPULSE_10, None, None, ajournal.activity_group, ajournal,
-                           row[HR_IMPULSE_10], time, StatisticJournalFloat)
-                # copy for global FF statistics
-                loader.add(HR_IMPULSE_10, None, None, self.all, ajournal,
-                           row[HR_IMPULSE_10], time, StatisticJournalFloat)
+        # load impulse to the activity group as well as to all so that we can extract / display
+        # easily in, for example, std_activity_statistics (the copy in all is for global FF statistics)
+        loader.add_frame(stats, ajournal,
+                         [(HR_ZONE, None, None, ajournal.activity_group, StatisticJournalFloat),
+                          (HR_IMPULSE_10, None, None, ajournal.activity_group, StatisticJournalFloat),
+                          (HR_IMPULSE_10, None, None, self.all, StatisticJournalFloat)])
         # if there are no values, add a single null so we don't re-process
         if not loader:
             loader.add(HR_ZONE, None, SUM, ajournal.activity_group, ajournal, None, ajournal.start,
@@ -154,7 +154,7 @@ class MonitorCalculator(LoaderMixin, MultiProcCalculator):
         loader.add(DAILY_STEPS, STEPS_UNITS, summaries(SUM, AVG, CNT, MAX, MSR), None, source, daily_steps,
                    start, StatisticJournalInteger)
 
-    def _args(self, missing, start, finish):
+    def _worker_kargs(self, missing, start, finish):
         start, finish = format_date(missing[start]), format_date(missing[finish])
         log.info(f'Starting worker for {start} - {finish}')
-        return f'"{start}" "{finish}"'
+        return dict(start=start, finish=finish)
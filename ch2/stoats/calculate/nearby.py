@@ -10,6 +10,7 @@ from sqlalchemy.sql.functions import count
 
 from . import UniProcCalculator
 from ..names import LONGITUDE, LATITUDE, ACTIVE_DISTANCE
+from ..read.segment import SegmentReader
 from ...arty import MatchType
 from ...arty.spherical import SQRTree
 from ...lib.date import to_time, local_date_to_time
@@ -25,6 +26,8 @@ Nearby = namedtuple('Nearby', 'constraint, activity_group, border, start, finish
 
 class SimilarityCalculator(UniProcCalculator):
 
+    _inputs = (SegmentReader,)  # positions
+
     def __init__(self, *args, nearby=None, **kargs):
         self.nearby_ref = self._assert('nearby', nearby)
         super().__init__(*args, **kargs)
@@ -5,11 +5,11 @@ from logging import getLogger
 from re import split
 
 import numpy as np
-import pandas as pd
 
 from . import DataFrameCalculatorMixin, ActivityJournalCalculatorMixin, MultiProcCalculator
-from ..load import StatisticJournalLoader
+from .elevation import ElevationCalculator
 from ..names import *
+from ..read.segment import SegmentReader
 from ...data import activity_statistics, present, linear_resample_time
 from ...data.frame import median_dt
 from ...data.lib import interpolate_to_index
@@ -18,6 +18,7 @@ from ...data.power import add_differentials, add_energy_budget, add_loss_estimat
 from ...lib.data import reftuple, MissingReference
 from ...lib.log import log_current_exception
 from ...squeal import StatisticJournalFloat, Constant, Timestamp
+from ...squeal.types import short_cls
 
 log = getLogger(__name__)
 
@@ -29,10 +30,16 @@ Bike = namedtuple('Bike', 'cda, crr, weight')
 # used as common owner
 class PowerCalculator(ActivityJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator):
 
+    _inputs = (SegmentReader, ElevationCalculator)
+
     def __init__(self, *args, **kargs):
         super().__init__(*args, owner_out=PowerCalculator, **kargs)
         self.power = None
 
+    @classmethod
+    def outputs(cls, *args, **kargs):
+        return {short_cls(PowerCalculator)}
+
 
 class BasicPowerCalculator(PowerCalculator):
 
@@ -83,11 +90,8 @@ class BasicPowerCalculator(PowerCalculator):
         df, ldf = dfs
         self.__add_total_energy(s, ajournal, loader, ldf)
         df = interpolate_to_index(df, ldf, *(field[0] for field in fields))
-        for time, row in df.iterrows():
-            for name, units, summary in fields:
-                if not pd.isnull(row[name]):
-                    loader.add(name, units, summary, ajournal.activity_group, ajournal, row[name], time,
-                               StatisticJournalFloat)
+        loader.add_frame(df, ajournal, [(name, units, summary, ajournal.activity_group, StatisticJournalFloat)
+                                        for name, units, summary in fields])
 
     def __add_total_energy(self, s, ajournal, loader, ldf):
         if present(ldf, POWER_ESTIMATE):
@@ -126,12 +130,12 @@ class ExtendedPowerCalculator(BasicPowerCalculator):
         with Timestamp(owner=self.owner_out, source=source).on_success(s):
             try:
                 data = self._read_dataframe(s, source)
-                loader = StatisticJournalLoader(s, self.owner_out)
+                loader = self._get_loader(s)
                 try:
                     stats = self._calculate_stats(s, source, data)
                 except PowerException as e:
                     log.warning(f'Cannot use detailed power model; adding basic values only ({e})')
-                    loader = StatisticJournalLoader(s, self.owner_out)
+                    loader = self._get_loader(s)
                     stats = None, super()._calculate_stats(s, source, data)
                 self._copy_results(s, source, loader, stats)
                 loader.load()
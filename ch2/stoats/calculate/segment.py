@@ -3,6 +3,7 @@ from logging import getLogger
 
 from . import MultiProcCalculator, DataFrameCalculatorMixin, SegmentJournalCalculatorMixin
 from ..names import SEGMENT_TIME, S, summaries, MIN, MSR, CNT, HEART_RATE, SEGMENT_HEART_RATE, BPM, MAX
+from ..read.segment import SegmentReader
 from ...data import activity_statistics, present, linear_resample_time
 from ...squeal import SegmentJournal, StatisticJournalFloat
 
@@ -13,6 +14,8 @@ SJOURNAL = 'sjournal'
 
 class SegmentCalculator(SegmentJournalCalculatorMixin, DataFrameCalculatorMixin, MultiProcCalculator):
 
+    _inputs = (SegmentReader,)
+
     def _startup(self, s):
         SegmentJournal.clean(s)
         super()._startup(s)
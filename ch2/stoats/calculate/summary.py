@@ -24,6 +24,8 @@ def fuzz(n, q):
 
 class SummaryCalculator(IntervalCalculatorMixin, MultiProcCalculator):
 
+    _inputs = None  # summarises everything
+
     def __init__(self, *args, owner_in='[unused]', **kargs):
         super().__init__(*args, owner_in=owner_in, **kargs)
 
@@ -1,19 +1,167 @@
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from logging import getLogger
-from time import sleep
+from multiprocessing import Manager
+from threading import Thread
+from time import sleep, time
 
-from sqlalchemy.exc import IntegrityError
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, and_, bindparam, exists
+from sqlalchemy.exc import IntegrityError, OperationalError
 
 from .waypoint import make_waypoint
 from ..commands.args import UNLOCK
-from ..squeal import StatisticJournal, StatisticName, Dummy, Interval
+from ..lib.date import to_time
+from ..lib.log import log_current_exception
+from ..squeal import StatisticJournal, StatisticName, Dummy, Interval, StatisticArray, StatisticJournalFloat, \
+    StatisticJournalInteger
 from ..squeal.tables.statistic import STATISTIC_JOURNAL_CLASSES, STATISTIC_JOURNAL_TYPES
 from ..squeal.types import short_cls
 
 log = getLogger(__name__)
 
 
+class Staged:
+    '''
+    A value waiting to be loaded.  Much cheaper to create than the equivalent ORM instance.
+    '''
+
+    __slots__ = ('statistic_name_id', 'source_id', 'value', 'time', 'serial')
+
+    def __init__(self, statistic_name_id, source_id, value, time, serial):
+        self.statistic_name_id = statistic_name_id
+        self.source_id = source_id
+        self.value = value
+        self.time = time
+        self.serial = serial
+
+
+def _acquire(s, abort_after):
+    dummy_source, dummy_name = Dummy.singletons(s)
+    dummy, count = None, 0
+    while not dummy:
+        try:
+            log.debug(f'Trying to acquire database ({count})')
+            dummy = StatisticJournal(source=dummy_source, statistic_name=dummy_name, time=0.0)
+            s.add(dummy)
+            s.flush()
+            log.debug('Acquired database')
+        except (IntegrityError, OperationalError) as e:
+            # another loader has the dummy (integrity) or another process is writing (locked)
+            if isinstance(e, OperationalError) and 'database is locked' not in str(e):
+                raise
+            log.debug('Failed to acquire database')
+            s.rollback()
+            dummy, count = None, count+1
+            if count > abort_after:
+                raise Exception(f'Could not acquire database after {count} attempts '
+                                f'(you may need to use `ch2 {UNLOCK}` once all workers have stopped)')
+            sleep(0.1)
+    log.debug(f'Dummy ID {dummy.id}')
+    return dummy
+
+
+Batch = namedtuple('Batch', 'type, statistic_name_id, source_id, times, values, serials')
+
+
+def _batches(staging):
+    # group staged values into columns, one batch per type, name and source.  these are much cheaper to
+    # send to a Writer than the individual values (and times are sent as floats, as they are stored).
+    batches = []
+    for type, staged in staging.items():
+        columns = defaultdict(lambda: ([], [], []))
+        for sjournal in staged:
+            times, values, serials = columns[(sjournal.statistic_name_id, sjournal.source_id)]
+            times.append(to_time(sjournal.time).timestamp())
+            values.append(sjournal.value)
+            serials.append(sjournal.serial)
+        batches.extend(Batch(type, statistic_name_id, source_id, *column)
+                       for (statistic_name_id, source_id), column in columns.items())
+    return batches
+
+
+def _delete(s, deletes):
+    # remove existing values that the load replaces
+    for statistic_name_id, start, finish in deletes:
+        n = s.query(StatisticJournal). \
+            filter(StatisticJournal.statistic_name_id == statistic_name_id,
+                   StatisticJournal.time >= start,
+                   StatisticJournal.time <= finish).delete()
+        if n:
+            log.warning(f'Deleted {n} overlapping values for statistic {statistic_name_id}')
+            StatisticArray.clear(s, [statistic_name_id])
+
+
+ARRAY_DTYPES = {StatisticJournalFloat: np.float64, StatisticJournalInteger: np.int64}
+
+
+def _new_arrays(s, batches):
+    # batches that can be stored as arrays (numeric, with no missing values, and nothing already in the journal)
+    sj = StatisticJournal.__table__
+    return [batch for batch in batches
+            if batch.type in ARRAY_DTYPES and not any(value is None for value in batch.values) and
+            not s.execute(select([exists().where(and_(sj.c.statistic_name_id == batch.statistic_name_id,
+                                                      sj.c.source_id == batch.source_id))])).scalar()]
+
+
+def _clear_arrays(s, batches):
+    # new values in the journal invalidate any existing array for the same statistic and source
+    if batches:
+        sa = StatisticArray.__table__
+        s.execute(sa.delete().where(and_(sa.c.statistic_name_id == bindparam('name_id'),
+                                         sa.c.source_id == bindparam('src_id'))),
+                  [{'name_id': batch.statistic_name_id, 'src_id': batch.source_id} for batch in batches])
+
+
+def _insert_arrays(s, batches):
+    rows = []
+    for batch in batches:
+        times = np.array(batch.times, dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        values = np.array(batch.values, dtype=ARRAY_DTYPES[batch.type])
+        rows.append({'statistic_name_id': batch.statistic_name_id, 'source_id': batch.source_id,
+                     'n': len(times), 'times': StatisticArray.pack(times[order]),
+                     'values': StatisticArray.pack(values[order])})
+    if rows:
+        s.execute(StatisticArray.__table__.insert(), rows)
+        log.debug(f'Loaded {len(rows)} arrays')
+
+
+def _insert(s, dummy, batches, deletes=(), arrays=False):
+    # insert directly into both tables (bypassing the ORM) using executemany
+    _delete(s, deletes)
+    new_arrays = _new_arrays(s, batches) if arrays else []
+    _clear_arrays(s, batches)
+    rowid, count = dummy.id + 1, 0
+    for batch in batches:
+        log.debug('Loading %d values for type %s' % (len(batch.times), short_cls(batch.type)))
+        ids = range(rowid, rowid + len(batch.times))
+        s.execute(StatisticJournal.__table__.insert(),
+                  [{'id': id, 'type': STATISTIC_JOURNAL_TYPES[batch.type],
+                    'statistic_name_id': batch.statistic_name_id, 'source_id': batch.source_id,
+                    'time': time, 'serial': serial}
+                   for id, time, serial in zip(ids, batch.times, batch.serials)])
+        s.execute(batch.type.__table__.insert(),
+                  [{'id': id, 'value': value} for id, value in zip(ids, batch.values)])
+        rowid += len(batch.times)
+        count += len(batch.times)
+    _insert_arrays(s, new_arrays)
+    s.commit()
+    log.info(f'Loaded {count} statistics')
+    log.debug('Removing Dummy')
+    s.delete(dummy)
+    s.commit()
+    log.debug('Dummy removed')
+
+
+def _clean(s, start, finish, clear_timestamp):
+    # manually clean out intervals because we're doing a fast load
+    if clear_timestamp and start and finish:
+        Interval.clean_times(s, start, finish)
+        s.commit()
+
+
 class StatisticJournalLoader:
 
     # we want to load multiple tables (because we're using inheritance) quickly and safely.
@@ -32,10 +180,14 @@ class StatisticJournalLoader:
     # well the above worked for a while. then started throwing exceptions, so i needed to add
     # the while loop below.
 
-    def __init__(self, s, owner, add_serial=True, clear_timestamp=True, abort_after=100):
+    def __init__(self, s, owner, add_serial=True, clear_timestamp=True, abort_after=100, writer=None,
+                 arrays=False):
         self._s = s
+        self.__writer = writer
+        self.__arrays = arrays  # also write StatisticArray rows
         self._owner = owner
-        self.__statistic_name_cache = dict()
+        self.__definitions = dict()  # (name, constraint) -> arguments for StatisticName.add_all_if_missing
+        self.__by_name = defaultdict(lambda: [])  # (name, constraint) -> staged values
         self.__staging = defaultdict(lambda: [])
         self.__latest = dict()
         self.__add_serial = add_serial
@@ -45,6 +197,7 @@ class StatisticJournalLoader:
         self.__serial = 0 if add_serial else None
         self.__clear_timestamp = clear_timestamp
         self.__abort_after = abort_after
+        self.load_time = 0  # seconds spent in load() (used to measure pipeline costs)
 
     @property
     def start(self):
@@ -57,11 +210,26 @@ class StatisticJournalLoader:
     def __bool__(self):
         return bool(self.__staging)
 
+    def __len__(self):
+        return sum(len(staged) for staged in self.__staging.values())
+
     def load(self):
+        start = time()
+        try:
+            self.__load()
+        finally:
+            self.load_time += time() - start
+
+    def __load(self):
         self._s.commit()
-        dummy = self._preload()
+        self.__resolve_names()
+        if self.__writer:
+            self.__writer.write(_batches(self.__staging), self._deletes(), self.start, self.finish,
+                                self.__clear_timestamp, self.__arrays)
+            return
+        preloaded = self._preload()
         try:
-            self._load_ids(dummy)
+            self._load_ids(preloaded)
         except Exception:
             self._s.rollback()
             # dummy may have been deleted in the rollback - it depends if there were any intermediate commits
@@ -70,48 +238,29 @@ class StatisticJournalLoader:
             raise
         self._postload()
 
+    def __resolve_names(self):
+        # names are created (if necessary) together, in a single transaction
+        keys = list(self.__definitions.keys())
+        ids = StatisticName.add_all_if_missing(self._s, [self.__definitions[key] for key in keys])
+        for key, id in zip(keys, ids):
+            for sjournal in self.__by_name[key]:
+                sjournal.statistic_name_id = id
+
     def _preload(self):
-        dummy_source, dummy_name = Dummy.singletons(self._s)
-        dummy, count = None, 0
-        while not dummy:
-            try:
-                log.debug(f'Trying to acquire database ({count})')
-                dummy = StatisticJournal(source=dummy_source, statistic_name=dummy_name, time=0.0)
-                self._s.add(dummy)
-                self._s.flush()
-                log.debug('Acquired database')
-            except IntegrityError:
-                log.debug('Failed to acquire database')
-                self._s.rollback()
-                dummy, count = None, count+1
-                if count > self.__abort_after:
-                    raise Exception(f'Could not acquire database after {count} attempts '
-                                    f'(you may need to use `ch2 {UNLOCK}` once all workers have stopped)')
-                sleep(0.1)
-        log.debug(f'Dummy ID {dummy.id}')
-        return dummy
-
-    def _load_ids(self, dummy):
-        rowid, count = dummy.id + 1, 0
-        for type in self.__staging:
-            log.debug('Loading %d values for type %s' % (len(self.__staging[type]), short_cls(type)))
-            for sjournal in self.__staging[type]:
-                sjournal.id = rowid
-                rowid += 1
-            self._s.bulk_save_objects(self.__staging[type])
-            count += len(self.__staging[type])
-        self._s.commit()
-        log.info(f'Loaded {count} statistics')
-        log.debug('Removing Dummy')
-        self._s.delete(dummy)
-        self._s.commit()
-        log.debug('Dummy removed')
+        deletes = self._deletes()
+        return _acquire(self._s, self.__abort_after), deletes
+
+    def _deletes(self):
+        # a list of (statistic_name_id, start, finish) for existing values that are replaced by the load.
+        # these are deleted in the same transaction as the load (by the Writer, if used).
+        return []
+
+    def _load_ids(self, preloaded):
+        dummy, deletes = preloaded
+        _insert(self._s, dummy, _batches(self.__staging), deletes, arrays=self.__arrays)
 
     def _postload(self):
-        # manually clean out intervals because we're doing a fast load
-        if self.__clear_timestamp and self.start and self.finish:
-            Interval.clean_times(self._s, self.start, self.finish)
-            self._s.commit()
+        _clean(self._s, self.start, self.finish, self.__clear_timestamp)
 
     @classmethod
     def unlock(cls, s):
@@ -136,36 +285,95 @@ class StatisticJournalLoader:
         self.__finish = max(self.__finish, time) if self.__finish else time
 
         key = (name, constraint)
-        if key not in self.__statistic_name_cache:
-            self.__statistic_name_cache[key] = \
-                StatisticName.add_if_missing(self._s, name, STATISTIC_JOURNAL_TYPES[cls],
-                                             units, summary, self._owner, constraint)
-
-        try:
-            source = source.id
-        except AttributeError:
-            pass  # literal id
-        statistic_name = self.__statistic_name_cache[key]
-        journal_class = STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]
-        if cls != journal_class:
-            raise Exception(f'Inconsistent class for {name}: {cls}/{journal_class}')
-        instance = journal_class(statistic_name_id=statistic_name.id, source_id=source, value=value,
-                                 time=time, serial=self.__serial)
+        journal_class = self.__define(key, units, summary, cls)
+        source = self.__source_id(source)
+        instance = Staged(None, source, value, time, self.__serial)  # statistic_name_id set on load
         if key in self.__latest:
             prev = self.__latest[key]
             if instance.time > prev.time:
                 self.__latest[key] = instance
-                self.__staging[journal_class].append(instance)
+                self.__stage(key, journal_class, instance)
             elif instance.time == prev.time:
                 if instance.value == prev.value:
                     log.warning(f'Skipping duplicate for {name}')
                 else:
                     self._resolve_duplicate(name, instance, prev)
             else:
-                self.__staging[journal_class].append(instance)
+                self.__stage(key, journal_class, instance)
         else:
             self.__latest[key] = instance
-            self.__staging[journal_class].append(instance)
+            self.__stage(key, journal_class, instance)
+
+    def add_frame(self, df, source, columns):
+        '''
+        Add the (non-null) values in df, which is indexed by time.
+
+        columns is a list of (name, units, summary, constraint, cls), where name is also the column in df
+        (a column can appear more than once, with different constraints).
+
+        This gives the same statistics as calling add() for each value, row by row, but whole columns are
+        staged at once (so values are staged column by column).  If that is not possible (times are not
+        unique and increasing, or overlap values already added) then add() is used.
+        '''
+        if df.empty:
+            return
+        present = np.array([df[name].notna().to_numpy() for name, *_ in columns]).reshape(len(columns), len(df))
+        rows = present.any(axis=0)
+        if not rows.any():
+            return
+        index = df.index[rows]
+        keys = [(name, constraint) for name, units, summary, constraint, cls in columns]
+        if not index.is_monotonic_increasing or not index.is_unique or len(set(keys)) < len(keys) or \
+                (self.__last_time is not None and index[0] < self.__last_time) or \
+                any(key in self.__latest and self.__latest[key].time >= index[0] for key in keys):
+            log.debug('Cannot stage frame by column')
+            for time, row in df.iterrows():
+                for name, units, summary, constraint, cls in columns:
+                    if not pd.isnull(row[name]):
+                        self.add(name, units, summary, constraint, source, row[name], time, cls)
+            return
+
+        times = df.index.tolist()
+        if self.__add_serial:
+            first = self.__serial
+            if self.__last_time is not None and index[0] > self.__last_time:
+                first += 1
+            serials = (np.cumsum(rows) + (first - 1)).tolist()
+            self.__serial, self.__last_time = serials[-1], index[-1]
+        else:
+            serials = [None] * len(times)
+        self.__start = min(self.__start, index[0]) if self.__start else index[0]
+        self.__finish = max(self.__finish, index[-1]) if self.__finish else index[-1]
+
+        source = self.__source_id(source)
+        for (name, units, summary, constraint, cls), key, mask in zip(columns, keys, present):
+            journal_class = self.__define(key, units, summary, cls)
+            instances = [Staged(None, source, value, times[i], serials[i])  # statistic_name_id set on load
+                         for i, value in zip(np.flatnonzero(mask).tolist(), df[name].to_numpy()[mask].tolist())]
+            if instances:
+                self.__staging[journal_class].extend(instances)
+                self.__by_name[key].extend(instances)
+                self.__latest[key] = instances[-1]
+
+    def __define(self, key, units, summary, cls):
+        name, constraint = key
+        if key not in self.__definitions:
+            self.__definitions[key] = (name, STATISTIC_JOURNAL_TYPES[cls], units, summary, self._owner, constraint)
+        journal_class = STATISTIC_JOURNAL_CLASSES[self.__definitions[key][1]]
+        if cls != journal_class:
+            raise Exception(f'Inconsistent class for {name}: {cls}/{journal_class}')
+        return journal_class
+
+    @staticmethod
+    def __source_id(source):
+        try:
+            return source.id
+        except AttributeError:
+            return source  # literal id
+
+    def __stage(self, key, journal_class, instance):
+        self.__staging[journal_class].append(instance)
+        self.__by_name[key].append(instance)
 
     def _resolve_duplicate(self, name, instance, prev):
         raise Exception(f'Duplicate time ({prev.time}) for {name} ({instance.value}/{prev.value})')
@@ -176,12 +384,99 @@ class StatisticJournalLoader:
     def as_waypoints(self, names):
         Waypoint = make_waypoint(names.values())
         time_to_waypoint = defaultdict(lambda: Waypoint())
-        statistic_ids = dict((name.id, name) for name in self.__statistic_name_cache.values())
-        for type in self.__staging:
-            for sjournal in self.__staging[type]:
-                name = statistic_ids[sjournal.statistic_name_id].name
-                if name in names:
+        for (name, constraint), staged in self.__by_name.items():
+            if name in names:
+                for sjournal in staged:
                     time_to_waypoint[sjournal.time] = \
                         time_to_waypoint[sjournal.time]._replace(**{'time': sjournal.time,
                                                                     names[name]: sjournal.value})
         return [time_to_waypoint[time] for time in sorted(time_to_waypoint.keys())]
+
+
+class Writer:
+    '''
+    A single writer for statistics.
+
+    Loaders created with a client (see client()) send their data here instead of writing to the database
+    themselves.  Data are written in the order received, by a thread in this process, so loaders in other
+    threads or processes (that inherit or are passed the client) do not contend for the database.
+
+      with Writer(db) as writer:
+          loader = StatisticJournalLoader(s, owner, writer=writer.client())
+
+    A loader's load() returns when the data are committed (so any Timestamp set afterwards is correct).
+    '''
+
+    def __init__(self, db, abort_after=100, start=True):
+        self.__db = db
+        self.__abort_after = abort_after
+        self.__start = start
+        self.__manager = None
+        self.__requests = None
+        self.__thread = None
+
+    def __enter__(self):
+        self.__manager = Manager()
+        self.__requests = self.__manager.Queue()
+        if self.__start:
+            self.start()
+        return self
+
+    def start(self):
+        '''
+        Start writing (if not already started).  Use start=False in the constructor and call this later
+        to fork processes before the writer's thread exists (see MultiProcPipeline._spawn).
+        '''
+        if not self.__thread:
+            self.__thread = Thread(target=self.__run, name=short_cls(self), daemon=True)
+            self.__thread.start()
+
+    def __exit__(self, *args):
+        self.__requests.put(None)
+        if self.__thread:
+            self.__thread.join()
+        self.__manager.shutdown()
+
+    def client(self):
+        return WriterClient(self.__requests, self.__manager.Queue())
+
+    def __run(self):
+        with self.__db.session_context() as s:
+            while True:
+                request = self.__requests.get()
+                if request is None:
+                    break
+                replies, batches, deletes, start, finish, clear_timestamp, arrays = request
+                try:
+                    self.__write(s, batches, deletes, start, finish, clear_timestamp, arrays)
+                    replies.put(None)
+                except Exception as e:
+                    log_current_exception()
+                    replies.put(str(e) or repr(e))
+
+    def __write(self, s, batches, deletes, start, finish, clear_timestamp, arrays):
+        # the dummy is still used because other code may write statistics directly
+        dummy = _acquire(s, self.__abort_after)
+        try:
+            _insert(s, dummy, batches, deletes, arrays=arrays)
+        except Exception:
+            s.rollback()
+            StatisticJournalLoader.unlock(s)
+            raise
+        _clean(s, start, finish, clear_timestamp)
+
+
+class WriterClient:
+    '''
+    The connection from a loader to a Writer (can be pickled and so passed to other processes).
+    '''
+
+    def __init__(self, requests, replies):
+        self.__requests = requests
+        self.__replies = replies
+
+    def write(self, batches, deletes, start, finish, clear_timestamp, arrays=False):
+        self.__requests.put((self.__replies, batches, deletes, start, finish, clear_timestamp, arrays))
+        error = self.__replies.get()
+        if error:
+            raise Exception(f'Writer failed: {error}')
@@ -1,34 +1,121 @@
 
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, as_completed
 from logging import getLogger
+from multiprocessing import get_context
 from time import time
 
 from psutil import cpu_count
 
-from .load import StatisticJournalLoader
+from .load import StatisticJournalLoader, Writer
+from ..commands.args import MEMORY
 from ..lib.date import format_seconds
 from ..lib.utils import short_str
-from ..lib.workers import Workers
-from ..squeal import Pipeline
+from ..squeal import Pipeline, PipelineCost
+from ..squeal.tables.statistic import clear_name_cache
 from ..squeal.types import short_cls
 
 log = getLogger(__name__)
 CPU_FRACTION = 0.9
 MAX_REPEAT = 3
+MIN_COST = 1e-3  # seconds (avoids dividing by zero for pipelines that write little)
 NONE = object()
 
 
-def run_pipeline(db, type, like=None, id=None, **extra_kargs):
+def run_pipeline(db, type, like=None, id=None, n_parallel=None, profiler=None, **extra_kargs):
+    '''
+    Run the pipelines of the given type.
+
+    Pipelines declare the owners of the statistics (and Timestamps) that they read and write (see
+    inputs() and outputs()).  Pipelines that do not depend on each other are run at the same time, in
+    separate processes (at most n_parallel, by default most of the cpus); others run in sort order.
+
+    Pipelines record their progress with Timestamps, so if this is interrupted (or fails) then
+    running it again continues from where it stopped.
+
+    If a profiler is given (see stoats.profile.Profiler) then everything runs in this process.
+    '''
+    if profiler:
+        n_parallel, extra_kargs['n_cpu'] = 1, 1
     with db.session_context() as s:
-        for pipeline in Pipeline.all(s, type, like=like, id=id):
-            kargs = dict(pipeline.kargs)
-            kargs.update(extra_kargs)
-            log.info(f'Running {short_cls(pipeline.cls)}({short_str(pipeline.args)}, {short_str(kargs)}')
-            log.debug(f'Running {pipeline.cls}({pipeline.args}, {kargs})')
-            start = time()
-            pipeline.cls(db, *pipeline.args, id=pipeline.id, **kargs).run()
-            duration = time() - start
-            log.info(f'Ran {short_cls(pipeline.cls)} in {format_seconds(duration)}')
+        specs = [(pipeline.cls, pipeline.args, dict(pipeline.kargs, **extra_kargs), pipeline.id)
+                 for pipeline in Pipeline.all(s, type, like=like, id=id)]
+    if n_parallel is None:
+        n_parallel = _n_cpu()
+    if n_parallel < 2 or len(specs) < 2 or db.path == MEMORY:
+        for spec in specs:
+            _run_spec(db, *spec, profiler=profiler)
+    else:
+        _run_parallel(db, _share_cpus(specs, min(n_parallel, len(specs))), n_parallel)
+
+
+def _n_cpu():
+    return max(1, int(cpu_count() * CPU_FRACTION))
+
+
+def _share_cpus(specs, n_parallel):
+    # pipelines running at the same time may each start workers, so they share the cpus (otherwise the
+    # number of processes would grow as the square of the number of cpus)
+    return [(cls, args, dict(kargs, n_cpu=max(1, (kargs.get('n_cpu') or _n_cpu()) // n_parallel)), id)
+            if issubclass(cls, MultiProcPipeline) else (cls, args, kargs, id)
+            for cls, args, kargs, id in specs]
+
+
+def _run_spec(db, cls, args, kargs, id, profiler=None):
+    clear_name_cache()  # may be a forked worker (names may have changed since the cache was filled)
+    log.info(f'Running {short_cls(cls)}({short_str(args)}, {short_str(kargs)}')
+    log.debug(f'Running {cls}({args}, {kargs})')
+    start = time()
+    pipeline = cls(db, *args, id=id, **kargs)
+    if profiler:
+        profiler.instrument(pipeline)
+    pipeline.run()
+    duration = time() - start
+    log.info(f'Ran {short_cls(cls)} in {format_seconds(duration)}')
+
+
+def _run_worker(db, id, writer, **kargs):
+    # run part of a pipeline in a worker process (see MultiProcPipeline._spawn)
+    clear_name_cache()  # inherited from the parent, so may be stale
+    with db.session_context() as s:
+        pipeline = s.query(Pipeline).filter(Pipeline.id == id).one()
+        cls, args, kargs = pipeline.cls, pipeline.args, dict(pipeline.kargs, **kargs)
+    return cls(db, *args, id=id, worker=True, writer=writer, **kargs).run()
+
+
+def _dependencies(specs):
+    # a pipeline depends on an earlier pipeline if either writes what the other reads, or both write
+    # the same owner (None means unknown, so everything conflicts).  the ports come from the classes and
+    # arguments, so nothing is constructed here.
+    ports = [(cls.inputs(*args, **kargs), cls.outputs(*args, **kargs)) for cls, args, kargs, id in specs]
+    dependencies = []
+    for i, (inputs, outputs) in enumerate(ports):
+        dependencies.append({j for j, (earlier_inputs, earlier_outputs) in enumerate(ports[:i])
+                             if None in (inputs, outputs, earlier_inputs, earlier_outputs) or
+                             inputs & earlier_outputs or outputs & earlier_inputs or outputs & earlier_outputs})
+    return dependencies
+
+
+def _run_parallel(db, specs, n_parallel):
+    dependencies = _dependencies(specs)
+    db.engine.dispose()  # don't share connections with the sub-processes
+    done, running = set(), {}
+    with ProcessPoolExecutor(max_workers=n_parallel) as executor:
+        try:
+            while len(done) < len(specs):
+                for i, spec in enumerate(specs):
+                    if i not in done and i not in running.values() and dependencies[i] <= done:
+                        log.debug(f'Starting {short_cls(spec[0])} (after {len(dependencies[i])} others)')
+                        running[executor.submit(_run_spec, db, *spec)] = i
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future))
+                    future.result()
+        except BaseException:
+            log.warning(f'Stopping pipelines ({len(done)} of {len(specs)} complete); '
+                        f'run again to continue')
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
 
 
 class BasePipeline:
@@ -37,6 +124,23 @@ class BasePipeline:
         if args or kargs:
             log.warning(f'Unused ({type(self)}): {args} {list(kargs.keys())}')
 
+    @classmethod
+    def inputs(cls, *args, **kargs):
+        '''
+        The owners (as short class names) of statistics and Timestamps read by a pipeline constructed
+        with the given arguments (None if unknown, in which case it runs after all earlier, and before
+        all later, pipelines).
+        '''
+        return None
+
+    @classmethod
+    def outputs(cls, *args, **kargs):
+        '''
+        The owners (as short class names) of statistics and Timestamps written by a pipeline constructed
+        with the given arguments (None if unknown).
+        '''
+        return None
+
     def _assert(self, name, value):
         if value is None:
             raise Exception(f'Undefined {name}')
@@ -47,28 +151,42 @@ class BasePipeline:
 class MultiProcPipeline(BasePipeline):
 
     def __init__(self, db, *args, owner_out=None, force=False,
-                 overhead=1, cost_calc=20, cost_write=1, n_cpu=None, worker=None, id=None, **kargs):
+                 overhead=1, cost_calc=20, cost_write=1, n_cpu=None, worker=None, id=None, writer=None, **kargs):
         self._db = db
         self.owner_out = owner_out or self  # the future owner of any calculated statistics
         self.force = force  # force re-processing
         self.overhead = overhead  # next three args are used to decide if workers are needed
-        self.cost_calc = cost_calc  # see _cost_benefit for full details
+        self.cost_calc = cost_calc  # until costs have been measured (see _cost_benefit for full details)
         self.cost_write = cost_write  # defaults guarantee a single thread
-        self.n_cpu = max(1, int(cpu_count() * CPU_FRACTION)) if n_cpu is None else n_cpu  # number of cpus available
+        self.n_cpu = _n_cpu() if n_cpu is None else n_cpu  # number of cpus available
         self.worker = worker  # if True, then we're in a sub-process
         self.id = id  # the id for the pipeline entry in the database (passed to sub-processes)
+        self.writer = writer  # a WriterClient for loaders (used by workers)
+        self._loaders = []  # loaders used for the current item (see LoaderMixin)
+        self.__n, self.__calc, self.__write, self.__startups = 0, 0, 0, []  # measured costs (see PipelineCost)
         super().__init__(*args, **kargs)
 
+    @classmethod
+    def outputs(cls, *args, owner_out=None, **kargs):
+        return {short_cls(owner_out or cls)}
+
     def run(self):
+        '''
+        Process any missing data.  Returns the costs measured (used by workers to report to the parent).
+        '''
         with self._db.session_context() as s:
+            start = time()
             self._startup(s)
+            startup = time() - start
 
             if self.force:
                 if self.worker:
                     log.warning('Worker deleting data')
                 self._delete(s)
 
+            start = time()
             missing = self._missing(s)
+            self.__startups.append(startup + time() - start)
             log.debug(f'Have {len(missing)} missing ranges')
 
             if self.worker:
@@ -77,18 +195,48 @@ class MultiProcPipeline(BasePipeline):
             elif not missing:
                 log.info(f'No missing data for {short_cls(self)}')
             else:
-                n_total, n_parallel = self.__cost_benefit(missing, self.n_cpu)
+                n_total, n_parallel = self.__cost_benefit(s, missing, self.n_cpu)
                 if n_parallel < 2 or len(missing) == 1:
                     self._run_all(s, missing)
                 else:
-                    self.__spawn(s, missing, n_total, n_parallel)
+                    self._spawn(s, missing, n_total, n_parallel)
             self._shutdown(s)
+            if not self.worker:
+                self.__record(s)
+        return self.__n, self.__calc, self.__write, self.__startups
 
     def _run_all(self, s, missing):
+        # commits are not retried.  when pipelines run in parallel they wait for each other here via
+        # sqlite's busy_timeout (see squeal.database), which covers ordinary contention.  sqlite can still
+        # fail at once if waiting could deadlock, and that is retried where it has been seen (acquiring the
+        # database for a fast load - see load._acquire).  a failed commit cannot be retried in place
+        # because the session discards the transaction (the item would have to be run again).
         for missed in missing:
             log.debug(f'Run {missed}')
+            start = time()
             self._run_one(s, missed)
             s.commit()
+            self._measure(time() - start)
+
+    def _measure(self, duration, n=1):
+        # include the time for some items (write time comes from the loaders used)
+        write = sum(loader.load_time for loader in self._loaders)
+        self._loaders.clear()
+        self.__n += n
+        self.__calc += max(0, duration - write)
+        self.__write += write
+
+    def __record(self, s):
+        if self.id is None:
+            return
+        startup = sum(self.__startups) / len(self.__startups)
+        if self.__n:
+            cost = PipelineCost.update(s, self.id, startup,
+                                       calc=self.__calc / self.__n, write=self.__write / self.__n)
+        else:
+            cost = PipelineCost.update(s, self.id, startup)
+        log.debug(f'Measured costs for {short_cls(self)}: startup {startup:.2f}s, '
+                  f'calc {cost.calc or 0:.3f}s, write {cost.write or 0:.3f}s per item (smoothed over {cost.n} runs)')
 
     def _startup(self, s):
         pass
@@ -96,7 +244,7 @@ class MultiProcPipeline(BasePipeline):
     def _shutdown(self, s):
         pass
 
-    # as a general rule, _missing and _args should be implemented together
+    # as a general rule, _missing and _worker_kargs should be implemented together
     @abstractmethod
     def _missing(self, s):
         raise NotImplementedError()
@@ -109,11 +257,21 @@ class MultiProcPipeline(BasePipeline):
     def _run_one(self, s, missed):
         raise NotImplementedError()
 
-    def __cost_benefit(self, missing, n_cpu):
+    def __costs(self, s):
+        # measured costs (in seconds) if available, otherwise the (relative) constructor arguments
+        cost = PipelineCost.get(s, self.id) if self.id else None
+        if cost and cost.calc is not None:
+            log.debug(f'Using costs measured over {cost.n} runs')
+            return cost.startup, cost.calc, max(cost.write, MIN_COST)
+        else:
+            log.debug('No measured costs')
+            return self.overhead, self.cost_calc, self.cost_write
+
+    def __cost_benefit(self, s, missing, n_cpu):
 
         # is it worth using workers?  there's some cost in starting them up and there will be contention
         # in accessing the database.
-        # let's say COST (for one missing time) is COST_WRITE + COST_CALC (ignoring units).
+        # let's say COST (for one missing time) is COST_WRITE + COST_CALC.
         # if we have N_MISSING tasks divided into N_TOTAL workloads amongst N_PARALLEL workers
         # then we have these conditions (in order):
         #   N_PARALLEL * (COST_WRITES/ COST) <= 1 so that we avoid blocking completely on writes
@@ -121,50 +279,75 @@ class MultiProcPipeline(BasePipeline):
         #   N_TOTAL <= N_MISSING / N_PARALLEL
         #   (N_MISSING / N_TOTAL) * COST > OVERHEAD so we're not wasting our time
         #   N_TOTAL <= N_PARALLEL * MAX_REPEAT because we want large batches, but not too large
-        # really we should include estimates of disk and cpu speed here, in which case we need to separate
-        # out COST_READ too (currently folded into COST_CALC).
+        # the costs are measured on each run (see PipelineCost) so track changes in the data.  OVERHEAD is
+        # the start-up time.  COST_READ is folded into COST_CALC.
 
-        log.debug(f'Batching for n_cpu={n_cpu}, overhead={self.overhead}, '
-                  f'cost_writes={self.cost_write}, cost_calc={self.cost_calc}')
+        overhead, cost_calc, cost_write = self.__costs(s)
+        log.debug(f'Batching for n_cpu={n_cpu}, overhead={overhead:.3g}, '
+                  f'cost_write={cost_write:.3g}, cost_calc={cost_calc:.3g}')
         n_missing = len(missing)
-        cost = self.cost_write + self.cost_calc
-        limit = cost / self.cost_write
+        cost = cost_write + cost_calc
+        limit = cost / cost_write
         log.debug(f'Limit on parallel workers from database contention is {limit:3.1f}')
         log.debug(f'Limit on parallel workers from CPU count is {n_cpu:d}')
-        n_parallel = int(min(limit, n_cpu))
+        n_parallel = max(1, int(min(limit, n_cpu)))
         n_total = int((n_missing + n_parallel - 1) / n_parallel)
         log.debug(f'Limit on total workers from work available is {n_total:d}')
-        limit = cost * n_missing / self.overhead
+        limit = cost * n_missing / overhead if overhead else n_missing
         log.debug(f'Limit on total workers from overhead is {limit:3.1f}')
-        n_total = min(n_total, int(limit))
+        n_total = max(1, min(n_total, int(limit)))
         limit = n_parallel * MAX_REPEAT
         log.debug(f'Limit on total workers to boost batch size is {limit:d}')
         n_total = min(n_total, limit)
-        log.info(f'Threads: {n_total}/{n_parallel}')
+        log.debug(f'Decided {short_cls(self)} uses {n_parallel} worker(s) for {n_total} batch(es) '
+                  f'of about {n_missing / n_total:.1f} items')
         return n_total, n_parallel
 
-    def __spawn(self, s, missing, n_total, n_parallel):
+    def _spawn(self, s, missing, n_total, n_parallel):
 
         # unfortunately we have to do things with contiguous dates, which may introduce systematic
         # errors in our timing estimates
 
-        n_missing = len(missing)
-        workers = Workers(s, n_parallel, self.owner_out, self._base_command())
-        start, finish = None, -1
-        for i in range(n_total):
-            start = finish + 1
-            finish = int(0.5 + (i+1) * (n_missing-1) / n_total)
-            if start > finish: raise Exception('Bad chunking logic')
-            workers.run(self._args(missing, start, finish))
-        workers.wait()
-
-    # as a general rule, _missing and _args should be implemented together
-    @abstractmethod
-    def _args(self, missing, start, finish):
-        raise NotImplementedError()
+        # workers are forked (so start with everything already imported) and each runs a range of
+        # missing data.  their statistics are written by a single writer in this process, so they do not
+        # contend for the database.  the writer's thread is started only after all work is submitted
+        # (which is when the pool forks), since a thread running in the parent could leave locks held
+        # in the children.
 
+        if self.id is None:
+            raise Exception(f'{short_cls(self)} has no pipeline id, so cannot start workers')
+        s.commit()  # so that workers see any changes made here
+        self.__startups.clear()  # replaced by the start-up times measured in the workers
+        n_missing = len(missing)
+        with Writer(self._db, start=False) as writer, \
+                ProcessPoolExecutor(max_workers=n_parallel, mp_context=get_context('fork')) as executor:
+            try:
+                futures = []
+                start, finish = None, -1
+                for i in range(n_total):
+                    start = finish + 1
+                    finish = int(0.5 + (i+1) * (n_missing-1) / n_total)
+                    if start > finish: raise Exception('Bad chunking logic')
+                    futures.append(executor.submit(_run_worker, self._db, self.id, writer.client(),
+                                                   **self._worker_kargs(missing, start, finish)))
+                writer.start()
+                for future in as_completed(futures):
+                    self.__include(*future.result())
+            except BaseException:
+                writer.start()  # so that running workers can finish
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    def __include(self, n, calc, write, startups):
+        # include costs measured by a worker
+        self.__n += n
+        self.__calc += calc
+        self.__write += write
+        self.__startups.extend(startups)
+
+    # as a general rule, _missing and _worker_kargs should be implemented together
     @abstractmethod
-    def _base_command(self):
+    def _worker_kargs(self, missing, start, finish):
         raise NotImplementedError()
 
 
@@ -177,7 +360,11 @@ class UniProcPipeline(MultiProcPipeline):
 
 class LoaderMixin:
 
-    def _get_loader(self, s, **kargs):
+    def _get_loader(self, s, cls=StatisticJournalLoader, **kargs):
         if 'owner' not in kargs:
             kargs['owner'] = self.owner_out
-        return StatisticJournalLoader(s, **kargs)
+        if self.writer and 'writer' not in kargs:
+            kargs['writer'] = self.writer
+        loader = cls(s, **kargs)
+        self._loaders.append(loader)  # so that the time spent writing is measured
+        return loader
@@ -0,0 +1,130 @@
+
+import datetime as dt
+from collections import defaultdict
+from logging import getLogger
+from time import time
+
+import pandas as pd
+from sqlalchemy import event
+
+from ..squeal import PipelineProfile, ProfileType
+from ..squeal.types import short_cls
+
+log = getLogger(__name__)
+
+'''
+Profiling for pipelines (see ch2 statistics --profile).
+
+Pipelines are instrumented by wrapping the methods below on each instance, so no changes are needed
+to the pipelines themselves.  SQL is timed with SQLAlchemy events on the engine and attributed to
+the pipeline that is running.
+'''
+
+CALLS = ('run', '_startup', '_missing', '_run_one', '_read_data', '_read_dataframe', '_calculate_stats',
+         '_calculate_results', '_copy_results', '_load_data', '_shutdown')
+LOAD = 'load'
+RUN_PIPELINE = 'run_pipeline'
+START_TIMES = 'profile_start_times'
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, list)):
+        return len(value)
+    else:
+        return 0
+
+
+class Profiler:
+    '''
+    Collect timings, row counts and SQL statement counts for pipelines run in this process.
+
+      with Profiler(db) as profiler:
+          profiler.instrument(pipeline)
+          pipeline.run()
+
+    The totals are saved (as PipelineProfile entries identified by the run attribute) on exit.
+    '''
+
+    def __init__(self, db):
+        self._db = db
+        self.run = None
+        self.__calls = defaultdict(lambda: [0, 0, 0, 0])  # (scope, name) -> calls, seconds, rows, statements
+        self.__sql = defaultdict(lambda: [0, 0])  # (scope, statement) -> calls, seconds
+        self.__scope = ''
+        self.__statements = 0
+        self.__start = None
+
+    def __enter__(self):
+        self.run = dt.datetime.now(tz=dt.timezone.utc)
+        self.__start = time()
+        event.listen(self._db.engine, 'before_cursor_execute', self.__before)
+        event.listen(self._db.engine, 'after_cursor_execute', self.__after)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self._db.engine, 'before_cursor_execute', self.__before)
+        event.remove(self._db.engine, 'after_cursor_execute', self.__after)
+        self.__add('', RUN_PIPELINE, time() - self.__start, 0, self.__statements)
+        self.__save()
+
+    def __before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(START_TIMES, []).append(time())
+
+    def __after(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time() - conn.info[START_TIMES].pop()
+        self.__statements += 1
+        sql = self.__sql[(self.__scope, statement)]
+        sql[0] += 1
+        sql[1] += duration
+
+    def __add(self, scope, name, duration, rows, statements):
+        call = self.__calls[(scope, name)]
+        call[0] += 1
+        call[1] += duration
+        call[2] += rows
+        call[3] += statements
+
+    def instrument(self, pipeline):
+        '''
+        Time the methods in CALLS (where they exist) and the load() of any loaders from _get_loader().
+        '''
+        scope = short_cls(pipeline)
+        for name in CALLS:
+            method = getattr(pipeline, name, None)
+            if method:
+                setattr(pipeline, name, self.__timed(scope, name, method))
+        if hasattr(pipeline, '_get_loader'):
+            get_loader = pipeline._get_loader
+
+            def instrumented(*args, **kargs):
+                loader = get_loader(*args, **kargs)
+                loader.load = self.__timed(scope, LOAD, loader.load, rows=lambda _: len(loader))
+                return loader
+
+            pipeline._get_loader = instrumented
+        return pipeline
+
+    def __timed(self, scope, name, method, rows=_rows):
+
+        def timed(*args, **kargs):
+            previous, self.__scope = self.__scope, scope
+            start, statements, result = time(), self.__statements, None
+            try:
+                result = method(*args, **kargs)
+                return result
+            finally:
+                self.__add(scope, name, time() - start, rows(result), self.__statements - statements)
+                self.__scope = previous
+
+        return timed
+
+    def __save(self):
+        with self._db.session_context() as s:
+            for (scope, name), (calls, seconds, rows, statements) in self.__calls.items():
+                s.add(PipelineProfile(run=self.run, type=ProfileType.CALL, scope=scope, name=name, calls=calls,
+                                      seconds=seconds, rows=rows, statements=statements))
+            for (scope, statement), (calls, seconds) in self.__sql.items():
+                s.add(PipelineProfile(run=self.run, type=ProfileType.SQL, scope=scope, name=statement,
+                                      calls=calls, seconds=seconds))
+            s.commit()
+        log.info(f'Saved profile for run at {self.run} ({self.__statements} SQL statements)')
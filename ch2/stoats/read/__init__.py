@@ -1,6 +1,10 @@
 
 from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from logging import getLogger
+from time import time
 
 from ..pipeline import MultiProcPipeline, UniProcPipeline, LoaderMixin
 from ... import FatalException
@@ -14,6 +18,18 @@ from ...squeal import Timestamp
 log = getLogger(__name__)
 
 
+def read_fit_file(path, *filters):
+    '''
+    Parse a FIT file into a list of DictRecords, sorted by time.
+
+    This does not use the database, so can run in a separate process (see MultiProcFitReader).
+    '''
+    types, messages, records = filtered_records(read_fit(path))
+    return [record.as_dict(*filters)
+            for _, _, record in sorted(records,
+                                       key=lambda r: r[2].timestamp if r[2].timestamp else to_time(0.0))]
+
+
 class AbortImport(Exception):
     pass
 
@@ -24,6 +40,8 @@ class AbortImportButMarkScanned(AbortImport):
 
 class FitReaderMixin(LoaderMixin):
 
+    fit_filters = ()  # applied to records when parsing (must be picklable for MultiProcFitReader)
+
     def __init__(self, *args, paths=None, **kargs):
         self.paths = paths
         super().__init__(*args, **kargs)
@@ -38,9 +56,9 @@ class FitReaderMixin(LoaderMixin):
     def _missing(self, s):
         return filter_modified_files(s, self.paths, self.owner_out, self.force)
 
-    def _run_one(self, s, path):
+    def _run_one(self, s, path, parse=None):
         try:
-            self._read(s, path)
+            self._read(s, path, parse or partial(read_fit_file, path, *self.fit_filters))
             update_scan(s, path, self.owner_out)
         except AbortImportButMarkScanned as e:
             log.warning(f'Could not process {path} (scanned)')
@@ -52,20 +70,14 @@ class FitReaderMixin(LoaderMixin):
             log.warning(f'Could not process {path} (ignored)')
             log_current_exception()
 
-    def _read(self, s, path):
-        source, data = self._read_data(s, path)
+    def _read(self, s, path, parse):
+        source, data = self._read_data(s, path, parse())
         s.commit()
         with Timestamp(owner=self.owner_out, source=source).on_success(s):
             loader = self._get_loader(s)
             self._load_data(s, loader, data)
             loader.load()
 
-    def _read_fit_file(self, path, *options):
-        types, messages, records = filtered_records(read_fit(path))
-        return [record.as_dict(*options)
-                for _, _, record in sorted(records,
-                                           key=lambda r: r[2].timestamp if r[2].timestamp else to_time(0.0))]
-
     def _first(self, path, records, *names):
         return self.__assert_contained(path, records, names, 0)
 
@@ -80,7 +92,7 @@ class FitReaderMixin(LoaderMixin):
             raise AbortImportButMarkScanned()
 
     @abstractmethod
-    def _read_data(self, s, path):
+    def _read_data(self, s, path, records):
         raise NotImplementedError()
 
     @abstractmethod
@@ -90,16 +102,32 @@ class FitReaderMixin(LoaderMixin):
 
 class MultiProcFitReader(FitReaderMixin, MultiProcPipeline):
 
-    def _args(self, missing, start, finish):
-        paths = ' '.join(repr(path) for path in missing[start:finish+1])  # quote names
-        log.info(f'Starting worker for {missing[start]} - {missing[finish]}')
-        return paths
+    def _spawn(self, s, missing, n_total, n_parallel):
 
+        # parsing is cpu-bound and needs no database, so is done in a pool of processes.
+        # the results are written here, in order, so there is a single writer and no contention.
+        # a limited number of files are queued so that parsed data do not accumulate in memory.
 
-class UniProcFitReader(FitReaderMixin, UniProcPipeline):
+        log.info(f'Parsing {len(missing)} files with {n_parallel} processes')
+        with ProcessPoolExecutor(max_workers=n_parallel) as executor:
+            queue = deque()
+            for path in missing:
+                queue.append((path, executor.submit(read_fit_file, path, *self.fit_filters)))
+                if len(queue) > 2 * n_parallel:
+                    self.__run_queued(s, queue)
+            while queue:
+                self.__run_queued(s, queue)
 
-    def _base_command(self):
-        raise Exception('UniProc does not support workers')
+    def __run_queued(self, s, queue):
+        path, future = queue.popleft()
+        log.debug(f'Run {path}')
+        start = time()
+        self._run_one(s, path, parse=future.result)
+        s.commit()  # waits for other pipelines via busy_timeout (see MultiProcPipeline._run_all)
+        self._measure(time() - start)
+
+
+class UniProcFitReader(FitReaderMixin, UniProcPipeline):
 
-    def _args(self, missing, start, finish):
+    def _worker_kargs(self, missing, start, finish):
         raise Exception('UniProc does not support workers')
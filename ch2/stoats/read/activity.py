@@ -9,7 +9,6 @@ from ..names import LATITUDE, LONGITUDE, M, SPHERICAL_MERCATOR_X, SPHERICAL_MERC
     SPORT_GENERIC, KIT_USED
 from ..read import MultiProcFitReader, AbortImportButMarkScanned
 from ... import FatalException
-from ...commands.args import ACTIVITIES, WORKER, FAST, mm, FORCE, VERBOSITY, LOG
 from ...fit.format.records import fix_degrees, merge_duplicates, no_bad_values
 from ...lib.date import to_time
 from ...sortem.bilinear import bilinear_elevation_from_constant
@@ -27,8 +26,11 @@ log = getLogger(__name__)
 
 class ActivityReader(MultiProcFitReader):
 
-    def __init__(self, *args, constants=None, sport_to_activity=None, record_to_db=None, **kargs):
+    fit_filters = (merge_duplicates, fix_degrees, no_bad_values)
+
+    def __init__(self, *args, constants=None, sport_to_activity=None, record_to_db=None, arrays=False, **kargs):
         self.constants = constants
+        self.arrays = arrays  # also store values as arrays (see StatisticArray)
         self.sport_to_activity = self._assert('sport_to_activity', sport_to_activity)
         self.record_to_db = [(field, name, units, STATISTIC_JOURNAL_CLASSES[type])
                              for field, (name, units, type)
@@ -36,21 +38,17 @@ class ActivityReader(MultiProcFitReader):
         self.add_elevation = not any(name == ELEVATION for (field, name, units, type) in self.record_to_db)
         super().__init__(*args, **kargs)
 
-    def _base_command(self):
-        if self.constants:
-            constants = ' '.join(f'-D "{constant}"' for constant in self.constants) + ' -- '
-        else:
-            constants = ''
-        return f'{{ch2}} --{VERBOSITY} 0 --{LOG} {{log}} -f {self._db.path} ' \
-               f'{ACTIVITIES} {mm(WORKER)} {self.id} --{FAST} {mm(FORCE) if self.force else ""} {constants}'
+    def _get_loader(self, s, **kargs):
+        if 'arrays' not in kargs:
+            kargs['arrays'] = self.arrays
+        return super()._get_loader(s, **kargs)
 
     def _startup(self, s):
         super()._startup(s)
         self.__oracle = bilinear_elevation_from_constant(s)
 
-    def _read_data(self, s, path):
+    def _read_data(self, s, path, records):
         log.info('Reading activity data from %s' % path)
-        records = self._read_fit_file(path, merge_duplicates, fix_degrees, no_bad_values)
         ajournal, activity_group, first_timestamp = self._create_activity(s, path, records)
         return ajournal, (ajournal, activity_group, first_timestamp, path, records)
 
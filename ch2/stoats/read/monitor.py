@@ -5,13 +5,11 @@ from logging import getLogger
 import numpy as np
 import pandas as pd
 from sqlalchemy import desc, and_, or_, distinct, func, select
-from sqlalchemy.sql.functions import count
 
 from ..load import StatisticJournalLoader
 from ..names import HEART_RATE, BPM, STEPS, STEPS_UNITS, CUMULATIVE_STEPS, _new, TIME, SOURCE
 from ..read import AbortImportButMarkScanned, AbortImport, MultiProcFitReader
 from ... import FatalException
-from ...commands.args import MONITOR, WORKER, FAST, mm, FORCE, VERBOSITY, LOG
 from ...data.frame import _tables
 from ...fit.format.records import fix_degrees, unpack_single_bytes, merge_duplicates
 from ...lib.date import time_to_local_date, format_time
@@ -58,27 +56,15 @@ def missing_dates(s, force=False):
 
 class MonitorLoader(StatisticJournalLoader):
 
-    def _preload(self):
-        dummy = super()._preload()
-        try:
-            for name in self._s.query(StatisticName). \
-                    filter(StatisticName.name == CUMULATIVE_STEPS,
-                           StatisticName.owner == self._owner).all():
-                n = self._s.query(count(StatisticJournal.id)). \
-                    filter(StatisticJournal.statistic_name == name,
-                           StatisticJournal.time >= self.start,
-                           StatisticJournal.time <= self.finish).scalar()
-                if n and self.start and self.finish:
-                    log.warning(f'Deleting {n} overlapping {CUMULATIVE_STEPS}')
-                    self._s.query(StatisticJournal). \
-                        filter(StatisticJournal.statistic_name == name,
-                               StatisticJournal.time >= self.start,
-                               StatisticJournal.time <= self.finish).delete()
-        except:
-            log.debug('Failed to clean database')
-            self._s.rollback()
-            raise
-        return dummy
+    def _deletes(self):
+        # overlapping steps are replaced (deleted by whoever loads the data, which may be a Writer)
+        if self.start and self.finish:
+            names = self._s.query(StatisticName). \
+                filter(StatisticName.name == CUMULATIVE_STEPS,
+                       StatisticName.owner == self._owner).all()
+            return [(name.id, self.start, self.finish) for name in names]
+        else:
+            return []
 
     def _resolve_duplicate(self, name, instance, prev):
         log.warning(f'Using max of duplicate values at {instance.time} for {name} ({instance.value}/{prev.value})')
@@ -90,6 +76,8 @@ NEW_STEPS = _new(STEPS)
 
 class MonitorReader(MultiProcFitReader):
 
+    fit_filters = (merge_duplicates, fix_degrees, unpack_single_bytes)
+
     def __init__(self, *args, sport_to_activity=None, **kargs):
         self.sport_to_activity = self._assert('sport_to_activity', sport_to_activity)
         super().__init__(*args, **kargs)
@@ -100,13 +88,7 @@ class MonitorReader(MultiProcFitReader):
         super()._startup(s)
 
     def _get_loader(self, s, **kargs):
-        if 'owner' not in kargs:
-            kargs['owner'] = self.owner_out
-        return MonitorLoader(s, **kargs)
-
-    def _base_command(self):
-        return f'{{ch2}} --{VERBOSITY} 0 --{LOG} {{log}} -f {self._db.path} ' \
-               f'{MONITOR} {mm(WORKER)} {self.id} --{FAST} {mm(FORCE) if self.force else ""}'
+        return super()._get_loader(s, cls=MonitorLoader, **kargs)
 
     def _delete_contained(self, s, start, finish, path):
         for mjournal in s.query(MonitorJournal). \
@@ -138,9 +120,7 @@ class MonitorReader(MultiProcFitReader):
         self._delete_contained(s, start, finish, path)
         s.commit()
 
-    def _read_data(self, s, path):
-
-        records = self._read_fit_file(path, merge_duplicates, fix_degrees, unpack_single_bytes)
+    def _read_data(self, s, path, records):
 
         first_timestamp = self._first(path, records, MONITORING_INFO_ATTR).timestamp
         last_timestamp = self._last(path, records, MONITORING_ATTR).timestamp
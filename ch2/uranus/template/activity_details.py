@@ -31,9 +31,10 @@ def activity_details(local_time, activity_group_name):
 
     s = session('-v2')
 
-    activity = std_activity_statistics(s, local_time=local_time, activity_group_name=activity_group_name)
+    activity = std_activity_statistics(s, local_time=local_time, activity_group_name=activity_group_name,
+                                       cache=True)
     details = activity_statistics(s, 'Climb %', ACTIVE_TIME, ACTIVE_DISTANCE, local_time=local_time,
-                                  activity_group_name=activity_group_name)
+                                  activity_group_name=activity_group_name, cache=True)
     health = std_health_statistics(s)
     hr_zones = hr_zones_from_database(s, local_time, activity_group_name)
 
@@ -26,12 +26,12 @@ def all_activities(start, finish):
 
     s = session('-v2')
     maps = [map_thumbnail(100, 120, data)
-            for data in (activity_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
-                                             ACTIVE_DISTANCE, ACTIVE_TIME,
-                                             activity_journal=aj)
-                         for aj in s.query(ActivityJournal).
-                             filter(ActivityJournal.start >= local_date_to_time(start),
-                                    ActivityJournal.start < local_date_to_time(finish)).all())
+            for data in activities_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
+                                              ACTIVE_DISTANCE, ACTIVE_TIME,
+                                              activity_journals=s.query(ActivityJournal).
+                                              filter(ActivityJournal.start >= local_date_to_time(start),
+                                                     ActivityJournal.start < local_date_to_time(finish)).
+                                              order_by(ActivityJournal.start).all()).values()
             if len(data[SPHERICAL_MERCATOR_X].dropna()) > 10]
     print(f'Found {len(maps)} activities')
 
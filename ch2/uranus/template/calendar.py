@@ -119,9 +119,8 @@ def calendar():
     '''
 
     # avoid throwing an exception if missing; plot skipped on next line
-    df = statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, check=False)
+    df = statistics(s, FITNESS_D_ANY, FATIGUE_D_ANY, check=False, resample='1D', agg='mean')
     if present(df, FITNESS_D_ANY, pattern=True):
-        df = df.resample('1D').mean()
         # take shortest period values when multiple definitions
         fitness = sorted_numeric_labels(df.columns, FITNESS)[0]
         fatigue = sorted_numeric_labels(df.columns, FATIGUE)[0]
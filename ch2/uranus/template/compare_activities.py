@@ -31,10 +31,12 @@ def compare_activities(local_time, compare_time, activity_group_name):
 
     s = session('-v2')
 
-    activity = std_activity_statistics(s, local_time=local_time, activity_group_name=activity_group_name)
-    compare = std_activity_statistics(s, local_time=compare_time, activity_group_name=activity_group_name)
+    activity = std_activity_statistics(s, local_time=local_time, activity_group_name=activity_group_name,
+                                       cache=True)
+    compare = std_activity_statistics(s, local_time=compare_time, activity_group_name=activity_group_name,
+                                      cache=True)
     details = activity_statistics(s, 'Climb %', ACTIVE_TIME, ACTIVE_DISTANCE, local_time=local_time,
-                                  activity_group_name=activity_group_name)
+                                  activity_group_name=activity_group_name, cache=True)
     health = std_health_statistics(s)
     hr_zones = hr_zones_from_database(s, local_time, activity_group_name)
 
@@ -1,5 +1,6 @@
 
 import numpy as np
+import pandas as pd
 from bokeh.io import show, output_file
 from bokeh.plotting import figure
 
@@ -22,14 +23,18 @@ def heart_rate(start, finish):
     bin_width = 1
 
     s = session('-v2')
-    df = statistics(s, HEART_RATE, owner=MonitorReader, local_start=start, local_finish=finish)
-    data = sorted(df[HEART_RATE])
+    # read in chunks and count each heart rate, so that long periods fit in memory
+    counts = pd.Series(dtype=float)
+    for df in statistics_chunks(s, HEART_RATE, owner=MonitorReader, local_start=start, local_finish=finish):
+        counts = counts.add(df[HEART_RATE].dropna().value_counts(), fill_value=0)
+    counts = counts.sort_index()
+    cumulative = counts.cumsum()
     # take care here to get a fixed number of (integer) heart rates in each bin
     # this avoids aliasing effects.
-    lo, hi = data[0] - 0.5, data[-1] + 0.5
+    lo, hi = counts.index[0] - 0.5, counts.index[-1] + 0.5
     n = int(hi - lo + bin_width - 0.5) // bin_width
     hi = lo + n * bin_width
-    hist, edges = np.histogram(data, density=True, bins=n, range=(lo, hi))
+    hist, edges = np.histogram(counts.index, weights=counts.values, density=True, bins=n, range=(lo, hi))
     y_max = max(hist)
 
     '''
@@ -47,6 +52,6 @@ def heart_rate(start, finish):
     f.yaxis.axis_label = 'Measurement Density'
     f.quad(top=hist, bottom=0, left=edges[:-1], right=edges[1:], fill_color="grey", line_color="white", alpha=0.5)
     for pc in (5, 10, 15):
-        x = data[int(len(data) * pc / 100)]
+        x = cumulative.index[cumulative.searchsorted(int(cumulative.iloc[-1] * pc / 100), side='right')]
         f.line([x, x], [0, y_max], line_color='red', line_dash='dashed')
     show(f)
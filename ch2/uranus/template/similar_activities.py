@@ -25,12 +25,11 @@ def similar_activities(local_time, activity_group_name):
 
     s = session('-v2')
 
+    similar = [similar[0] for similar in nearby_activities(s, local_time=local_time,
+                                                           activity_group_name=activity_group_name)]
     maps = [map_thumbnail(100, 120, data)
-            for data in (activity_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
-                                             ACTIVE_DISTANCE, ACTIVE_TIME,
-                                             activity_journal=similar[0])
-                         for similar in nearby_activities(s, local_time=local_time,
-                                                          activity_group_name=activity_group_name))
+            for data in activities_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
+                                              ACTIVE_DISTANCE, ACTIVE_TIME, activity_journals=similar).values()
             if len(data[SPHERICAL_MERCATOR_X].dropna()) > 10]
 
     print(f'Found {len(maps)} activities')
@@ -30,10 +30,9 @@ def some_activities(constraint):
 
     s = session('-v2')
     maps = [map_thumbnail(100, 120, data)
-            for data in (activity_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
-                                             ACTIVE_DISTANCE, TOTAL_CLIMB,
-                                             activity_journal=aj)
-                         for aj in constrained_activities(s, constraint))
+            for data in activities_statistics(s, SPHERICAL_MERCATOR_X, SPHERICAL_MERCATOR_Y,
+                                              ACTIVE_DISTANCE, TOTAL_CLIMB,
+                                              activity_journals=constrained_activities(s, constraint)).values()
             if len(data[SPHERICAL_MERCATOR_X].dropna()) > 10]
     print(f'Found {len(maps)} activities')
 
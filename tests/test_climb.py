@@ -0,0 +1,116 @@
+
+from random import Random
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from ch2.data import climb
+from ch2.data.climb import Climb, search, biggest_reversal, find_climb_distances, SCORE
+from ch2.data.frame import present
+from ch2.lib.data import get_index_loc
+from ch2.stoats.names import ELEVATION, _d
+
+
+# the original (quadratic) implementations, used as a reference
+
+def old_biggest_reversal(df):
+    max_elevation, max_indices, d = 0, (None, None), df.index[1] - df.index[0]
+    for offset in range(1, len(df)-1):
+        df[_d(ELEVATION)] = df[ELEVATION].diff(-offset)
+        if present(df, _d(ELEVATION)):
+            d_elevation = df[_d(ELEVATION)].dropna().max()
+            if d_elevation > max_elevation:
+                max_elevation = d_elevation
+                hi = df.loc[df[_d(ELEVATION)] == max_elevation].index[0]  # break ties
+                lo = df.index[get_index_loc(df, hi) + offset]
+                max_indices = (lo, hi)
+    return max_elevation, max_indices[0], max_indices[1]
+
+
+def old_search(df, params=Climb()):
+    max_score, max_indices, d = 0, (None, None), df.index[1] - df.index[0]
+    for offset in range(len(df)-1, 0, -1):
+        df[_d(ELEVATION)] = df[ELEVATION].diff(offset)
+        d_distance = d * offset
+        min_elevation = max(params.min_elevation, params.min_gradient * d_distance / 100)
+        if df[_d(ELEVATION)].max() > min_elevation:  # avoid some work
+            df[SCORE] = df[_d(ELEVATION)] / d_distance ** params.phi
+            score = df.loc[df[_d(ELEVATION)] > min_elevation, SCORE].max()
+            if not np.isnan(score) and score > max_score:
+                max_score = score
+                hi = df.loc[df[SCORE] == max_score].index[0]
+                lo = df.index[get_index_loc(df, hi) - offset]
+                max_indices = (lo, hi)
+    return max_score, max_indices[0], max_indices[1]
+
+
+def profile(seed, n, step=10.0, quantise=None, drift=0.0, noise=5.0):
+    # a random walk in elevation over a regular distance grid (as after resampling)
+    random = Random(seed)
+    elevation, value = [], random.uniform(0, 500)
+    for _ in range(n):
+        value += drift + random.gauss(0, noise)
+        if random.random() < 0.05:
+            value += random.choice([-1, 1]) * random.uniform(20, 100)  # steep sections
+        elevation.append(round(value / quantise) * quantise if quantise else value)
+    start = random.uniform(0, 1000)
+    return pd.DataFrame({ELEVATION: elevation}, index=pd.Index([start + i * step for i in range(n)]))
+
+
+class TestClimb(TestCase):
+
+    def profiles(self):
+        for seed in range(40):
+            yield profile(seed, 3 + seed * 7, quantise=(None, 1, 5)[seed % 3], drift=(seed % 5 - 2) * 0.5)
+        yield profile(100, 50, noise=0)  # flat
+        yield profile(101, 50, noise=0, drift=3)  # steady climb
+        yield profile(102, 50, noise=0, drift=-3)  # steady descent
+
+    def test_search(self):
+        for df in self.profiles():
+            for params in (Climb(), Climb(phi=0, min_elevation=20), Climb(phi=1, min_gradient=0)):
+                self.assertEqual(search(df.copy(), params=params), old_search(df.copy(), params=params))
+
+    def test_reversal(self):
+        for df in self.profiles():
+            self.assertEqual(biggest_reversal(df.copy()), old_biggest_reversal(df.copy()))
+
+    def test_ties(self):
+        df = pd.DataFrame({ELEVATION: [10, 0, 0, 10, 10, 0, 10, 0]}, index=pd.Index([10.0 * i for i in range(8)]))
+        self.assertEqual(biggest_reversal(df.copy()), (10, 10.0, 0.0))
+        self.assertEqual(biggest_reversal(df.copy()), old_biggest_reversal(df.copy()))
+        # the reversal over the whole range is not considered
+        df = pd.DataFrame({ELEVATION: [100, 50, 60, 0]}, index=pd.Index([10.0 * i for i in range(4)]))
+        self.assertEqual(biggest_reversal(df.copy()), (60, 30.0, 20.0))
+        self.assertEqual(biggest_reversal(df.copy()), old_biggest_reversal(df.copy()))
+
+    def test_climbs(self):
+        # the complete search (including the coarse grid for long data) selects the same climbs
+        for seed in range(5):
+            df = profile(seed, 1500, step=5.0, drift=1.0, noise=3)
+            new = list(find_climb_distances(df.copy()))
+            self.assertTrue(new)
+            with patch.object(climb, 'search', old_search), \
+                    patch.object(climb, 'biggest_reversal', old_biggest_reversal):
+                old = list(find_climb_distances(df.copy()))
+            self.assertEqual(new, old)
+
+    def test_gaps(self):
+        # missing elevations are skipped, so climbs can span a gap
+        for seed in range(10):
+            df = profile(seed, 50 + seed * 20, drift=1.0)
+            df.iloc[Random(seed).sample(range(len(df)), len(df) // 10), 0] = np.nan
+            for params in (Climb(), Climb(phi=0, min_elevation=20), Climb(phi=1, min_gradient=0)):
+                self.assertEqual(search(df.copy(), params=params), old_search(df.copy(), params=params))
+        df = pd.DataFrame({ELEVATION: [0, 50, np.nan, 100]}, index=pd.Index([10.0 * i for i in range(4)]))
+        self.assertEqual(search(df.copy(), params=Climb(min_gradient=0))[1:], (0.0, 30.0))
+
+    def test_steady(self):
+        # a long steady climb is the worst case for the search (every earlier point is a possible start)
+        n = 10000
+        df = pd.DataFrame({ELEVATION: np.arange(n) * 0.5}, index=pd.Index(np.arange(n) * 10.0))
+        self.assertEqual(search(df.copy())[1:], (0.0, 10.0 * (n - 1)))
+        short = df.iloc[:1000].copy()
+        self.assertEqual(search(short.copy()), old_search(short.copy()))
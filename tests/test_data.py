@@ -1,12 +1,19 @@
 from json import loads
 from logging import getLogger, basicConfig, INFO
+from shutil import rmtree
 from sys import stdout
 from tempfile import NamedTemporaryFile
 from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+import pendulum as p
 
 from ch2.commands.args import bootstrap_file, m, V
+from ch2.data.cache import cached, cache_dir
+from ch2.data.frame import statistics, statistics_chunks
 from ch2.lib.data import MutableAttr, reftuple
-from ch2.squeal import StatisticJournalFloat, StatisticJournalText, Source
+from ch2.squeal import StatisticJournalFloat, StatisticJournalText, Source, Timestamp
 from ch2.squeal.tables.source import SourceType
 
 
@@ -44,3 +51,92 @@ class TestData(TestCase):
         from ch2.stoats.calculate.power import Power, Bike
         self.assertEqual(Bike.__module__, 'ch2.stoats.calculate.power')
         self.assertEqual(Power.__module__, 'ch2.stoats.calculate.power')
+
+    def test_cache(self):
+        calls = []
+
+        def calculate():
+            calls.append(None)
+            return pd.DataFrame({'x': [len(calls)]})
+
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                source = Source(type=SourceType.SOURCE)
+                s.add(source)
+                s.commit()
+                try:
+                    self.assertEqual(cached(s, source, ('test', 1), calculate)['x'][0], 1)
+                    self.assertEqual(cached(s, source, ('test', 1), calculate)['x'][0], 1)
+                    self.assertEqual(cached(s, source, ('test', 2), calculate)['x'][0], 2)
+                    # a new timestamp for the source invalidates the cache
+                    Timestamp.set(s, self, source=source)
+                    self.assertEqual(cached(s, source, ('test', 1), calculate)['x'][0], 3)
+                    self.assertEqual(len(calls), 3)
+                    # as does a different local timezone (frames contain local times)
+                    with patch.object(p.tz, 'get_local_timezone', lambda: p.timezone('Europe/Paris')):
+                        self.assertEqual(cached(s, source, ('test', 1), calculate)['x'][0], 4)
+                    self.assertEqual(cached(s, source, ('test', 1), calculate)['x'][0], 5)
+                finally:
+                    rmtree(cache_dir(s), ignore_errors=True)
+
+    def test_resample(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                source = Source(type=SourceType.SOURCE)
+                s.add(source)
+                for day, hour, value in [(1, 1, 1), (1, 2, 3), (2, 1, 5), (4, 1, 7)]:
+                    StatisticJournalFloat.add(s, 'Value', None, None, self, None, source, value,
+                                              f'2000-01-0{day} 0{hour}:00:00')
+                s.commit()
+                sum = statistics(s, 'Value', resample='1D', agg='sum')
+                self.assertEqual(list(sum['Value']), [4, 5, 7])
+                self.assertEqual([time.day for time in sum.index], [1, 2, 4])
+                self.assertEqual(list(statistics(s, 'Value', resample='1D', agg='mean')['Value']), [2, 5, 7])
+                # intervals are aligned with the epoch (so 2000-01-01 ends an interval)
+                self.assertEqual(list(statistics(s, 'Value', resample='2D', agg='max')['Value']), [3, 5, 7])
+                self.assertEqual(len(statistics(s, 'Value', resample='1h', agg='sum')), 4)
+                # days are utc days, whatever the local timezone (as when resampling in pandas)
+                for time, value in [('2000-01-05 23:30:00', 1), ('2000-01-06 00:30:00', 2),
+                                    ('2000-01-06 23:59:00', 4)]:
+                    StatisticJournalFloat.add(s, 'Other', None, None, self, None, source, value, time)
+                s.commit()
+                sum = statistics(s, 'Other', resample='1D', agg='sum')
+                self.assertEqual(list(sum['Other']), [1, 6])
+                self.assertEqual([str(time) for time in sum.index],
+                                 ['2000-01-05 00:00:00+00:00', '2000-01-06 00:00:00+00:00'])
+                self.assertEqual(sum['Other'].to_dict(),
+                                 statistics(s, 'Other').resample('1D').sum()['Other'].to_dict())
+
+    def test_chunks(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                source = Source(type=SourceType.SOURCE)
+                s.add(source)
+                for day in range(1, 10):
+                    StatisticJournalFloat.add(s, 'A', None, None, self, None, source, day, f'2000-01-0{day}')
+                    if day % 2:
+                        StatisticJournalFloat.add(s, 'B', None, None, self, None, source, -day, f'2000-01-0{day}')
+                s.commit()
+                all = statistics(s, 'A', 'B')
+                for rows in (1, 2, 3, 100):
+                    chunks = list(statistics_chunks(s, 'A', 'B', rows=rows))
+                    self.assertEqual(len(chunks) > 1, rows < 14)
+                    # times are never split across chunks
+                    self.assertTrue(pd.concat(chunks).equals(all), rows)
+
+    def test_duplicates(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                for value in (1, 2):
+                    source = Source(type=SourceType.SOURCE)
+                    s.add(source)
+                    StatisticJournalFloat.add(s, 'Value', None, None, self, None, source, value, '2000-01-01')
+                s.commit()
+                # values with the same time (from different sources) are dropped, with a warning
+                # (the most recent value is kept)
+                with self.assertLogs('ch2.data.frame', level='WARNING'):
+                    self.assertEqual(list(statistics(s, 'Value')['Value']), [2])
@@ -2,12 +2,16 @@
 from glob import glob
 from logging import getLogger, basicConfig, INFO
 from os.path import basename, join, exists
+from pickle import dumps, loads
 from sys import stdout
 from unittest import TestCase
 
+import numpy as np
+
 from ch2.commands.args import FIELDS, TABLES, GREP
-from ch2.fit.format.read import filtered_records
+from ch2.fit.format.read import filtered_records, filtered_columns
 from ch2.fit.format.records import no_names, append_units, no_bad_values, fix_degrees, chain, no_units
+from ch2.fit.format.tokens import Checksum
 from ch2.fit.profile.fields import DynamicField
 from ch2.fit.profile.profile import read_external_profile, read_fit
 from ch2.fit.summary import summarize, summarize_csv, summarize_tables
@@ -40,6 +44,20 @@ class TestFit(TestCase, OutputMixin):
         fields = ','.join(sorted(field.references))
         self.assertEqual(fields, 'duration_type,target_type')
 
+    def test_compact_profile(self):
+        nlog, types, messages = read_external_profile(self.profile_path)
+        shared = types.shared(nlog)
+        messages.compact(nlog, types, shared)
+        types.compact(nlog, shared)
+        record = messages.profile_to_message('record')
+        self.assertIs(messages.number_to_message(record.number), record)
+        # unknown numbers are cached separately from the messages
+        missing = messages.number_to_message(65280)
+        self.assertEqual(missing.name, 'MESSAGE 65280')
+        self.assertIs(messages.number_to_message(65280), missing)
+        with self.assertRaises(KeyError):
+            messages.profile_to_message(65280)
+
     def test_decode(self):
         types, messages, records = \
             filtered_records(read_fit(join(self.test_dir, 'source/personal/2018-07-26-rec.fit')),
@@ -79,6 +97,65 @@ class TestFit(TestCase, OutputMixin):
                     print(record.into(tuple, filter=chain(no_names, append_units, no_bad_values, fix_degrees)),
                           file=output)
 
+    def test_columns(self):
+        # columns should contain the same values as records (one uses compressed speed / distance)
+        for name in ('personal/2018-08-27-rec.fit', 'python-fitparse/null_compressed_speed_dist.fit'):
+            data = read_fit(join(self.test_dir, 'source', name))
+            types, messages, records = filtered_records(data)
+            records = [record for _, _, record in records if record.name == 'record']
+            types, messages, columns = filtered_columns(data, ['record'])
+            array, units = columns['record']
+            self.assertEqual(len(array), len(records))
+            self.assertEqual(units['enhanced_speed'], 'm/s')
+            for row, record in zip(array, records):
+                self.assertEqual(row['timestamp'].astype(int), int(record.timestamp.timestamp()))
+                for field in array.dtype.names[1:]:
+                    values = record.data.get(field, (None, None))[0]
+                    if values is None:
+                        self.assertTrue(np.isnan(row[field]), field)
+                    else:
+                        self.assertAlmostEqual(row[field], values[0], msg=field)
+
+    def test_crc(self):
+
+        def nibble_crc(data):
+            # the original implementation, for comparison
+            CRC = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                   0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
+            checksum = 0
+            for byte in data:
+                tmp = CRC[checksum & 0xf]
+                checksum = (checksum >> 4) & 0xfff
+                checksum = checksum ^ tmp ^ CRC[byte & 0xf]
+                tmp = CRC[checksum & 0xf]
+                checksum = (checksum >> 4) & 0xfff
+                checksum = checksum ^ tmp ^ CRC[(byte >> 4) & 0xf]
+            return checksum
+
+        for fit_path in glob('data/**/*.[fF][iI][tT]', recursive=True):
+            data = read_fit(fit_path)
+            for length in (len(data) - 2, 12, 5000, 40000):
+                if length <= len(data):
+                    self.assertEqual(Checksum.crc(memoryview(data)[:length]), nibble_crc(data[:length]), fit_path)
+            self.assertEqual(Checksum.crc(bytearray(data)), nibble_crc(data), fit_path)
+        self.assertEqual(Checksum.crc(read_fit(join(self.test_dir, 'source/personal/2018-08-27-rec.fit'))), 0)
+
+    def test_pickle_records(self):
+        # records are parsed in separate processes when importing (see MultiProcFitReader)
+        data = read_fit(join(self.test_dir, 'source/personal/2018-08-27-rec.fit'))
+        types, messages, records = filtered_records(data)
+        records = [record.as_dict(no_bad_values, fix_degrees) for _, _, record in records]
+        copies = loads(dumps(records))
+        self.assertEqual(len(copies), len(records))
+        for copy, record in zip(copies, records):
+            self.assertEqual(copy.data, record.data)
+            self.assertEqual(copy.attr, record.attr)
+            self.assertEqual(repr(copy.identity), repr(record.identity))
+            if record.name == 'record':
+                self.assertEqual(copy.value.timestamp, record.value.timestamp)
+        self.assertEqual(len(set(id(copy.identity) for copy in copies)),
+                         len(set(id(record.identity) for record in records)))
+
     def standard_csv(self, fit_path, csv_path, filters=None):
         if filters is None: filters = []
         if EXC_HDR_CHK not in filters: filters = [EXC_HDR_CHK] + filters
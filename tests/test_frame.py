@@ -0,0 +1,204 @@
+
+import datetime as dt
+from collections import defaultdict
+from random import Random
+from tempfile import NamedTemporaryFile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from ch2.commands.args import bootstrap_file, m, V, mm, DEV
+from ch2.config import default
+from ch2.data import frame
+from ch2.data.frame import present, linear_resample_time, statistic_quartiles, _collect_statistics, \
+    MIN_PERIODS, KEEP, _activity_rows, _journal_rows, _columns, _frame, _labels, SOURCE_ID
+from ch2.lib.date import time_to_local_time, HMS
+from ch2.squeal import StatisticJournal, StatisticName, StatisticMeasure, StatisticJournalFloat, Source, \
+    Interval, StatisticArray, StatisticJournalInteger
+from ch2.squeal.tables.source import SourceType
+from ch2.squeal.utils import add
+from ch2.stoats.load import StatisticJournalLoader
+from ch2.stoats.names import LATITUDE, LONGITUDE, DISTANCE, ELEVATION, SPEED, HEART_RATE, HR_IMPULSE_10, \
+    GRADE, CADENCE, POWER_ESTIMATE, TIMESPAN_ID, DISTANCE_KM, SPEED_KMH, MED_SPEED_KMH, MED_WINDOW, \
+    MED_CADENCE, HEART_RATE_BPM, MED_HEART_RATE_BPM, MED_HR_IMPULSE_10, MED_POWER_ESTIMATE_W, ELEVATION_M, \
+    GRADE_PC, CLIMB_MS, TIME, LOCAL_TIME, INDEX
+
+
+# the original implementations, used as a reference
+
+def old_std_activity_statistics(stats, with_timespan):
+    stats[DISTANCE_KM] = stats[DISTANCE]/1000
+    stats[SPEED_KMH] = stats[SPEED] * 3.6
+    stats[MED_SPEED_KMH] = stats[SPEED].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median() * 3.6
+    if present(stats, CADENCE):
+        stats[MED_CADENCE] = stats[CADENCE].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
+    if present(stats, HEART_RATE):
+        stats.rename(columns={HEART_RATE: HEART_RATE_BPM}, inplace=True)
+        stats[MED_HEART_RATE_BPM] = stats[HEART_RATE_BPM].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
+        stats[MED_HR_IMPULSE_10] = stats[HR_IMPULSE_10].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median()
+    if present(stats, POWER_ESTIMATE):
+        stats[MED_POWER_ESTIMATE_W] = \
+            stats[POWER_ESTIMATE].rolling(MED_WINDOW, min_periods=MIN_PERIODS).median().clip(lower=0)
+    if present(stats, ELEVATION):
+        stats.rename(columns={ELEVATION: ELEVATION_M}, inplace=True)
+        stats.rename(columns={GRADE: GRADE_PC}, inplace=True)
+
+    if with_timespan:
+        timespans = stats[TIMESPAN_ID].dropna().unique()
+    if present(stats, HR_IMPULSE_10):
+        stats[KEEP] = pd.notna(stats[HR_IMPULSE_10])
+        stats.interpolate(method='time', inplace=True)
+        stats = stats.loc[stats[KEEP] == True].drop(columns=[KEEP])
+    else:
+        stats = linear_resample_time(stats, dt=10, add_time=False)
+    if with_timespan:
+        stats = stats.loc[stats[TIMESPAN_ID].isin(timespans)]
+
+    if present(stats, ELEVATION_M):
+        stats[CLIMB_MS] = stats[ELEVATION_M].diff() * 0.1
+    stats[TIME] = pd.to_datetime(stats.index)
+    stats[LOCAL_TIME] = stats[TIME].apply(lambda x: time_to_local_time(x.to_pydatetime(), HMS))
+    return stats
+
+
+def old_statistic_quartiles(s, *statistics):
+    statistic_names, statistic_ids = _collect_statistics(s, statistics, None, None)
+    q = s.query(StatisticMeasure). \
+        join(StatisticJournal, StatisticMeasure.statistic_journal_id == StatisticJournal.id). \
+        join(StatisticName, StatisticJournal.statistic_name_id == StatisticName.id). \
+        join(Source, StatisticJournal.source_id == Source.id). \
+        filter(StatisticName.id.in_(statistic_ids)). \
+        filter(StatisticMeasure.quartile != None)
+    raw_data = defaultdict(lambda: defaultdict(lambda: [0] * 5))
+    for measure in q.all():
+        raw_data[measure.source.start][measure.statistic_journal.statistic_name.name][measure.quartile] = \
+            measure.statistic_journal.value
+    data, times = defaultdict(list), []
+    for time in sorted(raw_data.keys()):
+        times.append(time)
+        sub_data = raw_data[time]
+        for statistic in statistic_names:
+            if statistic in sub_data:
+                data[statistic].append(sub_data[statistic])
+            else:
+                data[statistic].append(None)
+    return pd.DataFrame(data, index=times)
+
+
+def activity(seed, n=500, impulse=True, gaps=True):
+    # the columns read by std_activity_statistics, at irregular times, with some values missing
+    random = Random(seed)
+    times = pd.to_datetime(np.cumsum([random.choice([1, 1, 1, 2, 5]) for _ in range(n)]) + 1e9, unit='s', utc=True)
+    columns = {LATITUDE: [random.uniform(-1, 1) for _ in range(n)],
+               LONGITUDE: [random.uniform(-1, 1) for _ in range(n)],
+               DISTANCE: np.cumsum([random.uniform(0, 10) for _ in range(n)]),
+               ELEVATION: np.cumsum([random.gauss(0, 1) for _ in range(n)]),
+               GRADE: [random.gauss(0, 5) for _ in range(n)],
+               SPEED: [random.uniform(0, 15) for _ in range(n)],
+               CADENCE: [random.uniform(60, 100) for _ in range(n)],
+               POWER_ESTIMATE: [random.gauss(50, 100) for _ in range(n)]}
+    if impulse:
+        columns[HEART_RATE] = [random.uniform(60, 180) for _ in range(n)]
+        columns[HR_IMPULSE_10] = [random.uniform(0, 10) if random.random() < 0.5 else np.nan for _ in range(n)]
+    stats = pd.DataFrame(columns, index=times)
+    if gaps:
+        for name in columns:
+            stats.loc[[random.random() < 0.1 for _ in range(n)], name] = np.nan
+    stats.index.name = INDEX
+    stats[TIMESPAN_ID] = [1.0 if i < n // 3 else np.nan if i < n // 2 else 2.0 for i in range(n)]
+    return stats
+
+
+class TestFrame(TestCase):
+
+    def test_std_activity_statistics(self):
+        for seed, impulse in ((1, True), (2, True), (3, False)):
+            stats = activity(seed, impulse=impulse)
+            with patch.object(frame, 'activity_statistics', lambda *args, **kargs: stats.copy()):
+                new = frame._std_activity_statistics(None, None, True)
+            old = old_std_activity_statistics(stats.copy(), True)
+            self.assertTrue(len(new))
+            pd.testing.assert_frame_equal(new, old, check_like=True)
+
+    def test_statistic_quartiles(self):
+        random = Random(42)
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                source = Source(type=SourceType.SOURCE)
+                s.add(source)
+                # B is missing in the second month; the median of A is missing in the third
+                journals = {}
+                for month in range(1, 5):
+                    for name in ('A', 'B', 'C') if month != 2 else ('A', 'C'):
+                        for quartile in range(5):
+                            if name != 'A' or month != 3 or quartile != 2:
+                                journals[(month, name, quartile)] = \
+                                    StatisticJournalFloat.add(s, name, None, None, 'test', None, source,
+                                                              random.random(),
+                                                              dt.datetime(2000, month, 1 + quartile,
+                                                                          tzinfo=dt.timezone.utc))
+                duplicate = StatisticJournalFloat.add(s, 'C', None, None, 'test', None, source, 42.0,
+                                                      dt.datetime(2000, 4, 10, tzinfo=dt.timezone.utc))
+                s.commit()
+                # intervals are added after the data (adding data deletes overlapping intervals)
+                intervals = {}
+                for month in range(1, 5):
+                    intervals[month] = Interval(schedule='m', owner='test', start=dt.date(2000, month, 1),
+                                                finish=dt.date(2000, month + 1, 1))
+                    s.add(intervals[month])
+                s.commit()
+                for (month, name, quartile), journal in journals.items():
+                    s.add(StatisticMeasure(statistic_journal=journal, source=intervals[month], rank=1,
+                                           percentile=100, quartile=quartile))
+                s.commit()
+                # a duplicate quartile, from a more recent journal, replaces the first
+                s.add(StatisticMeasure(statistic_journal=duplicate, source=intervals[4], rank=1, percentile=100,
+                                       quartile=0))
+                s.commit()
+                new = statistic_quartiles(s, 'A', 'B', 'C')
+                old = old_statistic_quartiles(s, 'A', 'B', 'C')
+                self.assertEqual(list(new.columns), ['A', 'B', 'C'])
+                self.assertEqual(list(new.index), list(old.index))
+                self.assertEqual(new.to_dict(), old[sorted(old.columns)].to_dict())
+                self.assertIsNone(new['B'].iloc[1])
+                self.assertEqual(new['A'].iloc[2][2], 0)
+                self.assertEqual(new['C'].iloc[3][0], 42.0)
+
+    def test_arrays(self):
+        # reading arrays gives the same results as reading the journal
+        random = Random(42)
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                sources = [add(s, Source()) for _ in range(2)]
+                s.commit()
+                for source, arrays in zip(sources, (True, False)):
+                    loader = StatisticJournalLoader(s, 'test', add_serial=False, arrays=arrays)
+                    for i in range(20):
+                        if random.random() > 0.2:
+                            loader.add('A', None, None, None, source, random.random(), 100.0 + i,
+                                       StatisticJournalFloat)
+                        loader.add('B', None, None, None, source, i, 100.5 + i, StatisticJournalInteger)
+                    loader.load()
+                # C is only in the journal
+                loader = StatisticJournalLoader(s, 'test', add_serial=False)
+                for i in range(0, 20, 2):
+                    loader.add('C', None, None, None, sources[0], random.random(), 100.0 + i, StatisticJournalFloat)
+                loader.load()
+                self.assertEqual(s.query(StatisticArray).count(), 2)
+                names = s.query(StatisticName).filter(StatisticName.owner == 'test').order_by(StatisticName.name).all()
+                labels = _labels(names)
+                source_ids = [source.id for source in sources]
+                for kargs in (dict(), dict(start=105.0, finish=115.0)):
+                    for ids in ([source_ids[0]], source_ids):
+                        # as activities_statistics, with a frame per source
+                        new = dict(iter(_activity_rows(s, names, ids, **kargs).groupby(SOURCE_ID)))
+                        old = dict(iter(_journal_rows(s, names, source_ids=ids, **kargs).groupby(SOURCE_ID)))
+                        self.assertEqual(sorted(new), ids)
+                        for id in ids:
+                            pd.testing.assert_frame_equal(_frame(_columns(names, labels, new[id]), labels),
+                                                          _frame(_columns(names, labels, old[id]), labels))
@@ -0,0 +1,48 @@
+
+from os import utime
+from os.path import join
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from time import time
+from unittest import TestCase
+
+from ch2.commands.args import bootstrap_file, m, V
+from ch2.lib.io import filter_modified_files, update_scan, md5_hash
+from ch2.squeal.tables.fit import FileScan
+
+
+class TestIO(TestCase):
+
+    def write(self, path, text, mtime):
+        with open(path, 'w') as out:
+            out.write(text)
+        utime(path, (mtime, mtime))
+
+    def test_filter_modified(self):
+        with NamedTemporaryFile() as f, TemporaryDirectory() as d:
+            args, db = bootstrap_file(f, m(V), '5')
+            a, b, c = join(d, 'a'), join(d, 'b'), join(d, 'c')
+            past = time() - 100
+            self.write(a, 'a', past)
+            self.write(b, 'b', past)
+            with db.session_context() as s:
+                self.assertEqual(filter_modified_files(s, [a, b], 'owner'), [a, b])
+                for path in (a, b):
+                    update_scan(s, path, 'owner')
+                s.commit()
+                self.assertEqual(filter_modified_files(s, [a, b], 'owner'), [])
+                self.assertEqual(filter_modified_files(s, [a, b], 'owner', force=True), [a, b])
+                # unchanged metadata means the stored hash is trusted
+                scan = s.query(FileScan).filter(FileScan.path == a).one()
+                self.assertEqual(scan.md5_hash, md5_hash(a))
+                self.assertEqual(scan.size, 1)
+                scan.md5_hash = 'stale'
+                s.commit()
+                self.assertEqual(filter_modified_files(s, [a], 'owner'), [])
+                self.assertEqual(s.query(FileScan).filter(FileScan.path == a).one().md5_hash, 'stale')
+                # but modified files are re-hashed
+                self.write(a, 'aa', time())
+                self.assertEqual(filter_modified_files(s, [a, b], 'owner'), [a])
+                self.assertEqual(s.query(FileScan).filter(FileScan.path == a).one().md5_hash, md5_hash(a))
+                # and copies are ignored
+                self.write(c, 'b', past)
+                self.assertEqual(filter_modified_files(s, [c], 'owner'), [])
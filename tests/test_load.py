@@ -0,0 +1,206 @@
+
+from concurrent.futures import ProcessPoolExecutor
+from sqlite3 import connect
+from tempfile import NamedTemporaryFile
+from threading import Timer
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.sql.functions import count
+
+from ch2.commands.args import bootstrap_file, m, V, mm, DEV
+from ch2.config import default
+from ch2.squeal import Source, Dummy
+from ch2.squeal.tables.statistic import StatisticJournalFloat, StatisticJournal, StatisticName, \
+    StatisticJournalType, NAME_CACHE, StatisticArray, StatisticJournalInteger, StatisticJournalText
+from ch2.squeal.utils import add
+from ch2.stoats.load import StatisticJournalLoader, Writer
+from ch2.stoats.names import CUMULATIVE_STEPS
+from ch2.stoats.read.monitor import MonitorLoader
+
+DB = None  # inherited by the worker processes
+
+
+def load(source_id, name, writer):
+    with DB.session_context() as s:
+        loader = StatisticJournalLoader(s, 'owner', writer=writer)
+        for i in range(100):
+            loader.add(name, None, None, None, source_id, float(i), float(i), StatisticJournalFloat)
+        loader.load()
+
+
+class TestLoad(TestCase):
+
+    def test_writer(self):
+        global DB
+        with NamedTemporaryFile() as f:
+            args, DB = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with DB.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                source_id = source.id
+            load(source_id, 'direct', None)
+            with Writer(DB) as writer:
+                load(source_id, 'local', writer.client())
+                with ProcessPoolExecutor(max_workers=2) as executor:
+                    for future in [executor.submit(load, source_id, f'remote {i}', writer.client())
+                                   for i in range(4)]:
+                        future.result()
+            with DB.session_context() as s:
+                for name in ['direct', 'local'] + [f'remote {i}' for i in range(4)]:
+                    values = [journal.value for journal in
+                              s.query(StatisticJournalFloat).join(StatisticName).
+                                  filter(StatisticName.name == name).
+                                  order_by(StatisticJournal.time).all()]
+                    self.assertEqual(values, [float(i) for i in range(100)], name)
+                # no dummy left behind
+                dummy_source, dummy_name = Dummy.singletons(s)
+                self.assertEqual(s.query(count(StatisticJournal.id)).
+                                 filter(StatisticJournal.statistic_name == dummy_name).scalar(), 0)
+
+    def test_deletes(self):
+        # overlapping steps are replaced by the writer (not deleted by the loader)
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                with Writer(db) as writer:
+                    for values in (range(10), range(5, 8)):
+                        loader = MonitorLoader(s, 'owner', add_serial=False, writer=writer.client())
+                        for i in values:
+                            loader.add(CUMULATIVE_STEPS, None, None, None, source, i * 10, float(i),
+                                       StatisticJournalFloat)
+                        loader.load()
+                self.assertEqual([journal.time.timestamp() for journal in
+                                  s.query(StatisticJournalFloat).join(StatisticName).
+                                      filter(StatisticName.owner == 'owner').
+                                      order_by(StatisticJournal.time).all()],
+                                 [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
+
+    def test_names(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                definitions = [(name, StatisticJournalType.FLOAT, 'm', None, 'owner', None)
+                               for name in ('a', 'b', 'c')]
+                ids = StatisticName.add_all_if_missing(s, definitions)
+                self.assertEqual(len(set(ids)), 3)
+                self.assertEqual(StatisticName.add_all_if_missing(s, definitions[::-1]), ids[::-1])
+                self.assertEqual(StatisticName.from_name(s, 'b', 'owner').id, ids[1])
+                self.assertEqual(StatisticName.add_if_missing(s, 'c', StatisticJournalType.FLOAT, 'm', None,
+                                                              'owner', None).id, ids[2])
+                # changes are saved
+                StatisticName.add_if_missing(s, 'c', StatisticJournalType.FLOAT, 'km', None, 'owner', None)
+                self.assertEqual(s.query(StatisticName).filter(StatisticName.name == 'c').one().units, 'km')
+                # deletion clears the cache
+                s.query(StatisticName).filter(StatisticName.name == 'a').delete()
+                s.commit()
+                self.assertFalse(any(key[0] == 'a' for cache in NAME_CACHE.values() for key in cache))
+                self.assertNotEqual(StatisticName.add_all_if_missing(s, definitions[:1]), ids[:1])
+
+    def test_frame(self):
+        # add_frame gives the same statistics as add() for each value
+        df = pd.DataFrame({'a': [1.0, np.nan, 3.0, np.nan, 5.0], 'b': [np.nan, 2.0, np.nan, np.nan, 6.0]},
+                          index=pd.to_datetime([100, 101, 102, 103, 104], unit='s', utc=True))
+        columns = [('a', 'm', None, 'x', StatisticJournalFloat),
+                   ('b', None, None, 'x', StatisticJournalFloat),
+                   ('b', None, None, 'y', StatisticJournalFloat)]
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                for owner in ('rows', 'frame', 'rows-after', 'frame-after'):
+                    loader = StatisticJournalLoader(s, owner)
+                    if owner.endswith('after'):
+                        # the same value at the same time is skipped (add_frame falls back to add())
+                        loader.add('a', 'm', None, 'x', source, 1.0, df.index[0], StatisticJournalFloat)
+                    if owner.startswith('frame'):
+                        loader.add_frame(df, source, columns)
+                    else:
+                        for time, row in df.iterrows():
+                            for name, units, summary, constraint, cls in columns:
+                                if not pd.isnull(row[name]):
+                                    loader.add(name, units, summary, constraint, source, row[name], time, cls)
+                    self.assertEqual(len(loader), 7)
+                    loader.load()
+
+                def journals(owner):
+                    return sorted((journal.statistic_name.name, journal.statistic_name.units,
+                                   journal.statistic_name.constraint, journal.time.timestamp(), journal.serial,
+                                   journal.value)
+                                  for journal in s.query(StatisticJournalFloat).join(StatisticName).
+                                  filter(StatisticName.owner == owner).all())
+
+                self.assertEqual(journals('frame'), journals('rows'))
+                self.assertEqual(journals('frame-after'), journals('rows-after'))
+                # a different value at an existing time is an error
+                loader = StatisticJournalLoader(s, 'error')
+                loader.add('a', 'm', None, 'x', source, 0.0, df.index[0], StatisticJournalFloat)
+                with self.assertRaisesRegex(Exception, 'Duplicate'):
+                    loader.add_frame(df, source, columns)
+
+    def test_locked(self):
+        # another process writing delays loading, rather than failing with 'database is locked'.  sqlite
+        # usually waits (see busy_timeout), but fails at once when waiting could deadlock, so that is
+        # simulated here by not waiting.
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                loader = StatisticJournalLoader(s, 'owner', add_serial=False)
+                loader.add('a', None, None, None, source, 1.0, 100.0, StatisticJournalFloat)
+                loader.load()  # creates the name, so only the load itself is locked below
+                event.listen(db.engine, 'connect', lambda con, _: con.execute('pragma busy_timeout=0;'))
+                other = connect(db.path, check_same_thread=False)
+                other.execute('begin immediate')
+                Timer(1, other.commit).start()
+                loader = StatisticJournalLoader(s, 'owner', add_serial=False)
+                loader.add('a', None, None, None, source, 2.0, 200.0, StatisticJournalFloat)
+                loader.load()
+                other.close()
+                self.assertEqual(s.query(count(StatisticJournal.id)).join(StatisticName).
+                                 filter(StatisticName.owner == 'owner').scalar(), 2)
+
+    def test_arrays(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                with Writer(db) as writer:
+                    loader = StatisticJournalLoader(s, 'owner', add_serial=False, arrays=True,
+                                                    writer=writer.client())
+                    for i in reversed(range(10)):
+                        loader.add('a', None, None, None, source, float(i), 100.0 + i, StatisticJournalFloat)
+                        loader.add('b', None, None, None, source, i, 100.0 + i, StatisticJournalInteger)
+                        loader.add('c', None, None, None, source, str(i), 100.0 + i, StatisticJournalText)
+                    loader.load()
+
+                def arrays():
+                    return dict((array.statistic_name.name, array) for array in s.query(StatisticArray).all())
+
+                # no array for text
+                self.assertEqual(sorted(arrays()), ['a', 'b'])
+                array = arrays()['a']
+                self.assertEqual(array.n, 10)
+                self.assertEqual(list(StatisticArray.unpack(array.times)), [100.0 + i for i in range(10)])
+                self.assertEqual(list(StatisticArray.unpack(array.values)), [float(i) for i in range(10)])
+                self.assertEqual(StatisticArray.unpack(arrays()['b'].values).dtype, np.int64)
+                # the journal is still written
+                self.assertEqual(s.query(count(StatisticJournalFloat.id)).join(StatisticName).
+                                 filter(StatisticName.name == 'a').scalar(), 10)
+                # more values (even with arrays=True) invalidate the array
+                loader = StatisticJournalLoader(s, 'owner', add_serial=False, arrays=True)
+                loader.add('a', None, None, None, source, 10.0, 110.0, StatisticJournalFloat)
+                loader.load()
+                self.assertEqual(sorted(arrays()), ['b'])
@@ -0,0 +1,279 @@
+
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import register_at_fork
+from os.path import join, exists
+from pickle import dumps, loads
+from sqlite3 import connect
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import enumerate as enumerate_threads
+from time import time, sleep
+from unittest import TestCase
+
+from ch2.commands.args import bootstrap_file, m, V, mm, DEV
+from ch2.config import default
+from ch2.squeal import Source, Pipeline, PipelineCost, PipelineProfile, ProfileType, StatisticName, \
+    StatisticJournalType, StatisticJournal, StatisticJournalFloat
+from ch2.squeal.utils import add
+from ch2.squeal.tables.pipeline import PipelineType
+from ch2.squeal.tables.statistic import _name_cache, _name_key
+from ch2.stoats.calculate.activity import ActivityCalculator
+from ch2.stoats.calculate.impulse import ImpulseCalculator
+from ch2.stoats.calculate.power import BasicPowerCalculator
+from ch2.stoats.calculate.summary import SummaryCalculator
+from ch2.stoats.load import StatisticJournalLoader
+from ch2.stoats.pipeline import _dependencies, _run_worker, _run_parallel, _share_cpus, MultiProcPipeline
+from ch2.stoats.profile import Profiler, RUN_PIPELINE
+
+
+class Fake:
+
+    def __init__(self, db, inputs, outputs, id=None):
+        raise Exception('Dependencies should not construct pipelines')
+
+    @classmethod
+    def inputs(cls, inputs, outputs):
+        return None if inputs is None else set(inputs)
+
+    @classmethod
+    def outputs(cls, inputs, outputs):
+        return set(outputs)
+
+
+class Counter:
+
+    def __init__(self, db):
+        self._db = db
+
+    def run(self):
+        with self._db.session_context() as s:
+            return [self._run_one(s) for _ in range(3)]
+
+    def _run_one(self, s):
+        return s.query(Source).count()
+
+
+LOADS, VALUES = 20, 100
+
+
+class Loading:
+
+    # once both have started, write statistics in many small loads, so that they contend for the database
+
+    def __init__(self, db, owner, other, dir, id=None):
+        self._db, self._owner, self._other, self._dir = db, owner, other, dir
+
+    @classmethod
+    def inputs(cls, owner, other, dir, **kargs):
+        return set()
+
+    @classmethod
+    def outputs(cls, owner, other, dir, **kargs):
+        return {owner}
+
+    def run(self):
+        open(join(self._dir, self._owner), 'w').close()
+        start = time()
+        while not exists(join(self._dir, self._other)):
+            if time() - start > 60:
+                raise Exception(f'{self._other} did not start')
+            sleep(0.01)
+        with self._db.session_context() as s:
+            source = add(s, Source())
+            s.commit()
+            for i in range(LOADS):
+                loader = StatisticJournalLoader(s, self._owner, add_serial=False)
+                for j in range(VALUES):
+                    loader.add('value', None, None, None, source, float(j),
+                               dt.datetime.fromtimestamp(1 + i * VALUES + j, tz=dt.timezone.utc),
+                               StatisticJournalFloat)
+                loader.load()
+
+
+FORKS = []  # thread names in the parent at each fork
+
+
+register_at_fork(before=lambda: FORKS.append([thread.name for thread in enumerate_threads()]))
+
+
+class Spawning(MultiProcPipeline):
+
+    # each item is a value written by workers (through the parent's writer)
+
+    def __init__(self, *args, source=None, start=0, finish=3, **kargs):
+        self.source, self.start, self.finish = source, start, finish
+        super().__init__(*args, **kargs)
+
+    def _missing(self, s):
+        return list(range(self.start, self.finish + 1))
+
+    def _delete(self, s):
+        pass
+
+    def _run_one(self, s, missed):
+        loader = StatisticJournalLoader(s, 'spawning', add_serial=False, writer=self.writer)
+        loader.add('value', None, None, None, s.query(Source).get(self.source), float(missed), float(missed + 1),
+                   StatisticJournalFloat)
+        loader.load()
+
+    def _worker_kargs(self, missing, start, finish):
+        return dict(start=missing[start], finish=missing[finish])
+
+
+NAME = ('name', StatisticJournalType.FLOAT, None, None, 'owner', None)
+
+
+class NameReader:
+
+    def __init__(self, db, *args, **kargs):
+        self._db = db
+
+    def run(self):
+        with self._db.session_context() as s:
+            return StatisticName.add_all_if_missing(s, [NAME])[0]
+
+
+class TestPipeline(TestCase):
+
+    def dependencies(self, *ports):
+        return _dependencies([(Fake, ports, {}, None) for ports in ports])
+
+    def test_dependencies(self):
+        self.assertEqual(self.dependencies((['reader'], ['a']),
+                                           (['reader'], ['b']),
+                                           (['a'], ['c']),
+                                           (['reader'], ['c']),
+                                           (None, ['summary']),
+                                           (['reader'], ['d'])),
+                         [set(),
+                          set(),      # independent of a
+                          {0},        # reads a
+                          {2},        # writes c
+                          {0, 1, 2, 3},  # unknown inputs
+                          {4}])       # after unknown inputs
+
+    def test_anti_dependency(self):
+        # a pipeline that writes what an earlier pipeline reads must wait for it
+        self.assertEqual(self.dependencies((['a'], ['b']), (['c'], ['a'])), [set(), {0}])
+
+    def test_ports(self):
+        # ports come from the pipeline arguments
+        self.assertEqual(ImpulseCalculator.inputs(owner_in='SegmentReader'), {'SegmentReader'})
+        self.assertEqual(ImpulseCalculator.outputs(owner_in='SegmentReader'), {'ImpulseCalculator'})
+        self.assertEqual(ActivityCalculator.outputs(owner_out='Other'), {'Other'})
+        self.assertEqual(BasicPowerCalculator.outputs(), {'PowerCalculator'})
+        self.assertIsNone(SummaryCalculator.inputs(owner_in='[unused]'))
+
+    def test_share_cpus(self):
+        # pipelines that run at the same time share the cpus (only multi-process pipelines use them)
+        specs = _share_cpus([(Spawning, (), {'n_cpu': 8}, 1), (Spawning, (), {'n_cpu': 2}, 2),
+                             (Fake, ([], []), {}, 3)], 3)
+        self.assertEqual([kargs for cls, args, kargs, id in specs], [{'n_cpu': 2}, {'n_cpu': 1}, {}])
+
+    def test_concurrent(self):
+        # independent pipelines run at the same time in separate processes, each writing to the database
+        with NamedTemporaryFile() as f, TemporaryDirectory() as dir:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            specs = [(Loading, (owner, other, dir), {}, None) for owner, other in (('a', 'b'), ('b', 'a'))]
+            self.assertEqual(_dependencies(specs), [set(), set()])
+            _run_parallel(db, specs, 2)
+            with db.session_context() as s:
+                for owner in ('a', 'b'):
+                    self.assertEqual(s.query(StatisticJournal).join(StatisticName).
+                                     filter(StatisticName.owner == owner).count(), LOADS * VALUES)
+
+    def test_pickle_database(self):
+        # workers receive the database by pickling and make their own connection
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                id = source.id
+            copy = loads(dumps(db))
+            self.assertEqual(copy.path, db.path)
+            self.assertIsNot(copy.engine, db.engine)
+            with copy.session_context() as s:
+                self.assertEqual(s.query(Source).one().id, id)
+
+    def test_cost(self):
+        # measured costs are smoothed across runs
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                pipeline = add(s, Pipeline(cls=Fake, type=PipelineType.STATISTIC))
+                s.commit()
+                cost = PipelineCost.update(s, pipeline.id, 1.0)
+                self.assertEqual((cost.startup, cost.calc, cost.write, cost.n), (1.0, None, None, 0))
+                cost = PipelineCost.update(s, pipeline.id, 2.0, calc=10.0, write=1.0)
+                self.assertAlmostEqual(cost.startup, 1.3)
+                self.assertEqual((cost.calc, cost.write, cost.n), (10.0, 1.0, 1))
+                cost = PipelineCost.update(s, pipeline.id, 1.3, calc=20.0, write=2.0)
+                self.assertAlmostEqual(cost.startup, 1.3)
+                self.assertAlmostEqual(cost.calc, 13.0)
+                self.assertAlmostEqual(cost.write, 1.3)
+                self.assertEqual(cost.n, 2)
+
+    def test_profiler(self):
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with Profiler(db) as profiler:
+                self.assertEqual(profiler.instrument(Counter(db)).run(), [0, 0, 0])
+            with db.session_context() as s:
+                calls = {(entry.scope, entry.name): (entry.calls, entry.rows, entry.statements)
+                         for entry in s.query(PipelineProfile).
+                             filter(PipelineProfile.run == profiler.run,
+                                    PipelineProfile.type == ProfileType.CALL).all()}
+                self.assertEqual(calls[('Counter', 'run')], (1, 3, 3))
+                self.assertEqual(calls[('Counter', '_run_one')], (3, 0, 3))
+                self.assertEqual(calls[('', RUN_PIPELINE)][0], 1)
+                sql = s.query(PipelineProfile).filter(PipelineProfile.run == profiler.run,
+                                                      PipelineProfile.type == ProfileType.SQL).one()
+                self.assertEqual((sql.scope, sql.calls), ('Counter', 3))
+                self.assertIn('FROM source', sql.name)
+
+    def test_spawn(self):
+        # workers are forked before the writer's thread is started
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            bootstrap_file(f, m(V), '5', mm(DEV), configurator=default)
+            with db.session_context() as s:
+                source = add(s, Source())
+                s.commit()
+                kargs = dict(source=source.id, n_cpu=2, overhead=0)
+                pipeline = add(s, Pipeline(cls=Spawning, type=PipelineType.STATISTIC, kargs=kargs))
+                s.commit()
+                id = pipeline.id
+            FORKS.clear()
+            Spawning(db, id=id, **kargs).run()
+            self.assertTrue(FORKS)
+            self.assertFalse([names for names in FORKS if 'Writer' in names])
+            with db.session_context() as s:
+                self.assertEqual(s.query(StatisticJournal).join(StatisticName).
+                                 filter(StatisticName.owner == 'spawning').count(), 4)
+            with self.assertRaisesRegex(Exception, 'no pipeline id'):
+                Spawning(db, **kargs).run()
+
+    def test_worker_names(self):
+        # workers do not use names cached by the parent, which may have been changed by other processes
+        with NamedTemporaryFile() as f:
+            args, db = bootstrap_file(f, m(V), '5')
+            with db.session_context() as s:
+                pipeline = add(s, Pipeline(cls=NameReader, type=PipelineType.STATISTIC))
+                s.commit()
+                id, old = pipeline.id, StatisticName.add_all_if_missing(s, [NAME])[0]
+            with connect(db.path) as connection:  # not via the ORM, so the cache is not cleared
+                connection.execute('delete from statistic_name where id = ?', (old,))
+                connection.execute('insert into statistic_name (id, name, owner, "constraint", '
+                                   'statistic_journal_type) values (?, ?, ?, ?, ?)',
+                                   (old + 1, NAME[0], NAME[4], str(NAME[5]), NAME[1]))
+            db.engine.dispose()
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('fork')) as executor:
+                self.assertEqual(executor.submit(_run_worker, db, id, None).result(), old + 1)
+            with db.session_context() as s:
+                # stale ids in the cache are detected here too
+                self.assertEqual(StatisticName.from_name(s, NAME[0], NAME[4]).id, old + 1)
+                _name_cache(s)[_name_key(NAME[0], NAME[4], NAME[5])] = (old, *NAME[1:4])
+                self.assertEqual(StatisticName.add_all_if_missing(s, [NAME])[0], old + 1)